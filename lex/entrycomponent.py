@@ -126,6 +126,12 @@ class EntryComponent(object):
         try:
             return self._ancestors
         except AttributeError:
+            # Use the entry's skeleton, if available (see
+            #  lex.oed.entryskeleton)
+            skeleton = self.skeleton()
+            if skeleton is not None:
+                self._ancestors = skeleton.ancestors(self.node)
+                return self._ancestors
             self._ancestors = []
             for node in self.ancestor_nodes():
                 node_id = (node.get('eid') or node.get('e:id') or
@@ -133,6 +139,26 @@ class EntryComponent(object):
                 self._ancestors.append(Ancestor(node.tag, node_id))
             return self._ancestors
 
+    def skeleton(self):
+        """
+        Return the skeleton (flat index of the entry's structure) of
+        the entry that this component belongs to, or None if no
+        skeleton is available.
+        """
+        try:
+            owner = self._skeleton_owner
+        except AttributeError:
+            return None
+        else:
+            return owner.skeleton()
+
+    def set_skeleton_owner(self, owner):
+        """
+        Set the entry whose skeleton will be used by this component.
+        (The skeleton itself is only built if and when it's needed.)
+        """
+        self._skeleton_owner = owner
+
     def has_ancestor(self, value):
         """
         Returns True if the current node has an ancestor node whose tag name
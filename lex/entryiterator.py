@@ -7,15 +7,27 @@ EntryIterator -- Dictionary entry Iterator for OED and ODE/NOAD
 import re
 import os
 import random
+import shutil
+from multiprocessing import Pool
 
 from lex import lexconfig
 from lex.oed.entry import Entry as OedEntry
+from lex.oed.liteentry import LiteEntry
 from lex.odo.entry import Entry as OdoEntry
 
 ENTRY_PATTERNS = {'oed': re.compile('^<Entry[ >]'),
                   'odo': re.compile('^<e[ >]')}
+# Byte-string equivalents, used when counting entries in a shard
+#  without decoding every line
+ENTRY_PATTERNS_BYTES = {'oed': re.compile(br'^\s*<Entry[ >]'),
+                        'odo': re.compile(br'^\s*<e[ >]')}
 DEFAULT_OUTPUT_ROOT = 'Dictionary'
 OUTPUT_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+# Maximum size (in bytes) of the chunk of a file handled by a single
+#  worker process in EntryIterator.parallel_map()
+DEFAULT_SHARD_SIZE = 32 * 1024 * 1024
+# File extension for entry stores (see lex.entrystore)
+STORE_EXTENSION = '.store'
 
 
 class EntryIterator(object):
@@ -87,6 +99,12 @@ class EntryIterator(object):
             supplied. Specifies the tag name of the root node in the
             output files. Defaults to 'Dictionary'.
 
+     -- lite: If True, yield lex.oed.liteentry.LiteEntry objects instead
+            of full entries. These only parse the entry's headword,
+            characteristics, parts of speech, and dates; the full entry
+            is parsed only if something else is accessed. Useful for
+            fast passes which only need this basic information. (OED only)
+
     Keyword arguments used for sampling:
 
      -- sample: An int indicating how frequently the stream of
@@ -104,6 +122,33 @@ class EntryIterator(object):
     same sample set is yielded each time it's run), whereas
     'random_sample' gives probabilistic sampling (a different sample set
     is yielded each time it's run).
+
+    Parallel mode:
+
+    EntryIterator.parallel_map() is an opt-in alternative to iterate()
+    which spreads the parsing across a pool of worker processes. Each
+    file is split into shards (byte ranges), and a function supplied by
+    the caller is run on each entry inside the worker; the function's
+    return values are yielded in the same order as the entries would
+    have been yielded by iterate().
+    >>> def first_date(entry):
+            return (entry.id, entry.date().start)
+    >>> for entry_id, year in iterator.parallel_map(first_date, processes=4):
+            print(entry_id, year)
+
+    The function must be picklable (i.e. a module-level function), since
+    it gets shipped to the worker processes. Entry objects themselves are
+    never passed back to the parent process.
+
+    Entry stores:
+
+     -- source_format: Either 'xml' (default) or 'store'. If 'store', the
+            iterator reads entry stores compiled by
+            lex.entrystore.EntryStoreCompiler (files with a .store
+            extension) instead of the original XML text files. This
+            avoids rescanning the text files for entry lines on every
+            pass. Output files (if output_dir is supplied) are still
+            written as XML.
     """
 
     def __init__(self, **kwargs):
@@ -111,6 +156,11 @@ class EntryIterator(object):
         self.fix_ligatures = kwargs.get('fixLigatures') or kwargs.get('fix_ligatures', False)
         self.output_dir = kwargs.get('output_dir', None)
         self.output_root = kwargs.get('output_root', DEFAULT_OUTPUT_ROOT)
+        self.lite = kwargs.get('lite', False)
+        if kwargs.get('source_format', 'xml') == 'store':
+            self.extension = STORE_EXTENSION
+        else:
+            self.extension = '.xml'
 
         self.dict_name = (kwargs.get('dict_name') or
                           kwargs.get('dict_type') or
@@ -154,14 +204,14 @@ class EntryIterator(object):
         except AttributeError:
             if isinstance(self.path, list):
                 self._files = [fname for fname in self.path if
-                               os.path.splitext(fname)[1] == '.xml']
+                               os.path.splitext(fname)[1] == self.extension]
             elif (os.path.isfile(self.path) and
-                    os.path.splitext(self.path)[1] == '.xml'):
+                    os.path.splitext(self.path)[1] == self.extension):
                 self._files = [self.path]
             elif os.path.isdir(self.path):
                 self._files = [os.path.join(self.path, fname) for fname in
                                sorted(os.listdir(self.path)) if
-                               os.path.splitext(fname)[1] == '.xml']
+                               os.path.splitext(fname)[1] == self.extension]
             else:
                 self._files = []
             self._files = [f for f in self._files if self._filecheck(f)]
@@ -198,40 +248,153 @@ class EntryIterator(object):
 
             # Initialize output file (if any)
             if self.output_dir:
-                outfile = os.path.join(self.output_dir,
-                                       os.path.basename(filepath))
+                outfile = _output_filename(self.output_dir, filepath)
                 output_handle = open(outfile, 'w')
                 output_handle.write(OUTPUT_HEADER)
                 output_handle.write('<' + self.output_root + '>\n')
 
-            with open(filepath) as filehandle:
-                for line in filehandle:
-                    entry = self._parse_line(line)
-                    if not entry:
-                        continue
-
-                    # Check if this entry should be skipped (e.g.
-                    #  if a sample rate has been specified).
-                    self.entry_count += 1
-                    if self.sample and self.entry_count % self.sample:
-                        continue
-                    if (self.random_sample and
-                            random.randint(1, self.random_sample) != 1):
-                        continue
-
-                    if self.verbosity == 'high':
-                        print('\t%s\t%s' % (entry.id, entry.headword,))
-                    yield entry
-
-                    # Print to output file (if any)
-                    if self.output_dir:
-                        output_handle.write(entry.serialized() + '\n')
+            for line in _file_lines(filepath):
+                entry = self._parse_line(line)
+                if not entry:
+                    continue
+
+                # Check if this entry should be skipped (e.g.
+                #  if a sample rate has been specified).
+                self.entry_count += 1
+                if self.sample and self.entry_count % self.sample:
+                    continue
+                if (self.random_sample and
+                        random.randint(1, self.random_sample) != 1):
+                    continue
+
+                if self.verbosity == 'high':
+                    print('\t%s\t%s' % (entry.id, entry.headword,))
+                yield entry
+
+                # Print to output file (if any)
+                if self.output_dir:
+                    output_handle.write(entry.serialized() + '\n')
 
             # Close output file (if any)
             if self.output_dir:
                 output_handle.write('</' + self.output_root + '>\n')
                 output_handle.close()
 
+    def shards(self, shard_size=None):
+        """
+        Return a list of shards covering the files in self.files().
+
+        Each shard is a 3-ple consisting of (filepath, start, end), where
+        'start' and 'end' are byte offsets. Files larger than shard_size
+        (defaults to DEFAULT_SHARD_SIZE) are split into several shards.
+        An entry belongs to the shard in which its line begins, so shard
+        boundaries don't need to coincide with line breaks.
+
+        Entry stores are not split: each store is a single shard.
+        """
+        shard_size = int(shard_size or DEFAULT_SHARD_SIZE)
+        shards = []
+        for filepath in self.files():
+            filesize = os.path.getsize(filepath)
+            if _is_store(filepath):
+                shards.append((filepath, 0, filesize))
+                continue
+            start = 0
+            while True:
+                end = min(start + shard_size, filesize)
+                shards.append((filepath, start, end))
+                start = end
+                if start >= filesize:
+                    break
+        return shards
+
+    def parallel_map(self, function, **kwargs):
+        """
+        Run a function on each entry, using a pool of worker processes,
+        and yield the return values.
+
+        Results are yielded in the same order as the corresponding
+        entries would be yielded by self.iterate(). Any None values
+        returned by the function are dropped, so the function can also
+        act as a filter.
+
+        Sampling (sample, random_sample) and file filtering work the same
+        way as for self.iterate(). If an output_dir value was supplied,
+        each worker writes its own shard of serialized entries (after
+        the function has been run on them), and the shards for each file
+        are merged into a single output file once the file is complete.
+
+        Arguments:
+         -- function: a picklable function which takes an entry object
+              as its only argument.
+
+        Keyword arguments:
+         -- processes: number of worker processes (defaults to the
+              number of CPUs).
+         -- shard_size: maximum number of bytes handled by a single
+              worker task (defaults to DEFAULT_SHARD_SIZE).
+        """
+        processes = kwargs.get('processes', None)
+        shards = self.shards(kwargs.get('shard_size'))
+        if not self.dict_type:
+            self.dict_type = _deduce_dict(self.files())
+
+        with Pool(processes=processes) as pool:
+            # Deterministic sampling depends on each entry's position in
+            #  the entire stream, so we need to know how many entries
+            #  precede each shard before dispatching the real work.
+            offsets = [0 for shard in shards]
+            if self.sample:
+                counts = pool.map(_count_shard,
+                                  [(shard, self.dict_type) for shard in shards])
+                for i in range(1, len(shards)):
+                    offsets[i] = offsets[i-1] + counts[i-1]
+
+            tasks = []
+            for i, (shard, offset) in enumerate(zip(shards, offsets)):
+                if self.output_dir:
+                    part_file = _part_filename(self.output_dir, shard[0], i)
+                else:
+                    part_file = None
+                tasks.append(_ShardTask(shard, self.dict_type,
+                                        self.fix_ligatures, self.lite,
+                                        function,
+                                        self.sample, self.random_sample,
+                                        offset, part_file, self.verbosity))
+
+            self.entry_count = 0
+            for i, (results, count) in enumerate(pool.imap(_map_shard, tasks)):
+                filepath = shards[i][0]
+                if self.verbosity is not None and (i == 0 or
+                        shards[i-1][0] != filepath):
+                    print('Reading %s...' % filepath)
+                self.entry_count += count
+                for result in results:
+                    yield result
+
+                # Once the last shard of a file has come back, merge the
+                #  shards into a single output file (if any)
+                if self.output_dir and (i == len(shards) - 1 or
+                        shards[i+1][0] != filepath):
+                    self._merge_parts(filepath,
+                                      [task.part_file for task in tasks
+                                       if task.shard[0] == filepath])
+
+    def _merge_parts(self, filepath, part_files):
+        """
+        Merge the output shards written by worker processes into
+        a single output file.
+        """
+        outfile = _output_filename(self.output_dir, filepath)
+        with open(outfile, 'w') as output_handle:
+            output_handle.write(OUTPUT_HEADER)
+            output_handle.write('<' + self.output_root + '>\n')
+            for part_file in part_files:
+                with open(part_file) as part_handle:
+                    shutil.copyfileobj(part_handle, output_handle)
+                os.unlink(part_file)
+            output_handle.write('</' + self.output_root + '>\n')
+
     def _parse_line(self, line):
         """
         Parse each line to determine whether it's an entry; if so,
@@ -239,16 +402,180 @@ class EntryIterator(object):
 
         Otherwise return None.
         """
-        line = line.strip()
-        if ENTRY_PATTERNS[self.dict_type].match(line):
-            if self.dict_type == 'oed':
-                entry = OedEntry(line,
-                                 fix_ligatures=self.fix_ligatures)
-            elif self.dict_type == 'odo':
-                entry = OdoEntry(line)
-            return entry
-        else:
-            return None
+        return _parse_line(line, self.dict_type, self.fix_ligatures,
+                           self.lite)
+
+
+class _ShardTask(object):
+
+    """
+    Bundle of arguments passed to a worker process by
+    EntryIterator.parallel_map().
+    """
+
+    def __init__(self, shard, dict_type, fix_ligatures, lite, function,
+                 sample, random_sample, offset, part_file, verbosity):
+        self.shard = shard
+        self.dict_type = dict_type
+        self.fix_ligatures = fix_ligatures
+        self.lite = lite
+        self.function = function
+        self.sample = sample
+        self.random_sample = random_sample
+        self.offset = offset
+        self.part_file = part_file
+        self.verbosity = verbosity
+
+
+def _parse_line(line, dict_type, fix_ligatures, lite=False):
+    """
+    Parse a line to determine whether it's an entry; if so,
+    use it to initialize and return an appropriate entry object.
+
+    Otherwise return None.
+    """
+    line = line.strip()
+    if ENTRY_PATTERNS[dict_type].match(line):
+        if dict_type == 'oed' and lite:
+            entry = LiteEntry(line,
+                              fix_ligatures=fix_ligatures)
+        elif dict_type == 'oed':
+            entry = OedEntry(line,
+                             fix_ligatures=fix_ligatures)
+        elif dict_type == 'odo':
+            entry = OdoEntry(line)
+        return entry
+    else:
+        return None
+
+
+def _is_store(filepath):
+    """
+    Return True if the file is an entry store (rather than a text file).
+    """
+    return os.path.splitext(filepath)[1] == STORE_EXTENSION
+
+
+def _file_lines(filepath):
+    """
+    Yield each line of a text file, or the serialized XML of each
+    entry in an entry store.
+    """
+    if _is_store(filepath):
+        # Imported here, since lex.entrystore itself imports this module
+        from lex.entrystore import EntryStore
+        store = EntryStore(filepath)
+        try:
+            for line in store.lines():
+                yield line
+        finally:
+            store.close()
+    else:
+        with open(filepath) as filehandle:
+            for line in filehandle:
+                yield line
+
+
+def _output_filename(output_dir, filepath):
+    """
+    Return the name of the output file corresponding to an input file.
+    (Output files are always XML, even if the input is an entry store.)
+    """
+    return os.path.join(output_dir, os.path.splitext(
+        os.path.basename(filepath))[0] + '.xml')
+
+
+def _shard_lines(shard):
+    """
+    Yield each line (as bytes) beginning within a shard's byte range.
+    """
+    filepath, start, end = shard
+    with open(filepath, 'rb') as filehandle:
+        if start > 0:
+            # Skip the remainder of any line that began in the
+            #  previous shard
+            filehandle.seek(start - 1)
+            filehandle.readline()
+        while filehandle.tell() < end:
+            line = filehandle.readline()
+            if not line:
+                break
+            yield line
+
+
+def _count_shard(args):
+    """
+    Return the number of entries beginning within a shard.
+
+    (Run in a worker process by EntryIterator.parallel_map().)
+    """
+    shard, dict_type = args
+    if _is_store(shard[0]):
+        from lex.entrystore import EntryStore
+        store = EntryStore(shard[0])
+        store.close()
+        return len(store)
+    pattern = ENTRY_PATTERNS_BYTES[dict_type]
+    return len([line for line in _shard_lines(shard) if pattern.match(line)])
+
+
+def _map_shard(task):
+    """
+    Parse each entry in a shard, run the task's function on it, and
+    return a 2-ple consisting of the list of results and the number
+    of entries found in the shard.
+
+    (Run in a worker process by EntryIterator.parallel_map().)
+    """
+    # Forked workers all inherit the same random state, so reseed
+    #  to keep random sampling independent between shards
+    if task.random_sample:
+        random.seed()
+
+    if task.part_file is not None:
+        output_handle = open(task.part_file, 'w')
+
+    if _is_store(task.shard[0]):
+        lines = _file_lines(task.shard[0])
+    else:
+        lines = (line.decode('utf-8') for line in _shard_lines(task.shard))
+
+    results = []
+    entry_count = 0
+    for line in lines:
+        entry = _parse_line(line, task.dict_type, task.fix_ligatures,
+                            task.lite)
+        if not entry:
+            continue
+
+        entry_count += 1
+        if task.sample and (task.offset + entry_count) % task.sample:
+            continue
+        if (task.random_sample and
+                random.randint(1, task.random_sample) != 1):
+            continue
+
+        if task.verbosity == 'high':
+            print('\t%s\t%s' % (entry.id, entry.headword,))
+        result = task.function(entry)
+        if result is not None:
+            results.append(result)
+
+        if task.part_file is not None:
+            output_handle.write(entry.serialized() + '\n')
+
+    if task.part_file is not None:
+        output_handle.close()
+    return results, entry_count
+
+
+def _part_filename(output_dir, filepath, shard_number):
+    """
+    Return the name of the temporary file used to store the
+    output for a single shard.
+    """
+    return os.path.join(output_dir, '%s.%04d.part' % (
+        os.path.basename(filepath), shard_number))
 
 
 def _deduce_dict(files):
@@ -258,6 +585,12 @@ def _deduce_dict(files):
     """
     odo_count, oed_count = (0, 0)
     for fname in files:
+        if _is_store(fname):
+            # Entry stores record their own dictionary type
+            from lex.entrystore import EntryStore
+            store = EntryStore(fname)
+            store.close()
+            return store.dict_type
         with open(fname) as filehandle:
             for line in filehandle:
                 line = line.strip()
@@ -0,0 +1,229 @@
+"""
+EntryStore -- Indexed, compressed container for dictionary entries
+EntryStoreCompiler -- Compile OED or ODE/NOAD text files into entry stores
+
+@author: James McCracken
+"""
+
+import os
+import pickle
+import struct
+import zlib
+from collections import defaultdict
+
+from lex.entryiterator import (EntryIterator, STORE_EXTENSION,
+                               _parse_line, _deduce_dict)
+from stringtools import lexical_sort
+
+MAGIC = b'LEXSTORE'
+VERSION = 1
+HEADER = struct.Struct('<8sH3s')
+FOOTER = struct.Struct('<Q8s')
+COMPRESSION_LEVEL = 6
+
+
+class EntryStore(object):
+
+    """
+    Read-only access to an entry store compiled by EntryStoreCompiler.
+
+    An entry store holds every entry from a single OED or ODE/NOAD
+    text file, each compressed separately, plus an offset table keyed
+    by entry ID and by the lexical sort of the headword. This means
+    that repeated passes don't need to scan the whole text file
+    looking for entry lines, and that single entries can be retrieved
+    without reading anything else.
+
+    Usage:
+    >>> store = EntryStore('/path/to/oed_A.store')
+    >>> entry = store.get('1234')
+    >>> for entry in store.find('aardvark'):
+            print(entry.label())
+
+    Entries are stored as serialized XML (lxml has no binary tree format),
+    so each entry retrieved still gets parsed; but only the entries
+    actually requested.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self._handle = open(filepath, 'rb')
+        try:
+            magic, version, dict_type = HEADER.unpack(
+                self._handle.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError('%s is not a valid entry store' % filepath)
+            self.dict_type = dict_type.decode('ascii')
+
+            self._handle.seek(-FOOTER.size, os.SEEK_END)
+            index_offset, magic = FOOTER.unpack(
+                self._handle.read(FOOTER.size))
+            if magic != MAGIC:
+                raise ValueError('%s is truncated' % filepath)
+            self._handle.seek(index_offset)
+            # Each record is a 4-ple: (entry_id, sortkey, offset, length),
+            #  in the order in which the entries appeared in the source
+            #  file
+            self.records = pickle.load(self._handle)
+        except Exception:
+            # Don't leak the file handle if the store can't be opened
+            self._handle.close()
+            raise
+
+        self._ids = {}
+        self._sortkeys = defaultdict(list)
+        for i, record in enumerate(self.records):
+            self._ids[record[0]] = i
+            self._sortkeys[record[1]].append(i)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, entry_id):
+        return str(entry_id) in self._ids
+
+    def close(self):
+        """
+        Close the underlying file handle.
+        """
+        self._handle.close()
+
+    def ids(self):
+        """
+        Return a list of entry IDs, in their original order.
+        """
+        return [record[0] for record in self.records]
+
+    def lines(self):
+        """
+        Yield the serialized XML of each entry (as a string), in the
+        order in which the entries appeared in the original text file.
+        """
+        self._handle.seek(HEADER.size)
+        for record in self.records:
+            yield self._read(record)
+
+    def raw(self, entry_id):
+        """
+        Return the serialized XML of the entry with a given ID, or
+        None if the ID is not in the store.
+        """
+        try:
+            i = self._ids[str(entry_id)]
+        except KeyError:
+            return None
+        else:
+            return self._read(self.records[i])
+
+    def get(self, entry_id, **kwargs):
+        """
+        Return the entry object for a given entry ID, or None if the
+        ID is not in the store.
+
+        Keyword arguments:
+         -- fix_ligatures, lite: see EntryIterator.
+        """
+        line = self.raw(entry_id)
+        if line is None:
+            return None
+        return _entry_factory(line, self.dict_type, **kwargs)
+
+    def find(self, headword, **kwargs):
+        """
+        Return a list of entry objects whose headword has the same
+        lexical sort as the argument (in their original order).
+
+        Keyword arguments:
+         -- fix_ligatures, lite: see EntryIterator.
+        """
+        return [_entry_factory(self._read(self.records[i]),
+                               self.dict_type, **kwargs)
+                for i in self._sortkeys.get(lexical_sort(headword), [])]
+
+    def _read(self, record):
+        """
+        Read and decompress a single entry.
+        """
+        offset, length = record[2], record[3]
+        if self._handle.tell() != offset:
+            self._handle.seek(offset)
+        return zlib.decompress(self._handle.read(length)).decode('utf-8')
+
+
+class EntryStoreCompiler(object):
+
+    """
+    Compile OED or ODE/NOAD text files into entry stores (one store
+    per text file), which can then be read by EntryStore, or iterated
+    over by EntryIterator (using source_format='store').
+
+    >>> compiler = EntryStoreCompiler(path=in_dir, out_dir=out_dir)
+    >>> compiler.compile()
+
+    Keyword arguments:
+     -- out_dir: directory to which the stores will be written.
+     -- path, dict_name, dict_type, file_filter, verbosity: as for
+          EntryIterator; these determine which text files get compiled.
+    """
+
+    def __init__(self, **kwargs):
+        self.out_dir = kwargs.pop('out_dir')
+        self.verbosity = kwargs.get('verbosity', None)
+        self.iterator = EntryIterator(**kwargs)
+
+    def compile(self):
+        """
+        Compile each text file into an entry store.
+
+        Returns a list of the stores written.
+        """
+        stores = []
+        for filepath in self.iterator.files():
+            if self.verbosity is not None:
+                print('Compiling %s...' % filepath)
+            stores.append(self.compile_file(filepath))
+        return stores
+
+    def compile_file(self, filepath):
+        """
+        Compile a single text file into an entry store.
+
+        Returns the path of the store written.
+        """
+        if not self.iterator.dict_type:
+            self.iterator.dict_type = _deduce_dict(self.iterator.files())
+        dict_type = self.iterator.dict_type
+        outfile = os.path.join(self.out_dir, os.path.splitext(
+            os.path.basename(filepath))[0] + STORE_EXTENSION)
+
+        records = []
+        with open(filepath) as filehandle, open(outfile, 'wb') as output_handle:
+            output_handle.write(HEADER.pack(MAGIC, VERSION,
+                                            dict_type.encode('ascii')))
+            for line in filehandle:
+                entry = self.iterator._parse_line(line)
+                if not entry:
+                    continue
+                blob = zlib.compress(line.strip().encode('utf-8'),
+                                     COMPRESSION_LEVEL)
+                records.append((str(entry.id),
+                                entry.lemma_manager().lexical_sort(),
+                                output_handle.tell(),
+                                len(blob)))
+                output_handle.write(blob)
+
+            index_offset = output_handle.tell()
+            pickle.dump(records, output_handle,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+            output_handle.write(FOOTER.pack(index_offset, MAGIC))
+        return outfile
+
+
+def _entry_factory(line, dict_type, **kwargs):
+    """
+    Return an entry object from the serialized XML of the entry.
+    """
+    fix_ligatures = (kwargs.get('fix_ligatures') or
+                     kwargs.get('fixLigatures') or False)
+    return _parse_line(line, dict_type, fix_ligatures,
+                       kwargs.get('lite', False))
@@ -1,10 +1,12 @@
 """
 FrequencyTable -- Table of frequency values, for a range of periods.
+FrequencyMatrix -- Set of frequency tables, for batch operations.
+PeriodLayout -- Mapping of years to periods, for a given set of period labels.
 
 @author: James McCracken
 """
 
-from collections import defaultdict, namedtuple
+from collections import namedtuple
 import math
 
 import numpy
@@ -14,8 +16,9 @@ from regexcompiler import ReMatcher
 
 PARSED_LABELS = dict()
 VALID_YEARS = range(1750, 2020, 10)
+# Fixed axis used by the array representation of a table
+YEAR_AXIS = numpy.array(VALID_YEARS)
 MOVING_AVERAGE_WINDOWSIZE = ((1900, 6), (1950, 4), (2050, 2))
-YEAR_TO_PERIOD_CACHE = dict()
 
 
 class FrequencyTable(object):
@@ -25,6 +28,13 @@ class FrequencyTable(object):
 
     Can be initialized from an existing table (XML node) or from a
     dictionary of frequency values mapped to periods
+
+    The table's values are held in self.data (a dictionary of
+    PeriodValues namedtuples, keyed by period label). Interpolated and
+    smoothed values are computed as NumPy arrays on a fixed axis
+    (the decades in VALID_YEARS, plus 'modern'); see self.array().
+    If self.data is changed, call self.recalculate_logs() so that
+    these get recomputed.
     """
 
     PeriodValues = namedtuple('PeriodValues', ['frequency', 'log',
@@ -110,20 +120,70 @@ class FrequencyTable(object):
         return {period: values.frequency for period, values
                 in self.data.items()}
 
+    def array(self):
+        """
+        Return a NumPy array of the table's frequencies on a fixed axis:
+        the interpolated frequency for each decade in VALID_YEARS,
+        followed by the 'modern' frequency (or 0 if the table has no
+        'modern' value).
+        """
+        try:
+            return self._array
+        except AttributeError:
+            self._array = numpy.append(_calculate_interpolation(self),
+                                       self._modern_frequency())
+            return self._array
+
+    def interpolated_array(self):
+        """
+        Return a NumPy array of interpolated frequencies, one for each
+        decade in VALID_YEARS.
+        """
+        return self.array()[:-1]
+
     def interpolated(self):
+        """
+        Return a list of interpolated values: each element of the list
+        is a 2ple consisting of (year, frequency), for each decade
+        in VALID_YEARS.
+        """
         try:
             return self._interpolated
         except AttributeError:
-            self._interpolated = _calculate_interpolation(self)
+            self._interpolated = list(zip(VALID_YEARS,
+                                          self.interpolated_array()))
             return self._interpolated
 
     def moving_average(self):
+        """
+        Return a list of smoothed values: each element of the list
+        is a 2ple consisting of (year, frequency), for each decade
+        in VALID_YEARS.
+        """
         try:
             return self._moving_average
         except AttributeError:
-            self._moving_average = _calculate_moving_average(self)
+            self._moving_average = list(zip(VALID_YEARS,
+                _calculate_moving_average(self.interpolated_array())))
             return self._moving_average
 
+    def layout(self):
+        """
+        Return the PeriodLayout for this table's set of period labels
+        (used to find the period containing a given year).
+        """
+        try:
+            return self._layout
+        except AttributeError:
+            self._layout = PeriodLayout.for_labels(self.data.keys())
+            return self._layout
+
+    def _modern_frequency(self):
+        try:
+            return self.data['modern'].frequency
+        except KeyError:
+            return 0
+
     def wordclass_method(self):
         """
         ???
@@ -153,10 +213,9 @@ class FrequencyTable(object):
         interpolated = kwargs.get('interpolated', False)
 
         if year is not None and interpolated:
-            fvalue = numpy.interp(year, [i[0] for i in self.interpolated()],
-                                  [i[1] for i in self.interpolated()])
+            fvalue = numpy.interp(year, YEAR_AXIS, self.interpolated_array())
         elif year is not None:
-            period = _year_to_period(year, self.data)
+            period = self.layout().period(year)
             if period is not None and period in self.data:
                 fvalue = self.data[period].frequency
             else:
@@ -165,9 +224,8 @@ class FrequencyTable(object):
             fvalue = self.data[period].frequency
         elif period is not None:
             start, end = _parse_label(period)
-            years = range(start, end)
-            vals = numpy.interp(years, [i[0] for i in self.interpolated()],
-                                [i[1] for i in self.interpolated()])
+            vals = numpy.interp(numpy.arange(start, end), YEAR_AXIS,
+                                self.interpolated_array())
             if len(vals) > 0:
                 fvalue = numpy.mean(vals)
             else:
@@ -188,7 +246,7 @@ class FrequencyTable(object):
         period = kwargs.get('period', None)
         year = kwargs.get('year', None)
         if year is not None:
-            period = _year_to_period(year, self.data)
+            period = self.layout().period(year)
         if period in self.data:
             return self.data[period].band
         else:
@@ -206,7 +264,7 @@ class FrequencyTable(object):
         period = kwargs.get('period', None)
         year = kwargs.get('year', None)
         if year is not None:
-            period = _year_to_period(year, self.data)
+            period = self.layout().period(year)
         if period in self.data:
             return self.data[period].log
         else:
@@ -304,7 +362,13 @@ class FrequencyTable(object):
         """
         Recalculate the log-frequency and band values for each element
         in the table (useful if raw values have been adjusted).
+
+        Also discards any interpolated or smoothed values, so that these
+        get recomputed from the adjusted values.
         """
+        for cached in ('_array', '_interpolated', '_moving_average',
+                       '_layout'):
+            self.__dict__.pop(cached, None)
         for period, values in self.data.items():
             new_values = self.PeriodValues(values.frequency,
                                            _log_frequency(values.frequency),
@@ -319,22 +383,23 @@ class FrequencyTable(object):
         The keyword argument ignoreZeroes=True causes zero values to be
         ignored (before the word was coined, or after it went obsolete).
         """
+        values = self.interpolated_array()
         if kwargs.get('ignoreZeroes', True):
-            return numpy.mean([d[1] for d in self.interpolated() if d[1] > 0])
+            return numpy.mean(values[values > 0])
         else:
-            return numpy.mean([d[1] for d in self.interpolated()])
+            return numpy.mean(values)
 
     def max_frequency(self):
         """
         Return the highest frequency in the table.
         """
-        return max([d[1] for d in self.interpolated()])
+        return self.interpolated_array().max()
 
     def min_frequency(self):
         """
         Return the lowest frequency in the table.
         """
-        return min([d[1] for d in self.interpolated()])
+        return self.interpolated_array().min()
 
     #=========================================================
     # Interaction with other another FrequencyTable instance
@@ -361,19 +426,279 @@ class FrequencyTable(object):
         return sum_frequency_tables([self, other])
 
 
+class FrequencyMatrix(object):
+
+    """
+    Set of frequency tables held as 2-D NumPy arrays (one row per
+    table), for batch operations across many tables at once.
+
+    >>> matrix = FrequencyMatrix(tables)
+    >>> summed = matrix.sum()
+    >>> bands = matrix.bands(period='modern')
+    >>> ratios = matrix.delta(1800, 2000)
+
+    Two arrays are built:
+     -- self.values: the raw frequency for each table (row) and each
+          period label found in any of the tables (column; see
+          self.labels). Periods missing from a table have the value 0,
+          and are flagged False in self.present.
+     -- self.interpolated(): each table's frequencies on the fixed axis
+          used by FrequencyTable.array() (decades plus 'modern'); built
+          on first use.
+    """
+
+    def __init__(self, tables):
+        self.tables = list(tables)
+        self.labels = sorted(set([label for table in self.tables
+                                  for label in table.data.keys()]))
+        columns = {label: i for i, label in enumerate(self.labels)}
+        shape = (len(self.tables), len(self.labels))
+        self.values = numpy.zeros(shape)
+        self.present = numpy.zeros(shape, dtype=bool)
+        self.estimates = numpy.zeros(shape, dtype=bool)
+        for row, table in enumerate(self.tables):
+            for label, values in table.data.items():
+                column = columns[label]
+                self.values[row, column] = values.frequency
+                self.present[row, column] = True
+                self.estimates[row, column] = bool(values.estimate)
+
+    def __len__(self):
+        return len(self.tables)
+
+    def interpolated(self):
+        """
+        Return a 2-D array of each table's frequencies on the fixed
+        axis (see FrequencyTable.array()).
+        """
+        try:
+            return self._interpolated
+        except AttributeError:
+            if self.tables:
+                self._interpolated = numpy.vstack([table.array() for
+                                                   table in self.tables])
+            else:
+                self._interpolated = numpy.zeros((0, len(VALID_YEARS) + 1))
+            return self._interpolated
+
+    def sum(self):
+        """
+        Add together the values of all the tables, and return a new
+        FrequencyTable containing the results.
+        """
+        frequencies = self.values.sum(axis=0)
+        estimates = self.estimates.any(axis=0)
+        present = self.present.any(axis=0)
+        sum_data = {label: {'frequency': float(frequencies[i]),
+                            'estimate': bool(estimates[i])}
+                    for i, label in enumerate(self.labels) if present[i]}
+        return FrequencyTable(data=sum_data)
+
+    def frequencies(self, **kwargs):
+        """
+        Return a 1-D array of the frequency of each table for a
+        given period or year.
+
+        Keyword arguments:
+         -- 'period' (a period label, or 'modern')
+         -- 'year'
+         -- 'interpolated' (defaults to False)
+        Defaults to 'modern' if no arguments are supplied. Values are
+        the same as those returned by FrequencyTable.frequency() for
+        each table.
+        """
+        year = kwargs.get('year', None)
+        period = kwargs.get('period', 'modern')
+        if year is not None and not kwargs.get('interpolated', False):
+            return self._lookup_year(year)
+        elif year is not None:
+            position = numpy.interp(year, YEAR_AXIS,
+                                    numpy.arange(len(YEAR_AXIS)))
+            lower = int(math.floor(position))
+            upper = min(lower + 1, len(YEAR_AXIS) - 1)
+            weight = position - lower
+            return (self.interpolated()[:, lower] * (1 - weight) +
+                    self.interpolated()[:, upper] * weight)
+        elif period == 'modern':
+            return self._modern_frequencies()
+        elif period in self.labels:
+            # Tables which lack the period get an average of their
+            #  interpolated values, as in FrequencyTable.frequency()
+            column = self.labels.index(period)
+            frequencies = self.values[:, column].copy()
+            for row in numpy.flatnonzero(~self.present[:, column]):
+                frequencies[row] = self.tables[row].frequency(period=period)
+            return frequencies
+        else:
+            return numpy.array([table.frequency(period=period)
+                                for table in self.tables])
+
+    def _modern_frequencies(self):
+        """
+        Return a 1-D array of the 'modern' frequency of each table
+        (0 for tables which don't have a 'modern' value).
+        """
+        if 'modern' in self.labels:
+            return self.values[:, self.labels.index('modern')].copy()
+        else:
+            return numpy.zeros(len(self.tables))
+
+    def _layout_rows(self):
+        """
+        Return a list of (layout, rows) pairs, grouping together the
+        rows of all the tables which share a PeriodLayout (i.e. which
+        have the same set of period labels).
+        """
+        try:
+            return self._layout_groups
+        except AttributeError:
+            groups = {}
+            for row, table in enumerate(self.tables):
+                groups.setdefault(table.layout(), []).append(row)
+            self._layout_groups = [(layout, numpy.array(rows)) for
+                                   layout, rows in groups.items()]
+            return self._layout_groups
+
+    def _lookup_year(self, year):
+        """
+        Return a 1-D array of the frequency of each table for the
+        period containing the year (or the 'modern' frequency, for
+        tables which don't have a period containing the year).
+
+        The period is resolved against each table's own layout, so
+        that tables with different sets of periods are handled in
+        the same way as by FrequencyTable.frequency().
+        """
+        frequencies = self._modern_frequencies()
+        for layout, rows in self._layout_rows():
+            period = layout.period(year)
+            if period is not None:
+                frequencies[rows] = self.values[rows,
+                                                self.labels.index(period)]
+        return frequencies
+
+    def bands(self, **kwargs):
+        """
+        Return a 1-D array of the logarithmic band of each table for
+        a given period or year (takes the same keyword arguments
+        as self.frequencies()).
+        """
+        return log_bands(self.frequencies(**kwargs))
+
+    def delta(self, period1, period2):
+        """
+        Return a 1-D array giving the change in each table from one
+        period to another (as a ratio of the frequency at the start).
+        Tables with no frequency at the start get the value NaN.
+
+        Periods may be years (ints) or period labels.
+        """
+        if isinstance(period1, int) and isinstance(period2, int):
+            frequency1 = self.frequencies(year=period1)
+            frequency2 = self.frequencies(year=period2)
+        else:
+            frequency1 = self.frequencies(period=period1)
+            frequency2 = self.frequencies(period=period2)
+        ratios = numpy.full(len(self.tables), numpy.nan)
+        valid = frequency1 >= 0.00000001
+        ratios[valid] = frequency2[valid] / frequency1[valid]
+        return ratios
+
+
+class PeriodLayout(object):
+
+    """
+    Mapping of years to periods, for a given set of period labels.
+
+    A lookup array (one slot per year, from the earliest start year
+    to the latest end year) gives the index of the period containing
+    each year, so finding the period is a constant-time lookup.
+
+    Layouts are cached by set of labels, so each distinct set is only
+    processed once, however many tables share it:
+    >>> layout = PeriodLayout.for_labels(table.data.keys())
+    >>> layout.period(1855)
+    '1850-59'
+    """
+
+    layouts = {}
+
+    def __init__(self, labels):
+        # 'modern' overlaps the final periods, so it's never the
+        #  period for a given year; labels are sorted so that if
+        #  periods overlap, the earliest-sorting label wins
+        self.labels = sorted([label for label in labels
+                              if label != 'modern'])
+        ranges = [_parse_label(label) for label in self.labels]
+        ranges = [(start, end) for start, end in ranges if start or end]
+        if ranges:
+            self.first_year = min([start for start, end in ranges])
+            last_year = max([end for start, end in ranges])
+        else:
+            self.first_year = last_year = 0
+        self.lookup = numpy.full(last_year - self.first_year + 1, -1,
+                                 dtype=int)
+        for i, label in reversed(list(enumerate(self.labels))):
+            start, end = _parse_label(label)
+            if start or end:
+                self.lookup[start - self.first_year:
+                            end - self.first_year + 1] = i
+
+    @classmethod
+    def for_labels(cls, labels):
+        """
+        Return the PeriodLayout for a set of labels (building it if
+        it hasn't been seen before).
+        """
+        key = frozenset(labels)
+        try:
+            return cls.layouts[key]
+        except KeyError:
+            cls.layouts[key] = cls(key)
+            return cls.layouts[key]
+
+    def index(self, year):
+        """
+        Return the index (in self.labels) of the period containing
+        the year, or -1 if no period contains the year.
+        """
+        position = year - self.first_year
+        if 0 <= position < len(self.lookup):
+            return self.lookup[position]
+        else:
+            return -1
+
+    def period(self, year):
+        """
+        Return the label of the period containing the year, or None
+        if no period contains the year.
+        """
+        i = self.index(year)
+        if i == -1:
+            return None
+        else:
+            return self.labels[i]
+
+
 def sum_frequency_tables(tables):
     """
     Add to together the values contained in a list of FrequencyTables,
     and return a new FrequencyTable containing the results
     """
-    sum_data = defaultdict(lambda: {'frequency': 0, 'estimate': False})
-    for table in tables:
-        for period, values in table.data.items():
-            sum_data[period]['frequency'] += values.frequency
-            if values.estimate:
-                sum_data[period]['estimate'] = True
-    summed = FrequencyTable(data=sum_data)
-    return summed
+    return FrequencyMatrix(tables).sum()
+
+
+def log_bands(frequencies):
+    """
+    Return a NumPy array of the bands (1-8) into which an array of raw
+    frequencies are binned (vectorized version of _log_band()).
+    """
+    frequencies = numpy.asarray(frequencies, dtype=float)
+    bands = numpy.full(frequencies.shape, 8, dtype=int)
+    positive = frequencies > 0
+    logs = numpy.floor(numpy.log10(frequencies[positive])).astype(int)
+    bands[positive] = numpy.minimum(numpy.abs(numpy.minimum(logs, 3) - 4), 7)
+    return bands
 
 
 def band_limits(mode=None):
@@ -502,88 +827,77 @@ def _parse_label(label):
         return PARSED_LABELS[label]
 
 
-def _year_to_period(year, freq_dict):
-    """
-    Convert a year (int) to the best-matching period given in the
-    frequency table.
-    """
-    if not year in YEAR_TO_PERIOD_CACHE:
-        match = None
-        for period in freq_dict.keys():
-            if period != 'modern':
-                start, end = _parse_label(period)
-                if start <= year <= end:
-                    match = period
-                    break
-        if match is not None:
-            YEAR_TO_PERIOD_CACHE[year] = match
-        else:
-            YEAR_TO_PERIOD_CACHE[year] = 'out of range'
-    return YEAR_TO_PERIOD_CACHE[year]
-
-
 def _calculate_interpolation(instance):
     """
-    Return a list of interpolated values. This will include any explicit
-    values in the table itself, plus all other decades in the period
-    from 1750 to 2010.
-
-    Each element of the list is a 2ple consisting of (year, frequency).
+    Return a NumPy array of interpolated values, one for each decade
+    in VALID_YEARS. This will include any explicit values in the table
+    itself, plus all other decades in the period from 1750 to 2010.
     """
-    xpoints = list()  # periods
-    ypoints = list()  # frequencies
-    for start, end in [_parse_label(label) for label in
-                       sorted(instance.data.keys())
-                       if label != 'modern']:
-        midpoint = int(numpy.mean((start, end,)))
-        xpoints.append(midpoint)
-        ypoints.append(instance.frequency(year=midpoint))
+    labels = sorted([label for label in instance.data.keys()
+                     if label != 'modern'])
+    if not labels:
+        # Nothing to interpolate between: the 'modern' value (if any)
+        #  stands for every decade
+        return numpy.full(len(YEAR_AXIS), float(instance._modern_frequency()))
+    ranges = numpy.array([_parse_label(label) for label in labels],
+                         dtype=int).reshape(-1, 2)
+    xpoints = (ranges[:, 0] + ranges[:, 1]) // 2  # midpoints
+    ypoints = numpy.array([instance.data[label].frequency
+                           for label in labels], dtype=float)
+    # Unparseable labels fall back on the 'modern' value
+    ypoints[xpoints == 0] = instance._modern_frequency()
 
     # Pad date range with zeroes up to the first non-zero value - this
     #  is to forestall the interpolation of non-zero values before
     #  the actual first non-zero value, which would give the
     #  impression that the first use was earlier
-    first_nonzero_year = None
-    for year, frequency in zip(xpoints, ypoints):
-        if frequency > 0.0000001:
-            first_nonzero_year = year
-            break
-    if (first_nonzero_year is not None and
-            first_nonzero_year > xpoints[0]):
-        zeroes = [(y, 0) for y in
-                  range(xpoints[0], first_nonzero_year, 10)]
-        nonzeroes = [(y, f) for y, f in zip(xpoints, ypoints)
-                     if y >= first_nonzero_year]
-        xpoints = [d[0] for d in zeroes] + [d[0] for d in nonzeroes]
-        ypoints = [d[1] for d in zeroes] + [d[1] for d in nonzeroes]
-
-    frequencies = numpy.interp(VALID_YEARS, xpoints, ypoints)
-    return [(y, f) for y, f in zip(VALID_YEARS, frequencies)]
-
-
-def _calculate_moving_average(instance):
-    """
-    Return a list of frequency values smoothed using a moving-average
-    algorithm.
+    nonzero = numpy.flatnonzero(ypoints > 0.0000001)
+    if len(nonzero) and xpoints[nonzero[0]] > xpoints[0]:
+        first = nonzero[0]
+        zeroes = numpy.arange(xpoints[0], xpoints[first], 10)
+        xpoints = numpy.concatenate((zeroes, xpoints[first:]))
+        ypoints = numpy.concatenate((numpy.zeros(len(zeroes)),
+                                     ypoints[first:]))
+
+    return numpy.interp(YEAR_AXIS, xpoints, ypoints)
+
 
-    Each element of the list is a 2ple consisting of (year, frequency).
+def _moving_average_spans():
     """
-    averaged_y = []
-    for i, datapoint in enumerate(instance.interpolated()):
-        windowsize = None
-        for block in MOVING_AVERAGE_WINDOWSIZE:
-            if datapoint[0] < block[0]:
-                windowsize = block[1]
+    Return an array giving the half-width of the moving-average window
+    for each decade in VALID_YEARS.
+    """
+    spans = []
+    for year in VALID_YEARS:
+        for block_end, windowsize in MOVING_AVERAGE_WINDOWSIZE:
+            if year < block_end:
+                spans.append(windowsize // 2)
                 break
-        span = windowsize // 2
-        first = max(i - span, 0)
-        last = min(i + span + 1, len(instance.interpolated()))
-        window = instance.interpolated()[first:last]
-        if datapoint[1] == 0 or not window:
-            average = 0
-        else:
-            average = numpy.mean([datapoint[1] for datapoint in window])
-        averaged_y.append(average)
+    return numpy.array(spans)
+
+MOVING_AVERAGE_SPANS = _moving_average_spans()
 
-    return [(yr, f) for yr, f in
-            zip([d[0] for d in instance.interpolated()], averaged_y)]
+
+def _calculate_moving_average(values):
+    """
+    Return an array of frequency values smoothed using a moving-average
+    algorithm (from an array of interpolated values). Zero values
+    remain zero.
+    """
+    # Add up each window by shifting the array one offset at a time
+    #  (rather than using cumulative sums, which would lose precision
+    #  for small values following large ones)
+    max_span = MOVING_AVERAGE_SPANS.max()
+    padded = numpy.concatenate((numpy.zeros(max_span), values,
+                                numpy.zeros(max_span)))
+    positions = numpy.arange(len(values))
+    totals = numpy.zeros(len(values))
+    for offset in range(-max_span, max_span + 1):
+        in_window = abs(offset) <= MOVING_AVERAGE_SPANS
+        totals += numpy.where(in_window,
+                              padded[positions + max_span + offset], 0)
+    first = numpy.maximum(positions - MOVING_AVERAGE_SPANS, 0)
+    last = numpy.minimum(positions + MOVING_AVERAGE_SPANS + 1, len(values))
+    averaged = totals / (last - first)
+    averaged[values == 0] = 0
+    return averaged
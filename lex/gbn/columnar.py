@@ -0,0 +1,369 @@
+"""
+ColumnarConverter -- Convert Google Ngrams text tables to columnar format
+ColumnarTable -- Memory-mapped reader for a columnar Google Ngrams table
+NgramView -- Lightweight view of a single row of a ColumnarTable
+
+@author: James McCracken
+"""
+
+import os
+import json
+import mmap
+
+import numpy
+
+from lex.gbn.frequency import Frequency, range_parser
+from lex.gbn.ngram import Ngram, WORDCLASS_MAPS, WORDCLASS_TO_PENN, \
+    _parse_line
+
+frequency_manager = Frequency()
+
+# Fixed decade axis for the count matrix (cf. ngram.DECADE_PATTERN)
+DECADES = numpy.arange(1500, 2100, 10)
+COUNTS_FILE = 'counts.npy'
+WORDCLASS_FILE = 'wordclasses.npy'
+LEMMA_POOL = 'lemmas.bin'
+LEMMA_OFFSETS = 'lemma_offsets.npy'
+SORTCODE_POOL = 'sortcodes.bin'
+SORTCODE_OFFSETS = 'sortcode_offsets.npy'
+META_FILE = 'meta.json'
+
+
+class ColumnarConverter(object):
+
+    """
+    Convert sorted Google Ngrams text tables (as read by TableIterator)
+    into columnar tables, which can be read by ColumnarTable.
+
+    Each text file is converted into a directory (with the same name
+    as the file, minus the extension) containing:
+     -- counts.npy: a dense int64 matrix of counts, one row per ngram
+          and one column per decade in DECADES;
+     -- wordclasses.npy: a uint8 code for each ngram's wordclass (the
+          codes are listed in meta.json);
+     -- lemmas.bin and sortcodes.bin: string pools (UTF-8), with
+          lemma_offsets.npy and sortcode_offsets.npy giving the start
+          and end of each string;
+     -- meta.json: gram count, wordclass codes, number of rows.
+
+    >>> converter = ColumnarConverter(out_dir=out_dir, gramCount=1)
+    >>> converter.convert_file('/path/to/sorted/1/a/aa.txt')
+    """
+
+    def __init__(self, **kwargs):
+        self.out_dir = kwargs.get('out_dir')
+        self.gram_count = int(kwargs.get('gramCount', 1))
+        self.verbose = kwargs.get('verbose', False)
+
+    def convert_files(self, filepaths):
+        """
+        Convert a list of text files; returns a list of the
+        directories written.
+        """
+        return [self.convert_file(filepath) for filepath in filepaths]
+
+    def convert_file(self, filepath):
+        """
+        Convert a single text file; returns the directory written.
+        """
+        if self.verbose:
+            print('Converting %s...' % filepath)
+        table_dir = os.path.join(self.out_dir, os.path.splitext(
+            os.path.basename(filepath))[0])
+        os.makedirs(table_dir, exist_ok=True)
+
+        rows = []
+        lemmas = []
+        sortcodes = []
+        wordclasses = []
+        with open(filepath) as filehandle:
+            for line in filehandle:
+                if not line.strip():
+                    continue
+                data = _parse_line(line, self.gram_count)
+                row = numpy.zeros(len(DECADES), dtype=numpy.int64)
+                for decade, count in data[4].items():
+                    row[(decade - DECADES[0]) // 10] = count
+                rows.append(row)
+                lemmas.append(data[1])
+                sortcodes.append(data[3])
+                wordclasses.append(data[6])
+
+        wordclass_codes = sorted(set(wordclasses))
+        if len(wordclass_codes) > 256:
+            raise ValueError('Too many wordclasses in %s' % filepath)
+        code_index = {wordclass: i for i, wordclass
+                      in enumerate(wordclass_codes)}
+
+        if rows:
+            counts = numpy.vstack(rows)
+        else:
+            counts = numpy.zeros((0, len(DECADES)), dtype=numpy.int64)
+        numpy.save(os.path.join(table_dir, COUNTS_FILE), counts)
+        numpy.save(os.path.join(table_dir, WORDCLASS_FILE),
+                   numpy.array([code_index[w] for w in wordclasses],
+                               dtype=numpy.uint8))
+        _write_pool(lemmas, os.path.join(table_dir, LEMMA_POOL),
+                    os.path.join(table_dir, LEMMA_OFFSETS))
+        _write_pool(sortcodes, os.path.join(table_dir, SORTCODE_POOL),
+                    os.path.join(table_dir, SORTCODE_OFFSETS))
+        with open(os.path.join(table_dir, META_FILE), 'w') as filehandle:
+            json.dump({'gram_count': self.gram_count,
+                       'wordclasses': wordclass_codes,
+                       'rows': len(rows)}, filehandle)
+        return table_dir
+
+
+class ColumnarTable(object):
+
+    """
+    Memory-mapped reader for a columnar Google Ngrams table (written
+    by ColumnarConverter).
+
+    Counts for whole tables can be computed at once:
+    >>> table = ColumnarTable('/path/to/columnar/1/a/aa')
+    >>> frequencies = table.frequencies('1970-2007')
+
+    Iteration yields NgramView objects, which provide the same read-only
+    interface as Ngram objects, but are only views onto a row of the
+    table:
+    >>> for ngram in table:
+            print(ngram.lemma, ngram.frequency('1970-2007'))
+    """
+
+    def __init__(self, table_dir):
+        self.table_dir = table_dir
+        with open(os.path.join(table_dir, META_FILE)) as filehandle:
+            meta = json.load(filehandle)
+        self.gram_count = meta['gram_count']
+        self.wordclass_codes = meta['wordclasses']
+        self.counts = _load(table_dir, COUNTS_FILE)
+        self.wordclasses = _load(table_dir, WORDCLASS_FILE)
+        self.lemma_offsets = _load(table_dir, LEMMA_OFFSETS)
+        self.sortcode_offsets = _load(table_dir, SORTCODE_OFFSETS)
+        self._lemma_pool = _map_pool(os.path.join(table_dir, LEMMA_POOL))
+        self._sortcode_pool = _map_pool(os.path.join(table_dir,
+                                                     SORTCODE_POOL))
+        self._ranges = {}
+
+    def __len__(self):
+        return self.counts.shape[0]
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield NgramView(self, row)
+
+    def __getitem__(self, row):
+        if not -len(self) <= row < len(self):
+            raise IndexError(row)
+        return NgramView(self, row % len(self))
+
+    def lemma(self, row):
+        return _read_string(self._lemma_pool, self.lemma_offsets, row)
+
+    def sortcode(self, row):
+        return _read_string(self._sortcode_pool, self.sortcode_offsets, row)
+
+    def wordclass(self, row):
+        return self.wordclass_codes[self.wordclasses[row]]
+
+    def range_columns(self, range_string):
+        """
+        Return a boolean array indicating which decade columns are
+        included in a range (using the same logic as Ngram.range_count()).
+        """
+        try:
+            return self._ranges[range_string]
+        except KeyError:
+            start, end = range_parser(range_string)
+            if start and not end:
+                columns = DECADES == (start // 10) * 10
+            elif start and end and end > start:
+                columns = (DECADES >= start) & (DECADES <= end)
+            else:
+                columns = numpy.zeros(len(DECADES), dtype=bool)
+            self._ranges[range_string] = columns
+            return columns
+
+    def range_counts(self, range_string):
+        """
+        Return an array of the count of each ngram in the table for
+        a given range (e.g. '1970-2007').
+        """
+        return self.counts[:, self.range_columns(range_string)].sum(axis=1)
+
+    def total_counts(self):
+        """
+        Return an array of the total count of each ngram in the table.
+        """
+        return self.counts.sum(axis=1)
+
+    def frequencies(self, range_string):
+        """
+        Return an array of the frequency (per million) of each ngram
+        in the table for a given range.
+        """
+        return frequency_manager.frequencies_per_million(
+            self.range_counts(range_string), range_string,
+            gram=self.gram_count)
+
+    def mask_wordclass(self, wordclass):
+        """
+        Return a boolean array indicating which ngrams in the table
+        have a given wordclass (e.g. 'NOUN').
+        """
+        try:
+            code = self.wordclass_codes.index(wordclass)
+        except ValueError:
+            return numpy.zeros(len(self), dtype=bool)
+        return self.wordclasses == code
+
+
+class NgramView(object):
+
+    """
+    Lightweight read-only view of a single row of a ColumnarTable,
+    with the same interface as Ngram (for reading values).
+
+    Use NgramView.to_ngram() to get a full Ngram object (e.g. if
+    values need to be changed).
+    """
+
+    __slots__ = ['table', 'row']
+
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+
+    def __repr__(self):
+        return '<NgramView %s %s (%d) (%.2g)>' % (self.lemma,
+                                                  self.wordclass,
+                                                  self.gram_count,
+                                                  self.frequency('1970-2007'))
+
+    @property
+    def source_lemma(self):
+        return self.table.lemma(self.row)
+
+    lemma = source_lemma
+
+    @property
+    def sortcode(self):
+        return self.table.sortcode(self.row)
+
+    @property
+    def gram_count(self):
+        return self.table.gram_count
+
+    @property
+    def wordclass(self):
+        return self.table.wordclass(self.row)
+
+    def is_unclassified(self):
+        return self.wordclass == 'ALL' or not self.wordclass
+
+    def signature(self):
+        return self.lemma, self.wordclass
+
+    @property
+    def decades(self):
+        counts = self.table.counts[self.row]
+        return {int(DECADES[i]): int(counts[i])
+                for i in numpy.flatnonzero(counts)}
+
+    def decade_count(self, year):
+        i = (year - DECADES[0]) // 10
+        if 0 <= i < len(DECADES) and year % 10 == 0:
+            return int(self.table.counts[self.row, i])
+        return 0
+
+    def total_count(self):
+        return int(self.table.counts[self.row].sum())
+
+    def range_count(self, range_string):
+        columns = self.table.range_columns(range_string)
+        return int(self.table.counts[self.row, columns].sum())
+
+    def frequency(self, range):
+        return frequency_manager.frequency_per_million(
+            count=self.range_count(range),
+            range=range,
+            gram=self.gram_count,
+        )
+
+    def decade_frequency(self, year):
+        return frequency_manager.frequency_per_million(
+            count=self.decade_count(year),
+            decade=year,
+            gram=self.gram_count,
+        )
+
+    @property
+    def initial(self):
+        if self.sortcode:
+            return self.sortcode[0]
+        else:
+            return 'z'
+
+    @property
+    def prefix(self):
+        sortcode = self.sortcode
+        if len(sortcode) >= 3:
+            return sortcode[0:3]
+        elif len(sortcode) == 2:
+            return sortcode + '0'
+        elif len(sortcode) == 1:
+            return sortcode + '00'
+        else:
+            return 'zzz'
+
+    def matches_wordclass(self, penn):
+        if (self.wordclass and
+                self.wordclass in WORDCLASS_MAPS and
+                penn.upper() in WORDCLASS_MAPS[self.wordclass]):
+            return True
+        else:
+            return False
+
+    def penn_wordclass(self):
+        try:
+            return WORDCLASS_TO_PENN[self.wordclass]
+        except KeyError:
+            return None
+
+    def to_ngram(self):
+        """
+        Return a full (mutable) Ngram object for this row.
+        """
+        decades_string = '\t'.join(['%d:%d' % (dec, value) for dec, value
+                                    in sorted(self.decades.items())])
+        line = '%s\t%s\t%s\t%s' % (self.sortcode, self.lemma,
+                                   self.wordclass, decades_string)
+        return Ngram(line, gramCount=self.gram_count)
+
+
+def _write_pool(strings, pool_file, offsets_file):
+    offsets = numpy.zeros(len(strings) + 1, dtype=numpy.int64)
+    with open(pool_file, 'wb') as filehandle:
+        position = 0
+        for i, string in enumerate(strings):
+            encoded = string.encode('utf-8')
+            filehandle.write(encoded)
+            position += len(encoded)
+            offsets[i + 1] = position
+    numpy.save(offsets_file, offsets)
+
+
+def _load(table_dir, filename):
+    return numpy.load(os.path.join(table_dir, filename), mmap_mode='r')
+
+
+def _map_pool(pool_file):
+    with open(pool_file, 'rb') as filehandle:
+        if os.fstat(filehandle.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(filehandle.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _read_string(pool, offsets, row):
+    return pool[offsets[row]:offsets[row + 1]].decode('utf-8')
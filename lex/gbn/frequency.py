@@ -4,7 +4,8 @@ Frequency
 
 import os
 import re
-from collections import defaultdict
+
+import numpy
 
 LINE_PARSER = re.compile(r'^([12]\d\d\d)\t(\d+)\t(\d+)\t(\d+)$')
 RANGE_PATTERNS = (
@@ -19,21 +20,23 @@ class Frequency(object):
 
     """
     Frequency class.
+
+    Corpus totals are held both as per-year dicts (Frequency.counts)
+    and as cumulative arrays indexed by year (Frequency.cumulative),
+    so that the total for any range of years is a single subtraction.
     """
 
     map = {}
     counts = {}
-    ranges = defaultdict(lambda: defaultdict(dict))
+    cumulative = {}
 
     def __init__(self):
         if not Frequency.counts:
             self._parse_files()
 
     def total(self, **kwargs):
-        id, type = self._argparser(**kwargs)
-        total = sum([Frequency.counts[id][type][yr] for yr in
-                     Frequency.counts[id][type].keys()])
-        return total
+        id, type = _argparser(**kwargs)
+        return int(Frequency.cumulative[id][type].values[-1])
 
     def count(self, **kwargs):
         id, type = _argparser(**kwargs)
@@ -45,31 +48,19 @@ class Frequency(object):
 
     def range_count(self, **kwargs):
         id, type = _argparser(**kwargs)
-        range = kwargs.get('range', None)
-        decade = kwargs.get('decade', None)
-        if range is None and decade is None:
+        start, end = range_bounds(range=kwargs.get('range', None),
+                                  decade=kwargs.get('decade', None))
+        if start is None:
             return 0
-        else:
-            if decade is not None:
-                decade = (decade//10) * 10
-                start, end = (decade, decade + 9)
-            else:
-                start, end = range_parser(range)
-            range_tuple = (start, end)
-            if not range_tuple in Frequency.ranges[id][type]:
-                if ((start and not end) or
-                        (start and start == end)):
-                    total = self.count(year=start, **kwargs)
-                elif start and end and end > start:
-                    total = 0
-                    year = start
-                    while year <= end:
-                        total += self.count(year=year, **kwargs)
-                        year += 1
-                else:
-                    total = 0
-                Frequency.ranges[id][type][range_tuple] = total
-            return Frequency.ranges[id][type][range_tuple]
+        return Frequency.cumulative[id][type].sum(start, end)
+
+    def range_counts(self, starts, ends, **kwargs):
+        """
+        Return an array of corpus totals for arrays of start and end
+        years (inclusive), e.g. as given by range_bounds().
+        """
+        id, type = _argparser(**kwargs)
+        return Frequency.cumulative[id][type].sums(starts, ends)
 
     def millions(self, **kwargs):
         return self.range_count(**kwargs) / 1000000
@@ -79,10 +70,33 @@ class Frequency(object):
 
     def frequency_per_million(self, **kwargs):
         count = kwargs.get('count', 0)
-        if self.millions(**kwargs) == 0:
+        millions = self.millions(**kwargs)
+        if millions == 0:
             return 0
         else:
-            return count / self.millions(**kwargs)
+            return count / millions
+
+    def frequencies_per_million(self, counts, ranges, **kwargs):
+        """
+        Vectorised version of frequency_per_million(): return an array
+        of frequencies for an array of counts.
+
+        'ranges' may be a single range (applying to all the counts), or
+        a sequence of ranges, one per count. Frequencies are 0 where
+        the corpus total for the range is 0.
+        """
+        counts = numpy.asarray(counts, dtype=float)
+        if ranges is None or isinstance(ranges, (str, int)):
+            millions = numpy.full(counts.shape,
+                                  self.millions(range=ranges, **kwargs))
+        else:
+            bounds = {range: range_bounds(range=range) for range in
+                      set(ranges)}
+            starts = numpy.array([bounds[range][0] or 0 for range in ranges])
+            ends = numpy.array([bounds[range][1] or 0 for range in ranges])
+            millions = self.range_counts(starts, ends, **kwargs) / 1000000
+        return numpy.divide(counts, millions, out=numpy.zeros(counts.shape),
+                            where=millions != 0)
 
     def decade_frequency(self, **kwargs):
         return self.frequency_per_million(**kwargs)
@@ -112,6 +126,51 @@ class Frequency(object):
                     Frequency.counts[id]['tokens'][year] = int(m.group(2))
                     Frequency.counts[id]['pages'][year] = int(m.group(3))
                     Frequency.counts[id]['books'][year] = int(m.group(4))
+            Frequency.cumulative[id] = {type: CumulativeCounts(values) for
+                                        type, values in
+                                        Frequency.counts[id].items()}
+
+
+class CumulativeCounts(object):
+
+    """
+    Prefix sums of a set of per-year counts, so that the total for
+    any range of years can be computed in constant time.
+
+    values[i] is the total for all years before first_year + i.
+    """
+
+    def __init__(self, year_counts):
+        if year_counts:
+            self.first_year = min(year_counts)
+            last_year = max(year_counts)
+        else:
+            self.first_year = last_year = 0
+        per_year = numpy.zeros(last_year - self.first_year + 1,
+                               dtype=numpy.int64)
+        for year, count in year_counts.items():
+            per_year[year - self.first_year] = count
+        self.values = numpy.concatenate(([0], numpy.cumsum(per_year)))
+
+    def sum(self, start, end):
+        """
+        Return the total for the years start to end (inclusive).
+        """
+        last = len(self.values) - 1
+        i = min(max(start - self.first_year, 0), last)
+        j = min(max(end + 1 - self.first_year, 0), last)
+        if j <= i:
+            return 0
+        return int(self.values[j] - self.values[i])
+
+    def sums(self, starts, ends):
+        """
+        Vectorised version of sum(), for arrays of start and end years.
+        """
+        last = len(self.values) - 1
+        i = numpy.clip(numpy.asarray(starts) - self.first_year, 0, last)
+        j = numpy.clip(numpy.asarray(ends) + 1 - self.first_year, 0, last)
+        return numpy.where(j > i, self.values[j] - self.values[i], 0)
 
 
 def _argparser(**kwargs):
@@ -125,6 +184,24 @@ def _argparser(**kwargs):
     return id, mode
 
 
+def range_bounds(range=None, decade=None):
+    """
+    Return the (start, end) years (inclusive) of the range or decade,
+    following the conventions of Frequency.range_count():
+    a single year is treated as a one-year range; an invalid range
+    (or no range) returns (None, None).
+    """
+    if decade is not None:
+        decade = (decade//10) * 10
+        return decade, decade + 9
+    start, end = range_parser(range)
+    if (start and not end) or (start and start == end):
+        return start, start
+    elif start and end and end > start:
+        return start, end
+    return None, None
+
+
 def range_parser(range):
     """
     Parse a range string (something like '1730-50') into
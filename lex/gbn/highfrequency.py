@@ -7,17 +7,36 @@
 # Created: 12/01/2012
 #-------------------------------------------------------------------------------
 
-import re
-import string
+import heapq
 import os
+import pickle
+import string
+import tempfile
+from itertools import islice
+from multiprocessing import Pool
 
 from .ngram import Ngram
 
 alphabet = list(string.ascii_lowercase)
 cutoff = 1
+# Number of records sorted in memory at a time by _external_sort()
+CHUNK_SIZE = 100000
+
 
 class HighFrequency(object):
+
     """
+    Build a list of the highest-frequency ngrams (1-, 2-, and 3-grams),
+    i.e. those with frequency above the cutoff in the given range,
+    ranked by frequency.
+
+    Each table file is processed by a separate task (spread across a
+    pool of worker processes), which keeps only its own top list_length
+    ngrams in a bounded heap; the per-file lists are then merged with
+    heapq.merge. So memory use is proportional to list_length * number
+    of files, not to the number of ngrams above the cutoff.
+
+    >>> HighFrequency(dir=in_dir, out_file=out_file, processes=4).process()
     """
 
     def __init__(self,
@@ -25,7 +44,9 @@ class HighFrequency(object):
                  out_file=None,
                  list_length=None,
                  range=None,
-                 cutoff=None):
+                 cutoff=None,
+                 processes=None,
+                 verbose=True):
         if list_length is None:
             list_length = 10000
         if cutoff is None:
@@ -37,80 +58,266 @@ class HighFrequency(object):
         self.list_length = list_length
         self.range = range
         self.cutoff = cutoff
+        self.processes = processes
+        self.verbose = verbose
 
-    def process(self):
-        self.hilist = []
+    def files(self):
+        """
+        Return a list of (gram_num, letter, filepath) tuples for every
+        table file, in order.
+        """
+        files = []
         for gram_num in (1, 2, 3):
             for letter in alphabet:
-                print "Doing %d/%s (%d)" % (gram_num, letter, len(self.hilist))
                 in_dir = os.path.join(self.dir, str(gram_num), letter)
-                files = os.listdir(in_dir)
-                for fname in files:
-                    with open(os.path.join(in_dir, fname), "r") as f:
-                        for line in f:
-                            n = Ngram(line, gramCount=gram_num)
-                            if (n.wordclass == "ALL" and
-                                n.frequency(self.range) > self.cutoff):
-                                self.hilist.append((n.lemma, n.frequency(self.range)))
+                if not os.path.isdir(in_dir):
+                    continue
+                for fname in sorted(os.listdir(in_dir)):
+                    if fname.endswith('.txt'):
+                        files.append((gram_num, letter,
+                                      os.path.join(in_dir, fname)))
+        return files
+
+    def process(self):
+        files = self.files()
+        tasks = [(i, filepath, gram_num, self.range, self.cutoff,
+                  self.list_length)
+                 for i, (gram_num, _, filepath) in enumerate(files)]
+        if self.processes == 1:
+            toplists = self._collect(map(_top_ngrams, tasks), files)
+        else:
+            with Pool(processes=self.processes) as pool:
+                toplists = self._collect(pool.imap(_top_ngrams, tasks),
+                                         files)
+        merged = heapq.merge(*toplists, reverse=True)
+        self.hilist = [(lemma, frequency) for frequency, _, _, lemma in
+                       islice(merged, self.list_length)]
         self.write()
 
+    def _collect(self, results, files):
+        toplists = []
+        for (gram_num, letter, filepath), toplist in zip(files, results):
+            if self.verbose:
+                print("Doing %d/%s: %s (%d)" % (gram_num, letter,
+                                               os.path.basename(filepath),
+                                               len(toplist)))
+            toplists.append(toplist)
+        return toplists
+
     def write(self):
-        self.hilist.sort(key=lambda n: n[1], reverse=True)
-        f = open(self.out_file, "w")
-        f.write("# " + self.range + "\n")
-        f.write("# cutoff = " + str(self.cutoff) + " per million\n")
-        for i, n in enumerate(self.hilist):
-            f.write(n[0] + "\t" + str(n[1]) + "\n")
-            if i == self.list_length:
-                break
-        f.close()
+        with open(self.out_file, "w") as f:
+            f.write("# " + self.range + "\n")
+            f.write("# cutoff = " + str(self.cutoff) + " per million\n")
+            for lemma, frequency in self.hilist:
+                f.write(lemma + "\t" + str(frequency) + "\n")
 
 
 class Delta(object):
 
+    """
+    Compare two frequency lists (as written by HighFrequency), writing
+    the lemmas in the second list whose frequency has increased or
+    decreased, ranked by the ratio of change. Lemmas with the same
+    ratio are listed in the order they appear in the second list.
+
+    The lists are joined by a streaming sorted-merge (each list being
+    sorted by lemma in bounded-size chunks), so neither list has to be
+    held in memory as a whole.
+    """
+
     def __init__(self, f1, f2, out_dir):
         self.files = {"f1": f1, "f2": f2}
         self.out_dir = out_dir
 
-    def load_files(self):
-        self.data = {}
-        self.min = {}
-        for fname in self.files:
-            self.data[fname] = {}
-            with open(self.files[fname], "r") as f:
-                for line in f:
-                    parts = line.split("\t")
-                    if len(parts) == 2:
-                        self.data[fname][parts[0]] = float(parts[1])
-                        self.min[fname] = float(parts[1])
-
     def compare(self):
+        # The last (i.e. lowest) frequency in the first list is used as
+        #  the old frequency for lemmas not found in the first list;
+        #  it's recorded as the first list is read for sorting.
+        last = {}
+        old = _dedupe(_external_sort(_read_list(self.files["f1"], last),
+                                     key=_lemma_key))
+        new = _dedupe(_external_sort(_read_list(self.files["f2"]),
+                                     key=_lemma_key))
+
+        # One pass over the joined lists, split into increases and
+        #  decreases, each of which is sorted by ratio
+        up = ExternalSorter(key=_ratio_key)
+        down = ExternalSorter(key=_ratio_key)
+        try:
+            for lemma, old_freq, new_freq, position in _join(old, new, last):
+                if new_freq > old_freq:
+                    up.add((lemma, old_freq, new_freq, new_freq/old_freq,
+                            position))
+                else:
+                    down.add((lemma, old_freq, new_freq, old_freq/new_freq,
+                              position))
+            for filename, sorter in (("delta_increase.txt", up),
+                                     ("delta_decrease.txt", down)):
+                with open(os.path.join(self.out_dir, filename), "w") as j:
+                    for n in sorter:
+                        j.write("%s\t%f\t%f\t%f\n" % n[0:4])
+        finally:
+            up.close()
+            down.close()
+
+
+def _top_ngrams(task):
+    """
+    Return the top list_length ngrams in a single table file (those with
+    wordclass 'ALL' and frequency above the cutoff), as a list of
+    (frequency, -file_index, -line_number, lemma) tuples sorted in
+    descending order.
+
+    Including the (negated) file index and line number means that ngrams
+    with equal frequency are ranked in the order they were read.
+    """
+    file_index, filepath, gram_num, range, cutoff, list_length = task
+    heap = []
+    with open(filepath, "r") as f:
+        for line_number, line in enumerate(f):
+            if not line.strip():
+                continue
+            n = Ngram(line, gramCount=gram_num)
+            if n.wordclass != "ALL":
+                continue
+            frequency = n.frequency(range)
+            if frequency > cutoff:
+                item = (frequency, -file_index, -line_number, n.lemma)
+                if len(heap) < list_length:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+    heap.sort(reverse=True)
+    return heap
+
+
+def _read_list(filepath, last=None):
+    """
+    Yield (lemma, frequency, position) tuples from a frequency list
+    file, where position is the record's position in the file.
+
+    If a dict is passed as 'last', the last frequency read is stored
+    in it (as last['frequency']).
+    """
+    with open(filepath, "r") as f:
+        position = 0
+        for line in f:
+            parts = line.split("\t")
+            if len(parts) == 2:
+                frequency = float(parts[1])
+                if last is not None:
+                    last['frequency'] = frequency
+                yield parts[0], frequency, position
+                position += 1
+
+
+def _lemma_key(record):
+    return record[0]
+
+
+def _ratio_key(record):
+    # Highest ratio first; ties in the original order
+    return -record[3], record[4]
+
+
+class ExternalSorter(object):
+
+    """
+    Sort records (stably) while holding at most CHUNK_SIZE of them in
+    memory: records are added one at a time with add(); each full chunk
+    is sorted and spilled to a temporary file, and iterating over the
+    sorter merges the chunks with heapq.merge.
+    """
+
+    def __init__(self, key, reverse=False):
+        self.key = key
+        self.reverse = reverse
+        self.chunk = []
+        self.chunk_files = []
+
+    def add(self, record):
+        self.chunk.append(record)
+        if len(self.chunk) >= CHUNK_SIZE:
+            self._spill()
+
+    def _spill(self):
+        self.chunk.sort(key=self.key, reverse=self.reverse)
+        chunk_file = tempfile.TemporaryFile()
+        for record in self.chunk:
+            pickle.dump(record, chunk_file)
+        chunk_file.seek(0)
+        self.chunk_files.append(chunk_file)
+        self.chunk = []
+
+    def __iter__(self):
+        if self.chunk:
+            self._spill()
+        return heapq.merge(*[_unpickle(f) for f in self.chunk_files],
+                           key=self.key, reverse=self.reverse)
+
+    def close(self):
+        for chunk_file in self.chunk_files:
+            chunk_file.close()
+        self.chunk_files = []
+
+
+def _external_sort(records, key, reverse=False):
+    """
+    Sort an iterable of records (stably), holding at most CHUNK_SIZE
+    records in memory (see ExternalSorter).
+    """
+    sorter = ExternalSorter(key=key, reverse=reverse)
+    try:
+        for record in records:
+            sorter.add(record)
+        for record in sorter:
+            yield record
+    finally:
+        sorter.close()
+
+
+def _unpickle(filehandle):
+    while True:
         try:
-            self.data
-        except AttributeError:
-            self.load_files()
-        up = []
-        down = []
-        for lemma in self.data["f2"]:
-            new_freq = self.data["f2"][lemma]
-            if lemma in self.data["f1"]:
-                old_freq = self.data["f1"][lemma]
-            else:
-                old_freq = self.min["f1"]
-            if new_freq > old_freq:
-                up.append((lemma, old_freq, new_freq, new_freq/old_freq))
-            else:
-                down.append((lemma, old_freq, new_freq, old_freq/new_freq))
-
-        up.sort(key=lambda n: n[3], reverse=True)
-        down.sort(key=lambda n: n[3], reverse=True)
-
-        out_file1 = os.path.join(self.out_dir, "delta_increase.txt")
-        with open(out_file1, "w") as j:
-            for n in up:
-                j.write("%s\t%f\t%f\t%f\n" % n)
-
-        out_file2 = os.path.join(self.out_dir, "delta_decrease.txt")
-        with open(out_file2, "w") as j:
-            for n in down:
-                j.write("%s\t%f\t%f\t%f\n" % n)
+            yield pickle.load(filehandle)
+        except EOFError:
+            return
+
+
+def _dedupe(records):
+    """
+    Collapse runs of records with the same lemma (in a lemma-sorted
+    sequence), keeping the frequency of the last occurrence in the
+    original list, but the position of the first.
+    """
+    previous = None
+    for record in records:
+        if previous is not None and previous[0] == record[0]:
+            previous = (record[0], record[1], previous[2])
+            continue
+        if previous is not None:
+            yield previous
+        previous = record
+    if previous is not None:
+        yield previous
+
+
+def _join(old, new, last):
+    """
+    Merge-join two lemma-sorted sequences of (lemma, frequency,
+    position), yielding (lemma, old_frequency, new_frequency, position)
+    for every lemma in the new sequence (using last['frequency'] if
+    the lemma is not in the old sequence).
+
+    The old sequence is started before anything else, so that the
+    whole of the old list has been read (and 'last' set) by then.
+    """
+    old_record = next(old, None)
+    old_min = last.get('frequency')
+    for lemma, new_freq, position in new:
+        while old_record is not None and old_record[0] < lemma:
+            old_record = next(old, None)
+        if old_record is not None and old_record[0] == lemma:
+            yield lemma, old_record[1], new_freq, position
+        else:
+            yield lemma, old_min, new_freq, position
@@ -6,26 +6,62 @@ import os
 from collections import defaultdict
 
 from lex import lexconfig
-from lex.gbn.ngram import Ngram
+from lex.gbn.ngram import Ngram, _parse_line
 from lex.lemma import Lemma
+from lrucache import LRUCache
 
 DEFAULT_DIR = lexconfig.NGRAMS_TABLES_DIR
+DEFAULT_CACHE_BYTES = 200 * 1024 * 1024
+# The old cache_size argument (number of prefixes cached) is converted
+#  to a memory budget, at this many bytes per prefix
 DEFAULT_CACHE_SIZE = 5
+PREFIX_CACHE_BYTES = DEFAULT_CACHE_BYTES // DEFAULT_CACHE_SIZE
+INDEX_EXTENSION = '.idx'
+# Rough estimate of the memory used by an Ngram object, over and
+#  above the length of the line it's parsed from
+NGRAM_OVERHEAD = 600
+INDEX_OVERHEAD = 120
 
 
 class NgramFinder(object):
 
     """
     Find the ngram for a given word
+
+    Lookups are cached (in a least-recently-used cache shared by all
+    NgramFinder instances), up to a memory budget set by the
+    cache_bytes argument. (The older cache_size argument, giving the
+    number of prefixes to be cached, is still accepted, and is
+    converted to a budget of cache_size * PREFIX_CACHE_BYTES.)
+
+    Each table file has a prefix index (stored alongside the file,
+    with an .idx extension) giving the offset and length of the lines
+    for each sortcode, so that a single sortcode can be read without
+    loading the whole file. Indexes are built the first time a file is
+    used (or when the file has changed since); use build_indexes()
+    to build them all in advance.
+
+    >>> finder = NgramFinder(cache_bytes=50000000)
+    >>> finder.find_exact('aardvark', 'NOUN')
+    >>> NgramFinder.stats()
     """
 
-    cache = {}
-    cache_size = 5
-    call_num = 0
+    cache = LRUCache(max_bytes=DEFAULT_CACHE_BYTES)
 
     def __init__(self, **kwargs):
-        self.cache_size = int(kwargs.get('cache_size', DEFAULT_CACHE_SIZE))
         self.dir = kwargs.get('dir', DEFAULT_DIR)
+        cache_bytes = kwargs.get('cache_bytes')
+        if cache_bytes is None and kwargs.get('cache_size') is not None:
+            cache_bytes = int(kwargs.get('cache_size')) * PREFIX_CACHE_BYTES
+        if cache_bytes is not None:
+            NgramFinder.cache.resize(max_bytes=int(cache_bytes))
+
+    @staticmethod
+    def stats():
+        """
+        Return a dict of cache hits, misses, evictions, size, and bytes.
+        """
+        return NgramFinder.cache.stats()
 
     def find_exact(self, word, wordclass=None):
         if wordclass is None:
@@ -46,32 +82,216 @@ class NgramFinder(object):
         initial = lemma_manager.initial()
         prefix = lemma_manager.prefix()
         dsort = lemma_manager.lexical_sort()
-        if not prefix in NgramFinder.cache:
-            self.update_cache(initial, prefix)
-        NgramFinder.call_num += 1
-        NgramFinder.cache[prefix]["call_num"] = NgramFinder.call_num
-        return NgramFinder.cache[prefix]["grams"].get(dsort, [])
-
-    def update_cache(self, initial, prefix):
-        # Find the cache key last used longest ago (i.e. has the lowest
-        #  call number), and drop it
-        while len(NgramFinder.cache.keys()) >= NgramFinder.cache_size:
-            ranking = [(prefix, NgramFinder.cache[prefix]["call_num"])
-                       for prefix in NgramFinder.cache]
-            ranking.sort(key=lambda z: z[1])
-            del(NgramFinder.cache[ranking[0][0]])
-
-        # Create a new cache key for the current prefix
-        NgramFinder.cache[prefix] = {
-            "call_num": NgramFinder.call_num,
-            "grams": defaultdict(list),
-        }
+        ngrams = []
+        for gram_num in (1, 2, 3):
+            filepath = self.filepath(initial, prefix, gram_num)
+            ngrams.extend(self._find_in_file(filepath, gram_num, dsort))
+        return ngrams
+
+    def find_many(self, words, wordclass=None, executor=None):
+        """
+        Find the ngrams for a batch of words; returns a dict mapping
+        each word to a list of ngrams (as find_all()).
+
+        Words are grouped by prefix, so that each table file is opened
+        at most once, and all the words sharing that file are read in
+        a single pass through it.
+
+        If an executor (e.g. a concurrent.futures.ThreadPoolExecutor or
+        ProcessPoolExecutor) is supplied, the table files are read in
+        parallel using executor.map().
+        """
+        groups = defaultdict(dict)
+        for word in set(words):
+            lemma_manager = Lemma(word)
+            groups[(lemma_manager.initial(), lemma_manager.prefix())][word] = \
+                lemma_manager.lexical_sort()
+
+        # One task per table file, covering all the sortcodes needed
+        #  from that file which are not already cached
+        found = {}
+        tasks = []
+        for (initial, prefix), group in groups.items():
+            for gram_num in (1, 2, 3):
+                filepath = self.filepath(initial, prefix, gram_num)
+                sortcodes = []
+                for sortcode in set(group.values()):
+                    ngrams = NgramFinder.cache.get(('grams', filepath,
+                                                    sortcode))
+                    if ngrams is None:
+                        sortcodes.append(sortcode)
+                    else:
+                        found[(filepath, sortcode)] = ngrams
+                if sortcodes:
+                    index = self.prefix_index(filepath)
+                    spans = {sortcode: index.get(sortcode, [])
+                             for sortcode in sortcodes}
+                    tasks.append((filepath, gram_num, spans))
+
+        if executor is not None:
+            loaded = executor.map(_read_file_spans, tasks)
+        else:
+            loaded = map(_read_file_spans, tasks)
+        for (filepath, _, _), block in zip(tasks, loaded):
+            for sortcode, ngrams in block.items():
+                found[(filepath, sortcode)] = ngrams
+                NgramFinder.cache.put(('grams', filepath, sortcode), ngrams,
+                                      size=_ngrams_size(ngrams))
 
+        results = {}
+        for (initial, prefix), group in groups.items():
+            for word, sortcode in group.items():
+                ngrams = []
+                for gram_num in (1, 2, 3):
+                    filepath = self.filepath(initial, prefix, gram_num)
+                    ngrams.extend(found[(filepath, sortcode)])
+                if wordclass is not None:
+                    ngrams = [n for n in ngrams if n.wordclass == wordclass]
+                results[word] = ngrams
+        return results
+
+    def filepath(self, initial, prefix, gram_num):
+        fname = "%s-%dgram.txt" % (prefix, gram_num)
+        return os.path.join(self.dir, str(gram_num), initial, fname)
+
+    def _find_in_file(self, filepath, gram_num, sortcode):
+        key = ('grams', filepath, sortcode)
+        ngrams = NgramFinder.cache.get(key)
+        if ngrams is None:
+            spans = self.prefix_index(filepath).get(sortcode, [])
+            ngrams = _read_file_spans((filepath, gram_num,
+                                       {sortcode: spans}))[sortcode]
+            NgramFinder.cache.put(key, ngrams, size=_ngrams_size(ngrams))
+        return ngrams
+
+    def prefix_index(self, filepath):
+        """
+        Return the prefix index for a table file, as a dict mapping
+        each sortcode to a list of (offset, length) spans.
+
+        Returns an empty dict if the file does not exist.
+        """
+        key = ('index', filepath)
+        index = NgramFinder.cache.get(key)
+        if index is None:
+            index = _load_index(filepath)
+            NgramFinder.cache.put(key, index, size=_index_size(index))
+        return index
+
+    def build_indexes(self, verbose=False):
+        """
+        Build (or rebuild, if stale) the prefix index for every table
+        file in the directory.
+        """
         for gram_num in (1, 2, 3):
-            fname = "%s-%dgram.txt" % (prefix, gram_num)
-            filepath = os.path.join(self.dir, str(gram_num), initial, fname)
-            if os.path.isfile(filepath):
-                with open(filepath) as filehandle:
-                    for line in filehandle:
-                        n = Ngram(line, gramCount=gram_num)
-                        NgramFinder.cache[prefix]["grams"][n.sortcode].append(n)
+            gram_dir = os.path.join(self.dir, str(gram_num))
+            if not os.path.isdir(gram_dir):
+                continue
+            for initial in sorted(os.listdir(gram_dir)):
+                letter_dir = os.path.join(gram_dir, initial)
+                if not os.path.isdir(letter_dir):
+                    continue
+                for fname in sorted(os.listdir(letter_dir)):
+                    if fname.endswith('gram.txt'):
+                        if verbose:
+                            print('Indexing %s...' % fname)
+                        _load_index(os.path.join(letter_dir, fname))
+
+
+def _index_filepath(filepath):
+    return os.path.splitext(filepath)[0] + INDEX_EXTENSION
+
+
+def _load_index(filepath):
+    """
+    Load the prefix index for a table file, building it first if
+    it's missing or stale.
+
+    The first line of the index records the size and modification
+    time of the table file it was built from; if either has changed,
+    the index is rebuilt.
+    """
+    if not os.path.isfile(filepath):
+        return {}
+    index_filepath = _index_filepath(filepath)
+    if os.path.isfile(index_filepath):
+        index = {}
+        with open(index_filepath, encoding='utf-8') as filehandle:
+            if filehandle.readline().rstrip('\n') == _index_header(filepath):
+                for line in filehandle:
+                    sortcode, offset, length = line.rstrip('\n').split('\t')
+                    index.setdefault(sortcode, []).append((int(offset),
+                                                           int(length)))
+                return index
+    return _build_index(filepath, index_filepath)
+
+
+def _index_header(filepath):
+    stat = os.stat(filepath)
+    return '#\t%d\t%d' % (stat.st_size, stat.st_mtime_ns)
+
+
+def _build_index(filepath, index_filepath):
+    """
+    Scan a table file, recording the (offset, length) of each run of
+    lines with the same sortcode; write the index to disk (if the
+    directory is writable) and return it.
+    """
+    gram_num = int(os.path.basename(filepath).split('-')[-1][0])
+    runs = []
+    offset = 0
+    with open(filepath, 'rb') as filehandle:
+        for line in filehandle:
+            if line.strip():
+                sortcode = _parse_line(line.decode('utf-8'), gram_num)[3]
+                if runs and runs[-1][0] == sortcode:
+                    runs[-1][2] += len(line)
+                else:
+                    runs.append([sortcode, offset, len(line)])
+            offset += len(line)
+
+    index = {}
+    for sortcode, offset, length in runs:
+        index.setdefault(sortcode, []).append((offset, length))
+
+    tmp_filepath = index_filepath + '.tmp'
+    try:
+        with open(tmp_filepath, 'w', encoding='utf-8') as filehandle:
+            filehandle.write(_index_header(filepath) + '\n')
+            for sortcode, offset, length in runs:
+                filehandle.write('%s\t%d\t%d\n' % (sortcode, offset, length))
+        os.replace(tmp_filepath, index_filepath)
+    except OSError:
+        # Read-only directory: just keep the index in memory
+        pass
+    return index
+
+
+def _read_file_spans(task):
+    """
+    Read the ngrams for several sortcodes from a single table file,
+    in one pass through the file; returns a dict mapping each sortcode
+    to a list of ngrams.
+    """
+    filepath, gram_num, spans = task
+    found = {sortcode: [] for sortcode in spans}
+    requests = sorted([(offset, length, sortcode) for sortcode, span_list
+                       in spans.items() for offset, length in span_list])
+    if not requests:
+        return found
+    with open(filepath, 'rb') as filehandle:
+        for offset, length, sortcode in requests:
+            filehandle.seek(offset)
+            for line in filehandle.read(length).decode('utf-8').split('\n'):
+                if line.strip():
+                    found[sortcode].append(Ngram(line, gramCount=gram_num))
+    return found
+
+
+def _ngrams_size(ngrams):
+    return sum([len(n.line) + NGRAM_OVERHEAD for n in ngrams]) or 1
+
+
+def _index_size(index):
+    return sum([len(sortcode) + INDEX_OVERHEAD * len(spans)
+                for sortcode, spans in index.items()]) or 1
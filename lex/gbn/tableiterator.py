@@ -1,63 +1,97 @@
-"""
-TableIterator: iterates over tables of Google Ngrams data
-"""
-
-import re
-import os
-
-from lex import lexconfig
-from lex.gbn.ngram import Ngram
-
-DIRECTORY = lexconfig.NGRAMS_TABLES_DIR
-
-
-class TableIterator(object):
-
-    """
-    Iterate over tables of Google Ngrams data
-    """
-
-    def __init__(self, **kwargs):
-        self.verbose = kwargs.get('verbose', False)
-        self.gram_count = kwargs.get('gramCount', 1)
-
-        letter = kwargs.get('letter')
-        self.path = os.path.join(DIRECTORY, str(self.gram_count), letter)
-
-        # Probably only used for diagnostics - if you just want to
-        # process one or two files in the directory
-        file_filter = kwargs.get('fileFilter')
-        if file_filter:
-            self.filecheck_pattern = re.compile(file_filter)
-        else:
-            self.filecheck_pattern = None
-
-    def files(self):
-        try:
-            return self._files
-        except AttributeError:
-            files = [os.path.join(self.path, fname) for fname in
-                     os.listdir(self.path) if
-                     os.path.splitext(fname)[1] == '.txt']
-            self._files = [f for f in files if self.filecheck(f)]
-            return self._files
-
-    def filecheck(self, filepath):
-        if (self.filecheck_pattern and
-            not self.filecheck_pattern.search(filepath)):
-            return False
-        else:
-            return True
-
-    def file_count(self):
-        return len(self.files())
-
-    def iterate(self):
-        for filepath in self.files():
-            if self.verbose:
-                print('Reading %s...' % filepath)
-            with open(filepath, 'r') as filehandle:
-                lines = filehandle.readlines()
-            for line in lines:
-                n = Ngram(line, gramCount=self.gram_count)
-                yield n
+"""
+TableIterator: iterates over tables of Google Ngrams data
+"""
+
+import re
+import os
+
+from lex import lexconfig
+from lex.gbn.ngram import Ngram
+from lex.gbn.columnar import ColumnarTable, META_FILE
+
+DIRECTORY = lexconfig.NGRAMS_TABLES_DIR
+COLUMNAR_DIRECTORY = lexconfig.NGRAMS_COLUMNAR_DIR
+
+
+class TableIterator(object):
+
+    """
+    Iterate over tables of Google Ngrams data
+
+    If columnar=True, iterates over columnar tables (see
+    lex.gbn.columnar) rather than the text tables; in this case
+    iterate() yields lightweight NgramView objects rather than Ngram
+    objects, and tables() can be used to get whole ColumnarTable
+    objects (for computing counts and frequencies per table).
+    """
+
+    def __init__(self, **kwargs):
+        self.verbose = kwargs.get('verbose', False)
+        self.gram_count = kwargs.get('gramCount', 1)
+        self.columnar = kwargs.get('columnar', False)
+
+        letter = kwargs.get('letter')
+        if self.columnar:
+            directory = kwargs.get('path') or COLUMNAR_DIRECTORY
+        else:
+            directory = kwargs.get('path') or DIRECTORY
+        self.path = os.path.join(directory, str(self.gram_count), letter)
+
+        # Probably only used for diagnostics - if you just want to
+        # process one or two files in the directory
+        file_filter = kwargs.get('fileFilter')
+        if file_filter:
+            self.filecheck_pattern = re.compile(file_filter)
+        else:
+            self.filecheck_pattern = None
+
+    def files(self):
+        try:
+            return self._files
+        except AttributeError:
+            if self.columnar:
+                files = [os.path.join(self.path, fname) for fname in
+                         sorted(os.listdir(self.path)) if
+                         os.path.isfile(os.path.join(self.path, fname,
+                                                     META_FILE))]
+            else:
+                files = [os.path.join(self.path, fname) for fname in
+                         os.listdir(self.path) if
+                         os.path.splitext(fname)[1] == '.txt']
+            self._files = [f for f in files if self.filecheck(f)]
+            return self._files
+
+    def filecheck(self, filepath):
+        if (self.filecheck_pattern and
+            not self.filecheck_pattern.search(filepath)):
+            return False
+        else:
+            return True
+
+    def file_count(self):
+        return len(self.files())
+
+    def iterate(self):
+        if self.columnar:
+            for table in self.tables():
+                for ngram in table:
+                    yield ngram
+            return
+        for filepath in self.files():
+            if self.verbose:
+                print('Reading %s...' % filepath)
+            with open(filepath, 'r') as filehandle:
+                lines = filehandle.readlines()
+            for line in lines:
+                n = Ngram(line, gramCount=self.gram_count)
+                yield n
+
+    def tables(self):
+        """
+        Iterate over columnar tables, yielding a ColumnarTable object
+        for each (only if columnar=True).
+        """
+        for filepath in self.files():
+            if self.verbose:
+                print('Reading %s...' % filepath)
+            yield ColumnarTable(filepath)
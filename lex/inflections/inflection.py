@@ -17,29 +17,29 @@ INFLECTION_PATTERNS = {
     'VBZ': ReplacementListCompiler((
         (r'([sxz]|sh|ch)$', r'\1es'),
         (r'([^aeiou])y$', r'\1ies'),
-        (r'$', r's'))),
+        (r'$', r's')), fused=True),
     'VBG': ReplacementListCompiler((
         (r'e$', r'ing'),
         (CONSONANT_DOUBLING, r'\1\2\2ing'),
         (R_DOUBLING, r'\1rring'),
-        (r'$', r'ing'))),
+        (r'$', r'ing')), fused=True),
     'VBGus': ReplacementListCompiler((
         (r'e$', r'ing'),
         (CONSONANT_DOUBLING_US, r'\1\2\2ing'),
         (R_DOUBLING, r'\1rring'),
-        (r'$', r'ing'))),
+        (r'$', r'ing')), fused=True),
     'VBD': ReplacementListCompiler((
         ('(e|\u00e9)$', r'\1d'),
         (r'([^aeiou])y$', r'\1ied'),
         (CONSONANT_DOUBLING, r'\1\2\2ed'),
         (R_DOUBLING, r'\1rred'),
-        (r'$', r'ed'))),
+        (r'$', r'ed')), fused=True),
     'VBDus': ReplacementListCompiler((
         ('(e|\u00e9)$', r'\1d'),
         (r'([^aeiou])y$', r'\1ied'),
         (CONSONANT_DOUBLING_US, r'\1\2\2ed'),
         (R_DOUBLING, r'\1rred'),
-        (r'$', r'ed'))),
+        (r'$', r'ed')), fused=True),
     'NNS': ReplacementListCompiler((
         (r'([aoy])sis$', r'\1ses'),
         (r'thesis$', r'theses'),
@@ -60,37 +60,37 @@ INFLECTION_PATTERNS = {
         (r'loaf$', r'loaves'),
         (r'([^\'][sxz]|sh|ch)$', r'\1es'),
         (r'([^aeiou])y$', r'\1ies'),
-        (r'([^A-Z\' 0-9.,?!-])$', r'\1s'))),
+        (r'([^A-Z\' 0-9.,?!-])$', r'\1s')), fused=True),
     'NNSarchaic': ReplacementListCompiler((
         (r'chylde?$', r'chyldren'),
         (r'(l|w|kn)yfe?$', r'\1yves'),
         (r'([^aeiou])ye$', r'\1ies'),
         (r'([^ei])z$', r'\1z'),
-        (r'ma(nne?)$', r'me\1'))),
+        (r'ma(nne?)$', r'me\1')), fused=True),
     'JJR': ReplacementListCompiler((
         (r'e$', r'er'),
         (r'([^aeiou])y$', r'\1ier'),
         (CONSONANT_DOUBLING, r'\1\2\2er'),
         (R_DOUBLING, r'\1rrer'),
-        (r'$', r'er'))),
+        (r'$', r'er')), fused=True),
     'JJS': ReplacementListCompiler((
         (r'e$', r'est'),
         (r'([^aeiou])y$', r'\1iest'),
         (CONSONANT_DOUBLING, r'\1\2\2est'),
         (R_DOUBLING, r'\1rrest'),
-        (r'$', r'est'))),
+        (r'$', r'est')), fused=True),
     'JJRus': ReplacementListCompiler((
         (r'e$', r'er'),
         (r'([^aeiou])y$', r'\1ier'),
         (CONSONANT_DOUBLING_US, r'\1\2\2er'),
         (R_DOUBLING, r'\1rrer'),
-        (r'$', r'er'))),
+        (r'$', r'er')), fused=True),
     'JJSus': ReplacementListCompiler((
         (r'e$', r'est'),
         (r'([^aeiou])y$', r'\1iest'),
         (CONSONANT_DOUBLING_US, r'\1\2\2est'),
         (R_DOUBLING, r'\1rrest'),
-        (r'$', r'est'))),
+        (r'$', r'est')), fused=True),
 }
 INFLECTION_PATTERNS['RBR'] = INFLECTION_PATTERNS['JJR']
 INFLECTION_PATTERNS['RBS'] = INFLECTION_PATTERNS['JJS']
@@ -68,3 +68,4 @@ GEL_DATA_DIR = os.path.join(GEL_DIR, 'globalEnglishLexicon/data')
 #======================================================
 
 NGRAMS_TABLES_DIR = os.path.join(NGRAMS_DIR, 'tables', 'sorted')
+NGRAMS_COLUMNAR_DIR = os.path.join(NGRAMS_DIR, 'tables', 'columnar')
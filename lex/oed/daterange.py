@@ -228,7 +228,7 @@ class DateRange(object):
         else:
             return fuzzed_year
 
-    def constrain(self, window, kwargs):
+    def constrain(self, window, **kwargs):
         """
         Constrain the dates to a given start/end window.
 
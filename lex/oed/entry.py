@@ -9,6 +9,7 @@ import re
 from lxml import etree
 
 from lex.oed.multisensecomponent import MultiSenseComponent
+from lex.oed.entryskeleton import EntrySkeleton
 from lex.oed.s1block import S1block
 from lex.oed.etymology import Etymology
 from lex.oed.variants.formslist import FormsList
@@ -215,6 +216,7 @@ class Entry(MultiSenseComponent):
                               for n in self.node.findall('./senseSect/s1')]
             for block in self._s1blocks:
                 block.is_revised = self.is_revised
+                block.set_skeleton_owner(self)
 
             # If the entry is obsolete, then all blocks must be obsolete
             if self.is_marked_obsolete():
@@ -232,6 +234,28 @@ class Entry(MultiSenseComponent):
                 self._s1blocks[0].set_dates(self.date())
             return self._s1blocks
 
+    def skeleton(self):
+        """
+        Return an EntrySkeleton (a flat index of the entry's structure),
+        used to speed up SemanticComponent.thinned_year_list() and
+        ancestor lookups for the entry and its blocks and senses.
+        """
+        try:
+            return self._skeleton
+        except AttributeError:
+            self._skeleton = EntrySkeleton(self.node)
+            return self._skeleton
+
+    def reset_skeleton(self):
+        """
+        Discard the entry's skeleton (e.g. after the tree has been
+        modified), so that it will be rebuilt when next needed.
+        """
+        try:
+            del self._skeleton
+        except AttributeError:
+            pass
+
     def paired_with(self):
         """
         Return the ID of the entry that this entry is etymologically
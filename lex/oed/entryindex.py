@@ -0,0 +1,221 @@
+"""
+EntryIndex -- Random-access lookup of OED entries by ID or headword
+EntryIndexBuilder -- Build the byte-offset index used by EntryIndex
+
+@author: James McCracken
+"""
+
+import os
+import csv
+import mmap
+from collections import defaultdict, namedtuple
+
+from lex.entryiterator import EntryIterator, ENTRY_PATTERNS_BYTES
+from lex.oed.entry import Entry
+from stringtools import lexical_sort
+
+IndexRecord = namedtuple('IndexRecord', ['id', 'sortkeys', 'homograph',
+                                         'wordclasses', 'file', 'offset',
+                                         'length'])
+
+
+class EntryIndex(object):
+
+    """
+    Random-access lookup of OED entries, using an index (built by
+    EntryIndexBuilder) which records the byte offset and length of
+    every entry in the OED text files.
+
+    Only the line containing the requested entry is read (via mmap)
+    and parsed, so a lookup doesn't need to scan the whole file.
+
+    Usage:
+    >>> index = EntryIndex('/path/to/entry_index.csv')
+    >>> entry = index.get(100457)
+    >>> for entry in index.find('jabber', wordclass='VB'):
+            print(entry.label())
+
+    Keyword arguments:
+     -- fix_ligatures: If True, ligatures are converted to plain
+            ASCII when the entry is parsed (see EntryIterator).
+    """
+
+    def __init__(self, index_file, **kwargs):
+        self.index_file = index_file
+        self.fix_ligatures = (kwargs.get('fix_ligatures') or
+                              kwargs.get('fixLigatures') or False)
+        self.ids = {}
+        self.sortkeys = defaultdict(list)
+        self._maps = {}
+        self._load()
+
+    def _load(self):
+        with open(self.index_file) as filehandle:
+            for row in csv.reader(filehandle):
+                record = IndexRecord(row[0],
+                                     row[1].split('|'),
+                                     int(row[2]) if row[2] else None,
+                                     row[3].split('|') if row[3] else [],
+                                     row[4],
+                                     int(row[5]),
+                                     int(row[6]))
+                self.ids[record.id] = record
+                for sortkey in record.sortkeys:
+                    self.sortkeys[sortkey].append(record)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, entry_id):
+        return str(entry_id) in self.ids
+
+    def close(self):
+        """
+        Close any files that have been memory-mapped.
+        """
+        for mapped, filehandle in self._maps.values():
+            mapped.close()
+            filehandle.close()
+        self._maps = {}
+
+    def record(self, entry_id):
+        """
+        Return the index record for a given entry ID (or None if the
+        ID is not in the index).
+        """
+        return self.ids.get(str(entry_id))
+
+    def get(self, entry_id):
+        """
+        Return the Entry object for a given entry ID (or None if the
+        ID is not in the index).
+        """
+        record = self.record(entry_id)
+        if record is None:
+            return None
+        return self._parse(record)
+
+    def find(self, headword, **kwargs):
+        """
+        Return a list of Entry objects for entries whose headword
+        matches the lexical sort of the argument.
+
+        Keyword arguments:
+         -- wordclass: If supplied, only entries with this wordclass
+              (Penn-style, e.g. 'NN', 'VB') are returned.
+         -- homograph: If supplied, only entries with this homograph
+              number are returned.
+        """
+        return [self._parse(record) for record in
+                self.find_records(headword, **kwargs)]
+
+    def find_records(self, headword, **kwargs):
+        """
+        Return a list of index records matching a headword, without
+        parsing the entries themselves. Takes the same keyword arguments
+        as EntryIndex.find().
+        """
+        wordclass = kwargs.get('wordclass')
+        homograph = kwargs.get('homograph')
+        records = self.sortkeys.get(lexical_sort(headword), [])
+        if wordclass is not None:
+            records = [r for r in records if wordclass in r.wordclasses]
+        if homograph is not None:
+            records = [r for r in records if r.homograph == int(homograph)]
+        return records
+
+    def raw(self, record):
+        """
+        Return the serialized XML of the entry for a given index record.
+        """
+        mapped = self._map(record.file)
+        line = mapped[record.offset:record.offset + record.length]
+        return line.decode('utf-8').strip()
+
+    def _parse(self, record):
+        return Entry(self.raw(record), fix_ligatures=self.fix_ligatures)
+
+    def _map(self, filepath):
+        try:
+            return self._maps[filepath][0]
+        except KeyError:
+            filehandle = open(filepath, 'rb')
+            mapped = mmap.mmap(filehandle.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[filepath] = (mapped, filehandle)
+            return mapped
+
+
+class EntryIndexBuilder(object):
+
+    """
+    Build an index of the byte offset and length of every entry in
+    a set of OED text files, for use by EntryIndex.
+
+    >>> builder = EntryIndexBuilder(path=in_dir, index_file=index_file)
+    >>> builder.build()
+
+    Keyword arguments:
+     -- index_file: file to which the index will be written (CSV).
+     -- path, file_filter, verbosity: as for EntryIterator; these
+          determine which text files get indexed.
+    """
+
+    def __init__(self, **kwargs):
+        self.index_file = kwargs.pop('index_file')
+        self.verbosity = kwargs.get('verbosity', None)
+        kwargs['dict_type'] = 'oed'
+        self.iterator = EntryIterator(**kwargs)
+
+    def build(self):
+        """
+        Scan each text file, and write the index.
+
+        Returns the number of entries indexed.
+        """
+        count = 0
+        with open(self.index_file, 'w') as filehandle:
+            csv_writer = csv.writer(filehandle)
+            for filepath in self.iterator.files():
+                if self.verbosity is not None:
+                    print('Indexing %s...' % filepath)
+                for row in _index_file(os.path.abspath(filepath)):
+                    csv_writer.writerow(row)
+                    count += 1
+        return count
+
+
+def _index_file(filepath):
+    """
+    Yield an index row for each entry in a text file.
+    """
+    pattern = ENTRY_PATTERNS_BYTES['oed']
+    offset = 0
+    with open(filepath, 'rb') as filehandle:
+        for line in filehandle:
+            if pattern.match(line):
+                entry = Entry(line.decode('utf-8').strip())
+                yield (entry.id,
+                       '|'.join(_sortkeys(entry)),
+                       _homograph(entry) or '',
+                       '|'.join([w.penn for w in entry.wordclasses()
+                                 if w.penn]),
+                       filepath,
+                       offset,
+                       len(line))
+            offset += len(line)
+
+
+def _sortkeys(entry):
+    sortkeys = []
+    for headword in entry.headwords() or [entry.lemma_manager()]:
+        sortkey = headword.lexical_sort()
+        if sortkey not in sortkeys:
+            sortkeys.append(sortkey)
+    return sortkeys
+
+
+def _homograph(entry):
+    ps_node = entry.node.find('./senseSect/s1/ps')
+    if ps_node is not None and ps_node.get('hm'):
+        return int(ps_node.get('hm'))
+    return None
@@ -0,0 +1,169 @@
+"""
+EntrySkeleton -- Flat index of an OED entry's structure
+
+@author: James McCracken
+"""
+
+from lex.entrycomponent import Ancestor
+from lex.oed.quotation.citation import _parse_year
+
+
+class EntrySkeleton(object):
+
+    """
+    Flat index of an OED entry's structure, shared by the entry and
+    all its blocks and senses.
+
+    Records:
+     -- for every quotation paragraph (<qp>), in document order, the
+        sorted list of quotation years (excluding suppressed, bracketed,
+        and undated quotations);
+     -- for every element containing quotation paragraphs (entry,
+        blocks, and sense units), the range of quotation paragraphs
+        that it contains (so SemanticComponent.thinned_year_list() can
+        be computed without instantiating any Quotation or Citation
+        objects, and quotation_paragraphs() without searching the
+        tree);
+     -- every sense unit, in document order, and for every element
+        containing sense units, the range of sense units that it
+        contains (for MultiSenseComponent.senses());
+     -- the chain of ancestors (tag and ID) for each element that has
+        been looked up, so that components which share ancestors share
+        the same chain, rather than each walking up the tree
+        (see EntryComponent.ancestors()).
+
+    The quotation and sense indexes are built in one pass, the first
+    time either is needed; ancestor chains are filled in as they're
+    requested.
+
+    The skeleton is a snapshot of the tree when it was built; if the
+    tree is subsequently modified, the entry's skeleton should be
+    reset (see Entry.reset_skeleton()).
+    """
+
+    def __init__(self, node):
+        self.node = node
+        self._chains = {}
+
+    def _build_index(self):
+        self._qp_nodes = list(self.node.iter('qp'))
+        self._qp_years = [_qp_years(qp_node) for qp_node in self._qp_nodes]
+        self._qp_ranges = _descendant_ranges(self._qp_nodes)
+        self._sense_nodes = self.node.xpath('.//*[@senseUnit="true"]')
+        self._sense_units = set(self._sense_nodes)
+        self._sense_ranges = _descendant_ranges(self._sense_nodes)
+
+    def _index(self):
+        try:
+            self._qp_nodes
+        except AttributeError:
+            self._build_index()
+
+    def year_lists(self, sense_node):
+        """
+        Return a list of year-lists (one per quotation paragraph)
+        for a sense unit.
+
+        Returns None if the node is not a sense unit in this entry.
+        """
+        self._index()
+        if not sense_node in self._sense_units:
+            return None
+        first, last = self._qp_ranges.get(sense_node, (0, 0))
+        return self._qp_years[first:last]
+
+    def qp_nodes(self, node):
+        """
+        Return a list of the quotation paragraph (<qp>) nodes within
+        the node, in document order (cf. node.findall('.//qp')).
+
+        Returns None if the node is not in this entry.
+        """
+        self._index()
+        if not self._contains(node):
+            return None
+        first, last = self._qp_ranges.get(node, (0, 0))
+        return self._qp_nodes[first:last]
+
+    def sense_nodes(self, node):
+        """
+        Return a list of the sense-unit nodes within the node, in
+        document order (cf. node.xpath('.//*[@senseUnit="true"]')).
+
+        Returns None if the node is not in this entry.
+        """
+        self._index()
+        if not self._contains(node):
+            return None
+        first, last = self._sense_ranges.get(node, (0, 0))
+        return self._sense_nodes[first:last]
+
+    def _contains(self, node):
+        if node is self.node:
+            return True
+        return any([ancestor is self.node
+                    for ancestor in node.iterancestors()])
+
+    def ancestors(self, node):
+        """
+        Return a list of Ancestor namedtuples (tag, lexid) for the
+        node, in ascending order (not including the node itself).
+        """
+        return list(self._chain(node.getparent()))
+
+    def _chain(self, node):
+        """
+        Return a tuple of Ancestor namedtuples for the node *and* each
+        of its ancestors (memoized, so that the chain for each node
+        only gets computed once).
+        """
+        if node is None:
+            return ()
+        try:
+            return self._chains[node]
+        except KeyError:
+            node_id = (node.get('eid') or node.get('e:id') or
+                       node.get('lexid') or None)
+            chain = ((Ancestor(node.tag, node_id),) +
+                     self._chain(node.getparent()))
+            self._chains[node] = chain
+            return chain
+
+
+def _descendant_ranges(nodes):
+    """
+    Given a list of nodes in document order, return a dict mapping
+    each of their ancestors to the (start, end) range of the nodes
+    that it contains. (Since the descendants of any element are
+    contiguous in document order, each is a simple slice.)
+    """
+    ranges = {}
+    for i, node in enumerate(nodes):
+        for ancestor in node.iterancestors():
+            try:
+                ranges[ancestor][1] = i + 1
+            except KeyError:
+                ranges[ancestor] = [i, i + 1]
+    return ranges
+
+
+def _qp_years(qp_node):
+    """
+    Return a sorted list of the years of the quotations in a quotation
+    paragraph, omitting suppressed, bracketed, and undated quotations
+    (cf. SemanticComponent.thinned_year_list()).
+    """
+    years = []
+    for q_node in qp_node.iterchildren(tag='q'):
+        if q_node.get('supp') or q_node.get('suppressed'):
+            continue
+        if q_node.get('info', 'no').lower() in ('yes', 'intro'):
+            continue
+        cit_node = q_node.find('./cit')
+        if cit_node is None:
+            continue
+        year = _parse_year(cit_node)
+        if year > 0:
+            years.append(year)
+    years.sort()
+    return years
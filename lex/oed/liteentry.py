@@ -0,0 +1,131 @@
+"""
+LiteEntry -- Partially-materialized OED entry
+
+@author: James McCracken
+"""
+
+import re
+
+from lxml import etree
+
+from lex.entrycomponent import LIGATURE_FIXES
+from lex.oed.entry import Entry
+
+OPEN_TAG_PATTERN = re.compile(r'^\s*<Entry\b[^>]*?>')
+HWSECT_PATTERN = re.compile(r'<hwSect\b.*?</hwSect>', re.S)
+PUBINFO_PATTERN = re.compile(r'<publicationInfo\b.*?</publicationInfo>', re.S)
+# <ps> elements are always the first children of an <s1>
+S1_PS_PATTERN = re.compile(r'<s1\b[^>]*>((?:<ps\b[^>]*?(?:/>|>.*?</ps>))+)')
+PS_PATTERN = re.compile(r'<ps\b[^>]*?(?:/>|>.*?</ps>)')
+
+# Methods and attributes that LiteEntry answers from the partial tree;
+#  anything else triggers a full parse of the entry
+LITE_FIELDS = {
+    'id', 'is_revised', 'num', 'attributes', 'tag', 'attribute',
+    'node_id', 'lexid', 'eid', 'refid',
+    'headwords', 'lemma_manager', 'headword', 'lemma', 'label',
+    'characteristics', 'characteristic_list', 'characteristic_first',
+    'characteristic_leaves', 'characteristic_nodes', 'characteristic_heads',
+    'wordclasses', 'primary_wordclass', 'is_marked_obsolete',
+    'first_published',
+}
+
+
+class LiteEntry(object):
+
+    """
+    Partially-materialized version of lex.oed.entry.Entry, for use
+    when a pass over the dictionary only needs the entry ID, the
+    headword(s), the entry's characteristics ('ch_' attributes),
+    part(s) of speech, and date range.
+
+    Rather than parsing the whole entry, LiteEntry pulls out the
+    opening <Entry> tag, <hwSect>, <publicationInfo>, and the <ps>
+    elements of each <s1>, and parses these into a skeleton tree.
+    Fields listed in LITE_FIELDS (plus date()) are answered from the
+    skeleton; accessing anything else causes the full entry to be
+    parsed (once), and the request is then passed on to the full Entry
+    object. Once the full entry has been parsed, the lite fields come
+    from it too (so that they reflect any changes made to it). So a
+    LiteEntry can be used as a drop-in replacement for Entry, but is
+    only faster if callers stick to the lite fields.
+
+    Usage:
+    >>> iterator = EntryIterator(path=in_dir, dict_type='oed', lite=True)
+    >>> for entry in iterator.iterate():
+            print(entry.id, entry.label(), entry.date().start)
+    """
+
+    def __init__(self, line, **kwargs):
+        fixl = (kwargs.get('fix_ligatures') or
+                kwargs.get('fixLigatures') or False)
+        if fixl:
+            for before, after in LIGATURE_FIXES:
+                line = line.replace(before, after)
+        self.line = line
+        self._skeleton = Entry(_skeleton(line))
+        self._full = None
+
+    def __getattr__(self, name):
+        # Only called when normal attribute lookup fails, i.e. for
+        #  anything other than the attributes set in __init__. Once the
+        #  full entry has been parsed, everything comes from that (since
+        #  it may have been modified).
+        if name.startswith('__'):
+            raise AttributeError(name)
+        if name in LITE_FIELDS and self._full is None:
+            return getattr(self._skeleton, name)
+        return getattr(self.full_entry(), name)
+
+    def __repr__(self):
+        return '<LiteEntry: %s>' % self._skeleton.id
+
+    def full_entry(self):
+        """
+        Return the full Entry object (parsing the entry, if this has
+        not already been done).
+        """
+        if self._full is None:
+            self._full = Entry(self.line)
+        return self._full
+
+    def is_materialized(self):
+        """
+        Return True if the full entry has been parsed.
+        """
+        return self._full is not None
+
+    def date(self):
+        """
+        Return the entry's date range.
+
+        This comes from the entry's characteristics if possible;
+        otherwise it has to be computed from the full entry's quotations.
+        """
+        if (self._full is None and
+                self._skeleton.characteristic_first('firstdatesort') and
+                self._skeleton.characteristic_first('lastdatesort')):
+            return self._skeleton.date()
+        return self.full_entry().date()
+
+
+def _skeleton(line):
+    """
+    Return a skeleton version of the entry, containing only the
+    opening tag, <hwSect>, <publicationInfo>, and the <ps> elements
+    of each <s1> (in a <senseSect>).
+    """
+    open_tag = OPEN_TAG_PATTERN.match(line).group(0).strip()
+    if open_tag.endswith('/>'):
+        return etree.fromstring(open_tag)
+
+    parts = [open_tag]
+    parts.extend(HWSECT_PATTERN.findall(line)[:1])
+    parts.extend(PUBINFO_PATTERN.findall(line)[:1])
+    parts.append('<senseSect>')
+    for ps_block in S1_PS_PATTERN.findall(line):
+        parts.append('<s1>')
+        parts.extend(PS_PATTERN.findall(ps_block))
+        parts.append('</s1>')
+    parts.append('</senseSect></Entry>')
+    return etree.fromstring(''.join(parts))
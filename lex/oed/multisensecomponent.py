@@ -23,11 +23,19 @@ class MultiSenseComponent(SemanticComponent):
         try:
             return self._senses
         except AttributeError:
+            # Use the entry's skeleton, if available (see
+            #  lex.oed.entryskeleton)
+            skeleton = self.skeleton()
+            nodes = None
+            if skeleton is not None:
+                nodes = skeleton.sense_nodes(self.node)
+            if nodes is None:
+                nodes = self.node.xpath('.//*[@senseUnit="true"]')
             self._senses = [Sense(n, self.lemma_manager(), self.id)
-                            for n in
-                            self.node.xpath('.//*[@senseUnit="true"]')]
+                            for n in nodes]
             for sense in self._senses:
                 sense.is_revised = self.is_revised
+                sense.set_skeleton_owner(self)
             # If the entry is obsolete, then all senses must be obsolete
             if self.is_marked_obsolete():
                 for sense in self._senses:
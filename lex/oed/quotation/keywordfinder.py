@@ -5,8 +5,10 @@ import stringtools
 from lex.inflections.inflection import Inflection
 
 INFLECTOR = Inflection()
-SPACER = re.compile('(\u2025|\u2026|\u2014|\u2018|\u2019)')  # ellipses + dashes
 PUNCTUATION = {':', ';', '!', '?', '(', ')', }
+# Characters stripped from the ends of tokens and ngrams
+TOKEN_STRIP = ',:;()[]."?! '
+NGRAM_STRIP = ',:;().!?- '
 POSS_PRONOUNS = {'my', 'your', 'thy' 'our', 'his', 'her', 'its', 'their'}
 REFL_PRONOUNS = {'myself', 'yourself', 'thyself' 'ourselves', 'himself',
                  'herself', 'itself' 'yourselves', 'themselves'}
@@ -23,6 +25,14 @@ PHRASE_ADJUSTMENTS = {
     'without': ['with', ],
 }
 
+# Matching heuristics used by find_keyword(), in priority order
+HEURISTICS = ('literal', 'fuzzy', 'affix', 'inflected', 'secondary_lemma',
+              'hyphen', 'open_compound', 'variants', 'variants_flattened',
+              'phrase', 'loose_phrase', 'adjusted_phrase', 'metaphone',
+              'prefix', 'compound_prefix', 'compound_reverse', 'fallback')
+# Whether a lookup heuristic applies to tokens, ngrams, or both
+TOKENS, NGRAMS, BOTH = 1, 2, 3
+
 
 class KeywordFinder(object):
 
@@ -40,6 +50,13 @@ class KeywordFinder(object):
         self.local_variants = None
         self.local_variants_inflected = None
         self.inflections = None
+        self.matcher = None
+
+        # The heuristic which found the last keyword (see HEURISTICS),
+        #  and the (start, end) offsets of the keyword in the quotation
+        #  text (with square-bracketed comments removed)
+        self.last_heuristic = None
+        self.last_span = None
 
     def null_entry_level_attributes(self):
         """
@@ -60,6 +77,7 @@ class KeywordFinder(object):
         self.local_variants = None
         self.local_variants_inflected = None
         self.inflections = None
+        self.matcher = None
 
     def ingest_entry(self, entry):
         # Clear the decks
@@ -106,177 +124,274 @@ class KeywordFinder(object):
 
         self.local_variants = variants
         self.local_variants_inflected = _inflect_variants(variants, self.wordclass)
+        self.matcher = SenseMatcher(self)
 
     def find_keyword(self, quotation):
-        text = quotation.text.comment_stripped_text()
-        text = SPACER.sub(' ', text)
-        tokens, ngrams = _tokenize_text(text)
-        year = quotation.year
-
-        lemma = self.lemma
-        lemma_flat = self.lemma_flat
-        variants = self.local_variants_inflected
-
-        # Simple matching
-        match = _literal_match(lemma, text, tokens)
-        if not match:
-            match = _fuzzy_match(lemma_flat, tokens)
-        if not match:
-            match = _affix_match(lemma, lemma_flat, tokens)
-        if not match:
-            match = _inflected_match(self.inflections, tokens)
-        if not match:
-            match = _secondary_lemma_match(self.secondary_lemmas, tokens, ngrams)
-        if not match:
-            match = _hyphen_match(self.inflections, tokens)
-        if not match:
-            match = _open_compound_match(lemma_flat, ngrams)
-        if not match:
-            match = _variants_match(variants, tokens, year)
-        if not match:
-            match = _variants_flattened_match(variants, tokens, ngrams)
-        if not match:
-            match = _phrase_match(lemma, tokens, ngrams)
-        if not match:
-            match = _loose_phrase_match(lemma, text)
-        if not match:
-            match = _adjusted_phrase_match(lemma, text)
-        if not match:
-            match = _metaphone_match(variants, tokens, ngrams)
-        if not match:
-            match = _prefix_match(lemma, lemma_flat, tokens, year)
-        if not match:
-            match = _compound_prefix_match(lemma, text)
-        if not match:
-            match = _compound_reverse_match(lemma, tokens, ngrams)
-        if not match:
-            match = _fuzzy_match(self.fallback_lemma, tokens)
-            #if match:
-            #    print('-' * 30)
-            #    print(lemma)
-            #    print(text)
-            #    print(match)
-
-        return _keyword_cleanup(match, lemma)
+        tokenized = quotation.text.tokenized
+        tokens, ngrams = _tokenize_text(tokenized)
+        self.last_heuristic, match, span = self.matcher.match(
+            tokenized.source, tokens, ngrams, quotation.year)
+        keyword, self.last_span = _keyword_cleanup(match, span, self.lemma)
+        return keyword
+
+
+class SenseMatcher(object):
+
+    """
+    Matcher for finding the keyword in quotations for a given sense,
+    precompiled by KeywordFinder.ingest_sense().
+
+    Everything that depends only on the sense (sets of target forms,
+    variant metaphones and vowel-flattened forms, regexes, phrase
+    patterns) is computed once here, rather than for each quotation.
+
+    The heuristics which just test whether a token (or ngram) is in a
+    set of target forms are combined into a single lookup table, so
+    that they can all be answered in one pass over the tokens and
+    ngrams. The other heuristics are only run if no higher-priority
+    heuristic has matched. Either way, the result is the same as trying
+    each heuristic in turn, in the order given by HEURISTICS.
+    """
+
+    def __init__(self, finder):
+        self.lemma = finder.lemma
+        self.lemma_flat = finder.lemma_flat
+        self.inflections = finder.inflections
+        self.variants = finder.local_variants_inflected
+
+        # Forms looked up in the single pass over tokens/ngrams:
+        #  full form -> 'literal'; flat form -> list of (heuristic, scope)
+        self.literal_forms = set(_plurals(self.lemma))
+        self.flat_lookup = {}
+        if self.lemma_flat:
+            self._register('fuzzy', _plurals(self.lemma_flat), TOKENS)
+        self._register('inflected', self.inflections, TOKENS)
+        for i, (_, secondary_flat) in enumerate(finder.secondary_lemmas):
+            self._register(('secondary_lemma', i), _plurals(secondary_flat),
+                           BOTH)
+        self._register('open_compound', _plurals(self.lemma_flat), NGRAMS)
+        self._register('compound_reverse', _reverse_forms(self.lemma), BOTH)
+        if finder.fallback_lemma:
+            self._register('fallback', _plurals(finder.fallback_lemma),
+                           TOKENS)
+
+        self.phrase_words, self.phrase_flat = _phrase_pattern(self.lemma)
+
+        self.literal_regex = _compile_regex(
+            '[ ,;:!?(-](' + _clean_brackets(self.lemma) + ')[ ,:;!?).-]')
+        self.loose_phrase_regexes, self.loose_phrase_length = \
+            _loose_phrase_regexes(self.lemma)
+        self.adjusted_phrase_regexes = _adjusted_phrase_regexes(self.lemma)
+        self.compound_prefix_regex = _compound_prefix_regex(self.lemma)
+
+    def flat_variants(self):
+        """
+        Return the set of vowel-flattened variants (computed the first
+        time it's needed, since most quotations match before this).
+        """
+        try:
+            return self._flat_variants
+        except AttributeError:
+            flat_variants = set([_vowel_flattener(v) for v in self.variants])
+            self._flat_variants = set([v for v in flat_variants if v])
+            return self._flat_variants
+
+    def metaphones(self):
+        """
+        Return the set of metaphone codes of the variants (computed the
+        first time it's needed).
+        """
+        try:
+            return self._metaphones
+        except AttributeError:
+            metaphones = set(stringtools.metaphone_many(self.variants))
+            self._metaphones = set([v for v in metaphones if len(v) > 1])
+            return self._metaphones
+
+    def _register(self, heuristic, forms, scope):
+        for form in forms:
+            entries = self.flat_lookup.setdefault(form, [])
+            if not (heuristic, scope) in entries:
+                entries.append((heuristic, scope))
+
+    def match(self, text, tokens, ngrams, year):
+        """
+        Return a 3-ple consisting of the name of the heuristic which
+        matched (see HEURISTICS), the match, and the (start, end)
+        offsets of the match in the text; or (None, None, None) if
+        nothing matched.
+        """
+        for heuristic, match in self._matches(text, tokens, ngrams, year):
+            if match:
+                return heuristic, match[0], match[1]
+        return None, None, None
+
+    def _matches(self, text, tokens, ngrams, year):
+        """
+        Yield (heuristic, match) for each heuristic in turn (lazily, so
+        that later heuristics are only run if needed). Each match is
+        a 2-ple of the matched string and its (start, end) span, or
+        None.
+        """
+        hits = self._scan(tokens, ngrams, year)
+        yield 'literal', (hits.get('literal') or
+                          _regex_match(self.literal_regex, text))
+        yield 'fuzzy', hits.get('fuzzy')
+        yield 'affix', _affix_match(self.lemma, self.lemma_flat, tokens)
+        yield 'inflected', hits.get('inflected')
+        secondary = [key for key in hits if isinstance(key, tuple)]
+        if secondary:
+            yield 'secondary_lemma', hits[max(secondary)]
+        yield 'hyphen', _hyphen_match(self.inflections, tokens)
+        yield 'open_compound', hits.get('open_compound')
+        yield 'variants', hits.get('variants')
+        yield 'variants_flattened', _variants_flattened_match(
+            self.flat_variants(), tokens, ngrams)
+        yield 'phrase', _phrase_match(self.phrase_words, self.phrase_flat,
+                                      tokens, ngrams)
+        yield 'loose_phrase', _loose_phrase_match(
+            self.loose_phrase_regexes, self.loose_phrase_length, text)
+        for regex in self.adjusted_phrase_regexes:
+            match = _regex_match(regex, text)
+            if match:
+                yield 'adjusted_phrase', match
+                break
+        yield 'metaphone', _metaphone_match(self.metaphones(), tokens, ngrams)
+        yield 'prefix', _prefix_match(self.lemma, self.lemma_flat, tokens,
+                                      year)
+        if self.compound_prefix_regex is not None:
+            yield 'compound_prefix', _regex_match(self.compound_prefix_regex,
+                                                  ' ' + text + ' ', pad=1)
+        yield 'compound_reverse', hits.get('compound_reverse')
+        yield 'fallback', hits.get('fallback')
+
+    def _scan(self, tokens, ngrams, year):
+        """
+        Single pass over the tokens and ngrams, recording the first
+        match for each of the lookup heuristics.
+        """
+        hits = {}
+        flat_lookup = self.flat_lookup
+        variants = self.variants
+        for i, (token_full, token_flat) in enumerate(tokens):
+            if token_full in self.literal_forms:
+                # Top-priority heuristic, so nothing else is needed
+                return {'literal': _span_match(tokens, i)}
+            for heuristic, scope in flat_lookup.get(token_flat, ()):
+                if scope != NGRAMS and not heuristic in hits:
+                    hits[heuristic] = _span_match(tokens, i)
+            if (not 'variants' in hits and token_flat in variants and
+                    variants[token_flat] + 50 > year):
+                hits['variants'] = _span_match(tokens, i)
+        for i, (ngram_full, ngram_flat) in enumerate(ngrams):
+            for heuristic, scope in flat_lookup.get(ngram_flat, ()):
+                if scope != TOKENS and not heuristic in hits:
+                    hits[heuristic] = _span_match(ngrams, i)
+        return hits
 
 
 #===========================================================
 # Various different matching heuristics used by KeywordFinder.find_keyword()
 #===========================================================
 
-def _literal_match(lemma, text, tokens):
-    match = None
-    for token_full, token_flat in tokens:
-        if (lemma == token_full or
-                lemma + 's' == token_full or
-                lemma + 'es' == token_full):
-            match = token_full
-            break
-    if not match:
-        lemma2 = _clean_brackets(lemma)
-        regex = '[ ,;:!?(-](' + lemma2 + ')[ ,:;!?).-]'
-        regmatch = re.search(regex, text, re.I)
-        if regmatch:
-            match = regmatch.group(1)
-    return match
+def _plurals(form):
+    return (form, form + 's', form + 'es')
 
 
-def _fuzzy_match(lemma_flat, tokens):
-    if not lemma_flat:
-        return None
+def _compile_regex(regex):
+    """
+    Compile a case-insensitive regex; if it's invalid, the uncompiled
+    regex is returned, so that the error is raised when it's used (as
+    it would have been if compiled at that point).
+    """
+    try:
+        return re.compile(regex, re.I)
+    except re.error:
+        return regex
 
-    match = None
-    for token_full, token_flat in tokens:
-        if (lemma_flat == token_flat or
-                lemma_flat + 's' == token_flat or
-                lemma_flat + 'es' == token_flat):
-            match = token_full
-            break
-    return match
+
+def _span_match(spans, index):
+    """
+    Return a 2-ple consisting of a token/ngram and its (start, end)
+    span in the source text.
+    """
+    return spans[index][0], spans.source_span(index)
+
+
+def _regex_match(regex, text, pad=0):
+    """
+    Return group 1 of the regex match and its (start, end) span in the
+    text (less any padding added to the start of the text), or None.
+    """
+    if isinstance(regex, str):
+        regmatch = re.search(regex, text, re.I)
+    else:
+        regmatch = regex.search(text)
+    if regmatch:
+        start, end = regmatch.span(1)
+        return regmatch.group(1), (start - pad, end - pad)
+    return None
 
 
 def _affix_match(lemma, lemma_flat, tokens):
     match = None
     if lemma.startswith('-') and len(lemma_flat) >= 3:
-        for token_full, token_flat in tokens:
+        for i, (token_full, token_flat) in enumerate(tokens):
             if token_flat.endswith(lemma_flat):
-                match = token_full
+                match = _span_match(tokens, i)
                 break
     elif lemma.endswith('-') and len(lemma_flat) >= 3:
-        for token_full, token_flat in tokens:
+        for i, (token_full, token_flat) in enumerate(tokens):
             if token_flat.startswith(lemma_flat):
-                match = token_full
+                match = _span_match(tokens, i)
                 break
         if not match and len(lemma_flat) > 4:
             lemma_flat = lemma_flat[:4]
-            for token_full, token_flat in tokens:
+            for i, (token_full, token_flat) in enumerate(tokens):
                 if token_flat.startswith(lemma_flat):
-                    match = token_full
+                    match = _span_match(tokens, i)
                     break
     return match
 
 
-def _inflected_match(inflections, tokens):
-    match = None
-    for token_full, token_flat in tokens:
-        if token_flat in inflections:
-            match = token_full
-            break
-    return match
-
-
 def _hyphen_match(inflections, tokens):
     match = None
-    for token_full, token_flat in tokens:
+    for i, (token_full, token_flat) in enumerate(tokens):
         parts = token_full.split('-')
         if len(parts) == 1:
             continue
-        parts = [(p, stringtools.lexical_sort(p)) for p in parts]
-        for p_full, p_flat in parts:
-            if p_flat in inflections:
-                match = p_full
+        start = tokens.source_span(i)[0]
+        for p_full in parts:
+            if stringtools.lexical_sort(p_full) in inflections:
+                match = (p_full, (start, start + len(p_full)))
+            start += len(p_full) + 1
         if match:
             break
     return match
 
 
-def _open_compound_match(lemma_flat, bigrams):
-    match = None
-    for bigram_full, bigram_flat in bigrams:
-        if (lemma_flat == bigram_flat or
-                lemma_flat + 's' == bigram_flat or
-                lemma_flat + 'es' == bigram_flat):
-            match = bigram_full
-            break
-    return match
-
-
-def _variants_match(variants, tokens, year):
-    match = None
-    for token_full, token_flat in tokens:
-        if token_flat in variants and variants[token_flat] + 50 > year:
-            match = token_full
-            break
-    return match
-
-
-def _variants_flattened_match(variants, tokens, bigrams):
-    flat_variants = set([_vowel_flattener(v) for v in variants])
-    flat_variants = set([v for v in flat_variants if v])
+def _variants_flattened_match(flat_variants, tokens, bigrams):
     match = None
-    for token_full, token_flat in tokens + bigrams:
-        if _vowel_flattener(token_flat) in flat_variants:
-            match = token_full
+    for spans in (tokens, bigrams):
+        for i, (token_full, token_flat) in enumerate(spans):
+            if _vowel_flattener(token_flat) in flat_variants:
+                match = _span_match(spans, i)
+                break
+        if match:
             break
     return match
 
 
-def _phrase_match(lemma, tokens, bigrams):
+def _phrase_pattern(lemma):
+    """
+    Return the list of words (full, flat, and 3-letter prefix) and the
+    flattened phrase used by _phrase_match(); or (None, None) if the
+    lemma is not a 3+ word phrase.
+    """
     words = lemma.split()
     if len(words) < 3:
-        return None
+        return None, None
 
-    match = None
     if words[0] == 'to':
         phrase_words = words[1:]
     else:
@@ -291,63 +406,74 @@ def _phrase_match(lemma, tokens, bigrams):
             w.append(w_flat)
 
     phrase_flat = ''.join([w[1] for w in phrase_words])
-    for token_full, token_flat in bigrams:
+    return phrase_words, phrase_flat
+
+
+def _phrase_match(phrase_words, phrase_flat, tokens, bigrams):
+    if phrase_words is None:
+        return None
+
+    match = None
+    for i, (token_full, token_flat) in enumerate(bigrams):
         if token_flat == phrase_flat:
-            match = token_full
+            match = _span_match(bigrams, i)
             break
 
     if not match:
         phrase_length = len(phrase_words)
         for i in range(0, len(tokens)-1):
-            try:
-                ngram = tokens[i:i+phrase_length]
-            except IndexError:
-                pass
-            else:
-                match_failed = False
-                for p_token, q_token in zip(phrase_words, ngram):
-                    if q_token[1].startswith(p_token[2]):
-                        pass
-                    elif p_token[0] in "one's" and q_token[0] in POSS_PRONOUNS:
-                        pass
-                    elif p_token[0] in "oneself" and q_token[0] in REFL_PRONOUNS:
-                        pass
-                    else:
-                        match_failed = True
-                        break
-                if not match_failed:
-                    match = ' '.join([t[0] for t in ngram])
+            ngram = tokens[i:i+phrase_length]
+            match_failed = False
+            for p_token, q_token in zip(phrase_words, ngram):
+                if q_token[1].startswith(p_token[2]):
+                    pass
+                elif p_token[0] in "one's" and q_token[0] in POSS_PRONOUNS:
+                    pass
+                elif p_token[0] in "oneself" and q_token[0] in REFL_PRONOUNS:
+                    pass
+                else:
+                    match_failed = True
                     break
+            if not match_failed:
+                # Take the text spanned by the tokens (so as to include
+                #  any punctuation between them)
+                last = i + len(ngram) - 1
+                start, end = tokens.starts[i], tokens.ends[last]
+                match = (tokens.tokenized.text[start:end],
+                         (tokens.source_span(i)[0],
+                          tokens.source_span(last)[1]))
+                break
     return match
 
 
-def _loose_phrase_match(lemma, text):
+def _loose_phrase_regexes(lemma):
     """
-    Match a 3+ word phrase loosely by matching any window starting with
-    the first and ending with the last word (thus allowing variation
-    in the interior).
+    Return the regexes used by _loose_phrase_match(), plus the number
+    of words in the phrase; or ([], 0) if the lemma is not a suitable
+    phrase.
+
+    (Matches a 2+ word phrase loosely by matching any window starting
+    with the first and ending with the last word, thus allowing
+    variation in the interior.)
     """
     words = lemma.split()
     if len(words) < 2:
-        return None
+        return [], 0
 
     if len(words) == 2:
         short_phrase = True
     else:
         short_phrase = False
 
-    match = None
     if words[0] == 'to':
         phrase_words = words[1:]
     else:
         phrase_words = words[:]
     if len(phrase_words) < 2:
-        return None
+        return [], 0
     if phrase_words[0] == 'be':
-        return None
+        return [], 0
 
-    # Pad the text to make matching on word-breaks easier
-    text = ' ' + text + ' '
     word1 = _clean_brackets(phrase_words[0])
     word2 = _clean_brackets(phrase_words[-1])
     first_words = [word1, ]
@@ -356,47 +482,54 @@ def _loose_phrase_match(lemma, text):
 
     # We have two shots at this; first using the first word in full,
     #  then just using the first four letters
+    regexes = []
     for first_word in first_words:
         if short_phrase:
             regex = '[ ,;:!?(-](' + first_word + ' [a-z-]+ ' + word2 + ')[ ,:;!?).-]'
         else:
             regex = '[ ,;:!?(-](' + first_word + '.*? ' + word2 + ')[ ,:;!?).-]'
-        regmatch = re.search(regex, text, re.I)
-        if regmatch:
-            match = regmatch.group(1)
+        regexes.append(_compile_regex(regex))
+    return regexes, len(phrase_words)
+
+
+def _loose_phrase_match(regexes, phrase_length, text):
+    if not regexes:
+        return None
+
+    # Pad the text to make matching on word-breaks easier
+    text = ' ' + text + ' '
+    match = None
+    for regex in regexes:
+        match = _regex_match(regex, text, pad=1)
+        if match:
             break
 
     # Check that the span matched looks reasonable (not too many words,
     #   no medial punctuation)
-    if match and len(match.split()) > len(phrase_words) + 2:
+    if match and len(match[0].split()) > phrase_length + 2:
         match = None
-    if (match and
-            any([punc in match for punc in (',', ';', ':', '?', '!', '.')])):
+    if (match and any([punc in match[0]
+                       for punc in (',', ';', ':', '?', '!', '.')])):
         match = None
     return match
 
 
-def _adjusted_phrase_match(lemma, text):
+def _adjusted_phrase_regexes(lemma):
     """
-    Try matching a phrase by adjusting prepositions and other function words.
+    Return regexes for matching a phrase with prepositions and other
+    function words adjusted.
     """
     words = lemma.split()
     if len(words) < 2:
-        return None
+        return []
 
-    match = None
     alternatives = []
     for i, word in enumerate(words):
         if word in PHRASE_ADJUSTMENTS:
             for replacement in PHRASE_ADJUSTMENTS[word]:
                 alternatives.append(_adjust_phrase(words, i, replacement))
-    for phrase in alternatives:
-        regex = '[ ,;:!?(-](' + phrase + ')[ ,:;!?).-]'
-        regmatch = re.search(regex, text, re.I)
-        if regmatch:
-            match = regmatch.group(1)
-            break
-    return match
+    return [_compile_regex('[ ,;:!?(-](' + phrase + ')[ ,:;!?).-]')
+            for phrase in alternatives]
 
 
 def _adjust_phrase(words, index, replacement):
@@ -409,25 +542,14 @@ def _adjust_phrase(words, index, replacement):
     return ' '.join(words2)
 
 
-def _secondary_lemma_match(secondary_lemmas, tokens, bigrams):
+def _metaphone_match(metaphones, tokens, bigrams):
     match = None
-    for lemma_full, lemma_flat in secondary_lemmas:
-        for token_full, token_flat in tokens + bigrams:
-            if (lemma_flat == token_flat or
-                    lemma_flat + 's' == token_flat or
-                    lemma_flat + 'es' == token_flat):
-                match = token_full
+    for spans in (tokens, bigrams):
+        for i, (token_full, token_flat) in enumerate(spans):
+            if stringtools.metaphone(token_flat) in metaphones:
+                match = _span_match(spans, i)
                 break
-    return match
-
-
-def _metaphone_match(variants, tokens, bigrams):
-    flat_variants = set([stringtools.metaphone(v) for v in variants])
-    flat_variants = set([v for v in flat_variants if len(v) > 1])
-    match = None
-    for token_full, token_flat in tokens + bigrams:
-        if stringtools.metaphone(token_flat) in flat_variants:
-            match = token_full
+        if match:
             break
     return match
 
@@ -439,13 +561,13 @@ def _prefix_match(lemma, lemma_flat, tokens, year):
     if year < 1800:
         for prefix_size in (4, 3):
             prefix = lemma_flat[0:prefix_size]
-            for token_full, token_flat in tokens:
+            for i, (token_full, token_flat) in enumerate(tokens):
                 if ' ' in token_full or '-' in token_full:
                     continue
                 if len(token_flat) < 6:
                     continue
                 if token_flat.startswith(prefix):
-                    match = token_full
+                    match = _span_match(tokens, i)
                     break
             if match:
                 break
@@ -453,18 +575,23 @@ def _prefix_match(lemma, lemma_flat, tokens, year):
         # Look for match at the beginning *and* end of the word
         prefix = lemma_flat[0:2]
         suffix = lemma_flat[-2] + lemma_flat[-1]
-        for token_full, token_flat in tokens:
+        for i, (token_full, token_flat) in enumerate(tokens):
             if ' ' in token_full or '-' in token_full:
                 continue
             if len(token_flat) < 6:
                 continue
             if token_flat.startswith(prefix) and token_flat.endswith(suffix):
-                match = token_full
+                match = _span_match(tokens, i)
                 break
     return match
 
 
-def _compound_prefix_match(lemma, text):
+def _compound_prefix_regex(lemma):
+    """
+    Return a regex matching the first three letters of each part
+    of a two-word compound (or None if the lemma is not a suitable
+    compound).
+    """
     if lemma.startswith('-') or lemma.endswith('-'):
         return None
     if not ' ' in lemma and not '-' in lemma:
@@ -474,30 +601,22 @@ def _compound_prefix_match(lemma, text):
     if len(words) != 2 or len(words[0]) < 4 or len(words[1]) < 4:
         return None
 
-    match = None
-    text = ' ' + text + ' '
     prefix1 = _clean_brackets(words[0])[0:3]
     prefix2 = _clean_brackets(words[1])[0:3]
-    regex = '[ ,;:!?(-](' + prefix1 + '[a-z]+[ -]' + prefix2 + '[a-z]+)[ ,:;!?).-]'
-    regmatch = re.search(regex, text, re.I)
-    if regmatch:
-        match = regmatch.group(1)
-    return match
+    return _compile_regex('[ ,;:!?(-](' + prefix1 + '[a-z]+[ -]' +
+                          prefix2 + '[a-z]+)[ ,:;!?).-]')
 
 
-def _compound_reverse_match(lemma, tokens, ngrams):
-    match = None
+def _reverse_forms(lemma):
+    """
+    Return the reversed forms of a two-word compound (used to match
+    e.g. 'tree apple' or 'trees apple' for 'apple tree').
+    """
     words = lemma.split()
     if len(words) == 2:
-        reverse1 = words[1] + ' ' + words[0]
-        reverse2 = words[1] + 's ' + words[0]
-        reverse1 = stringtools.lexical_sort(reverse1)
-        reverse2 = stringtools.lexical_sort(reverse2)
-        for token_full, token_flat in tokens + ngrams:
-            if token_flat == reverse1 or token_flat == reverse2:
-                match = token_full
-                break
-    return match
+        return (stringtools.lexical_sort(words[1] + ' ' + words[0]),
+                stringtools.lexical_sort(words[1] + 's ' + words[0]))
+    return ()
 
 
 def _vowel_flattener(word):
@@ -516,36 +635,17 @@ def _vowel_flattener(word):
 # Convert text to tokens and ngrams
 #==============================================================
 
-def _tokenize_text(text):
-    naive_tokens = text.split()
-    tokens = [t.strip(',:;()[]."?! ') for t in naive_tokens]
-    tokens = [re.sub(r"'s$", '', t) for t in tokens]
-    tokens = [(t, stringtools.lexical_sort(t)) for t in tokens]
-    ngrams = (_compile_ngrams(naive_tokens, 2) +
-              _compile_ngrams(naive_tokens, 3) +
-              _compile_ngrams(naive_tokens, 4))
+def _tokenize_text(tokenized):
+    """
+    Return the tokens and ngrams (2- to 4-grams) from a TokenizedText;
+    each is a Spans sequence of (full, flat) 2-ples.
+    """
+    tokens = tokenized.tokens(strip=TOKEN_STRIP, possessive=True)
+    ngrams = tokenized.ngrams((2, 3, 4), strip=NGRAM_STRIP, possessive=True,
+                              exclude=PUNCTUATION)
     return tokens, ngrams
 
 
-def _compile_ngrams(tokens, length):
-    ngrams = []
-    for i in range(0, len(tokens)):
-        try:
-            window = tokens[i:i+length]
-        except IndexError:
-            pass
-        else:
-            ngram = ' '.join(window)
-            ngram = ngram.strip(',:;().!?- ')
-            ngram = re.sub(r"'s$", '', ngram)
-            # check for internal punctuation
-            if any([p in ngram for p in PUNCTUATION]):
-                pass
-            else:
-                ngrams.append((ngram, stringtools.lexical_sort(ngram)))
-    return ngrams
-
-
 #==============================================================
 # Inflections
 #==============================================================
@@ -640,10 +740,19 @@ def _clean_brackets(text):
     return text
 
 
-def _keyword_cleanup(keyword, lemma):
+def _keyword_cleanup(keyword, span, lemma):
+    """
+    Return the cleaned-up keyword, and its span adjusted to match.
+    """
     if keyword:
-        keyword = keyword.strip()
+        start, end = span
+        length = len(keyword)
+        keyword = keyword.lstrip()
+        start += length - len(keyword)
+        length = len(keyword)
+        keyword = keyword.rstrip()
         if keyword.endswith(' is') and not lemma.endswith(' is'):
             keyword = re.sub(r' is$', '', keyword)
             keyword = keyword.strip()
-    return keyword
+        span = (start, end - (length - len(keyword)))
+    return keyword, span
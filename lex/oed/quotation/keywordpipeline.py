@@ -0,0 +1,218 @@
+"""
+KeywordPipeline -- find (and optionally tag) the keyword in every
+OED quotation
+
+@author: James McCracken
+"""
+
+import os
+import json
+import time
+from collections import Counter
+from functools import partial
+
+from lex.entryiterator import EntryIterator
+from lex.oed.quotation.keywordfinder import KeywordFinder
+from lex.oed.quotation.keywordtagger import tag_keyword
+
+# Key used in the heuristic counts for quotations where no keyword
+#  was found
+NOT_FOUND = 'not_found'
+
+
+class KeywordPipeline(object):
+
+    """
+    Run KeywordFinder over every quotation in the OED, using
+    EntryIterator.parallel_map() to spread the work across a pool
+    of worker processes.
+
+    Each keyword found is written as a line of the output file
+    (tab-separated):
+        entry ID, sense ID, quotation ID, keyword, start, end
+    where 'start' and 'end' are the character offsets of the keyword
+    in the quotation text (with square-bracketed comments removed), as
+    matched by KeywordFinder (see KeywordFinder.last_span).
+
+    >>> pipeline = KeywordPipeline(path=oed_dir, out_file=out_file,
+                                   processes=8)
+    >>> pipeline.run()
+    >>> pipeline.stats()
+
+    Keyword arguments:
+     -- path: directory (or list of files) passed to EntryIterator;
+     -- out_file: file to which keywords are written;
+     -- output_dir: if supplied, each entry is re-serialized to
+            this directory, with <kw> tags added around the keyword
+            in each quotation (see keywordtagger.tag_keyword());
+     -- checkpoint_file: defaults to out_file + '.checkpoint';
+     -- processes, shard_size: passed to EntryIterator.parallel_map();
+     -- file_filter: passed to EntryIterator;
+     -- verbosity: if not None, throughput is reported after each file.
+
+    Progress is checkpointed after each input file. If the pipeline
+    is interrupted, running it again with the same checkpoint file
+    picks up at the first file that wasn't completed (and discards
+    any output written for that file); use restart() to start again
+    from scratch.
+    """
+
+    def __init__(self, **kwargs):
+        self.path = kwargs.get('path')
+        self.out_file = kwargs.get('out_file')
+        self.output_dir = kwargs.get('output_dir')
+        self.checkpoint_file = (kwargs.get('checkpoint_file') or
+                                self.out_file + '.checkpoint')
+        self.processes = kwargs.get('processes', None)
+        self.shard_size = kwargs.get('shard_size', None)
+        self.file_filter = kwargs.get('file_filter', None)
+        self.verbosity = kwargs.get('verbosity', None)
+        self.fix_ligatures = kwargs.get('fix_ligatures', True)
+
+        self.counts = Counter()
+        self.quotation_count = 0
+        self.elapsed = 0
+
+    def files(self):
+        """
+        Return the list of input files.
+        """
+        return EntryIterator(path=self.path,
+                             dict_type='oed',
+                             file_filter=self.file_filter).files()
+
+    def run(self):
+        """
+        Process each input file that hasn't already been completed
+        (according to the checkpoint file).
+        """
+        completed = self._load_checkpoint()
+        if completed:
+            offset = completed[-1]['offset']
+        else:
+            offset = 0
+
+        # Discard anything written after the last checkpoint
+        mode = 'r+' if os.path.exists(self.out_file) else 'w'
+        with open(self.out_file, mode) as filehandle:
+            filehandle.seek(offset)
+            filehandle.truncate()
+            for filepath in self.files():
+                if filepath in set([c['file'] for c in completed]):
+                    continue
+                self._process_file(filepath, filehandle)
+
+    def restart(self):
+        """
+        Delete the checkpoint file and any output, and run from the start.
+        """
+        for filepath in (self.checkpoint_file, self.out_file):
+            if os.path.exists(filepath):
+                os.unlink(filepath)
+        self.counts = Counter()
+        self.quotation_count = 0
+        self.elapsed = 0
+        self.run()
+
+    def _process_file(self, filepath, filehandle):
+        iterator = EntryIterator(path=[filepath],
+                                 dict_type='oed',
+                                 fix_ligatures=self.fix_ligatures,
+                                 output_dir=self.output_dir)
+        function = partial(_process_entry, tag=bool(self.output_dir))
+
+        start_time = time.time()
+        file_counts = Counter()
+        for rows, counts in iterator.parallel_map(function,
+                                                  processes=self.processes,
+                                                  shard_size=self.shard_size):
+            for row in rows:
+                filehandle.write('\t'.join([str(v) for v in row]) + '\n')
+            file_counts.update(counts)
+        filehandle.flush()
+        os.fsync(filehandle.fileno())
+        elapsed = time.time() - start_time
+
+        file_quotations = sum(file_counts.values())
+        self.counts.update(file_counts)
+        self.quotation_count += file_quotations
+        self.elapsed += elapsed
+        self._write_checkpoint({'file': filepath,
+                                'offset': filehandle.tell(),
+                                'quotations': file_quotations,
+                                'elapsed': elapsed,
+                                'counts': dict(file_counts)})
+        if self.verbosity is not None:
+            print('%s: %d quotations (%.1f/sec)' % (
+                filepath, file_quotations, file_quotations / (elapsed or 1)))
+
+    def _load_checkpoint(self):
+        """
+        Return the list of completed files recorded in the checkpoint
+        file (and restore the running totals from it).
+        """
+        completed = []
+        self.counts = Counter()
+        self.quotation_count = 0
+        self.elapsed = 0
+        if os.path.exists(self.checkpoint_file):
+            with open(self.checkpoint_file) as filehandle:
+                for line in filehandle:
+                    if line.strip():
+                        completed.append(json.loads(line))
+        for record in completed:
+            self.counts.update(record['counts'])
+            self.quotation_count += record['quotations']
+            self.elapsed += record['elapsed']
+        return completed
+
+    def _write_checkpoint(self, record):
+        with open(self.checkpoint_file, 'a') as filehandle:
+            filehandle.write(json.dumps(record) + '\n')
+
+    def stats(self):
+        """
+        Return a dict of the number of quotations processed,
+        throughput (quotations/sec), and the number of keywords found
+        by each heuristic (see keywordfinder.HEURISTICS). Quotations
+        where no keyword was found are counted as NOT_FOUND.
+
+        Totals include any files completed in a previous run
+        (according to the checkpoint file).
+        """
+        return {
+            'quotations': self.quotation_count,
+            'keywords': self.quotation_count - self.counts[NOT_FOUND],
+            'elapsed': self.elapsed,
+            'throughput': self.quotation_count / (self.elapsed or 1),
+            'heuristics': dict(self.counts),
+        }
+
+
+def _process_entry(entry, tag=False):
+    """
+    Find the keyword in each quotation in the entry (and optionally
+    tag it).
+
+    Returns a 2-ple consisting of a list of output rows and a Counter
+    of the heuristics used.
+
+    (Run in a worker process by EntryIterator.parallel_map().)
+    """
+    finder = KeywordFinder()
+    finder.ingest_entry(entry)
+    rows = []
+    counts = Counter()
+    for sense in entry.senses():
+        finder.ingest_sense(sense)
+        for quotation in sense.quotations():
+            keyword = finder.find_keyword(quotation)
+            counts[finder.last_heuristic or NOT_FOUND] += 1
+            if not keyword:
+                continue
+            start, end = finder.last_span
+            rows.append((entry.id, sense.node_id(), quotation.node_id(),
+                         keyword.replace('\t', ' '), start, end))
+            if tag:
+                tag_keyword(quotation, keyword)
+    return rows, counts
@@ -3,6 +3,10 @@ import re
 from lxml import etree
 
 import stringtools
+from lex.oed.quotation.tokenizedtext import TokenizedText
+
+# Characters stripped from the ends of ngrams
+NGRAM_STRIP = ',:;().!?- '
 
 
 def tag_keyword(quotation, keyword):
@@ -65,13 +69,8 @@ def tag_keyword(quotation, keyword):
                         text2 = text2.replace(char, ' ')
 
                 # Tokenize and make into ngrams
-                tokens = text2.split()
-                ngrams = (_compile_ngrams(tokens, 1) +
-                          _compile_ngrams(tokens, 2) +
-                          _compile_ngrams(tokens, 3) +
-                          _compile_ngrams(tokens, 4) +
-                          _compile_ngrams(tokens, 5) +
-                          _compile_ngrams(tokens, 6))
+                ngrams = TokenizedText(text2, markup=True).ngrams(
+                    range(1, 7), strip=NGRAM_STRIP)
 
                 target = None
                 for ngram_full, ngram_flat in ngrams:
@@ -107,6 +106,7 @@ def tag_keyword(quotation, keyword):
             else:
                 parent = quotation.text.node.getparent()
                 parent.replace(quotation.text.node, node_tagged)
+                quotation.text.node = node_tagged
         else:
             pass
             #print('----------------------------------------------------')
@@ -122,20 +122,3 @@ def _clean_brackets(text):
     for punc in ('(', ')', '[', ']'):
         text = text.replace(punc, '')
     return text
-
-
-def _compile_ngrams(tokens, length):
-    ngrams = []
-    for i in range(0, len(tokens)):
-        try:
-            window = tokens[i:i+length]
-        except IndexError:
-            pass
-        else:
-            ngram = ' '.join(window)
-            ngram = ngram.strip(',:;().!?- ')
-            ngram_flat = re.sub(r'<[^<>]+>', '', ngram)
-            ngram_flat = stringtools.lexical_sort(ngram_flat)
-
-            ngrams.append((ngram, ngram_flat))
-    return ngrams
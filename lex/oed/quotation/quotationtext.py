@@ -4,6 +4,7 @@ from lxml import etree
 
 import stringtools
 from regexcompiler import ReplacementListCompiler
+from lex.oed.quotation.tokenizedtext import TokenizedText
 
 
 # Used to modernize quotation text prior to tokenizing/stemming
@@ -18,20 +19,40 @@ COMMENT_STRIPPER = ReplacementListCompiler((
     (' (\u2025|\u2026)', r'\1'),  # 2-dot and 3-dot ellipsis
     (r'  +', ' '),
 ))
+# Ellipses, dashes, and quotation marks, which are treated as spaces
+#  when tokenizing
+SPACER = re.compile('(\u2025|\u2026|\u2014|\u2018|\u2019)')
+# Dashes and quotation marks (and '..'), which are padded with spaces
+#  before tokenizing
+PADDER = re.compile(r'(\.\.|\u2014|\u2018|\u2019)')
+COLLOCATE_PATTERN = re.compile(r'^([a-zA-Z]+|[a-zA-Z]+-[a-zA-Z]+)$')
 BINOMIAL_PATTERN = re.compile(
-    r'^([A-Z]([a-z]{3,}[saxonm]|\.) [a-z]{4,}[saxonmie])$')
+    r'^([A-Z](?:[a-z]{3,}[saxonm]|\.)) ([a-z]{4,}[saxonmie])$')
 
 
 class QuotationText(object):
 
     def __init__(self, node, year):
         if node is None:
-            self.node = etree.Element('qt')
-        else:
-            self.node = node
+            node = etree.Element('qt')
+        self.node = node
         self.year = year
+
+    @property
+    def node(self):
+        return self._node
+
+    @node.setter
+    def node(self, node):
+        """
+        Set the <qt> node (e.g. when it's been replaced by a <kw>-tagged
+        version), discarding anything computed from the previous node.
+        """
+        self._node = node
         self._plaintext = None
+        self._stripped_text = None
         self._tokens = None
+        self._tokenized = None
         self._keyword = None
 
     @property
@@ -64,19 +85,41 @@ class QuotationText(object):
     @property
     def tokens(self):
         """
-        Return a list of tokens from the text (including punctuation).
+        Return a list of tokens from the text (including punctuation),
+        as given by stringtools.tokens(): so clitics ("'s", "n't", etc.)
+        and quotation marks are separate tokens.
 
-        Note that square=bracketed comments have been removed first.
+        This is computed once (since NLTK's sentence tokenizer is
+        expensive), and shared by keyword_index() and
+        ranked_collocates().
+
+        Note that square-bracketed comments have been removed first.
         """
         if self._tokens is None:
             text = self.comment_stripped_text().replace('*', '')
             if not text:
                 self._tokens = []
             else:
-                text = re.sub(r'(\.\.|\u2014|\u2018|\u2019)', r' \1 ', text)
+                text = PADDER.sub(r' \1 ', text)
                 self._tokens = stringtools.tokens(text)
         return self._tokens
 
+    @property
+    def tokenized(self):
+        """
+        Return a TokenizedText version of the text (whitespace-tokenized,
+        with ellipses, dashes, and quotation marks treated as spaces).
+
+        This is computed once and shared by anything that needs tokens
+        or ngrams from the quotation (e.g. KeywordFinder).
+
+        Note that square-bracketed comments have been removed first.
+        """
+        if self._tokenized is None:
+            self._tokenized = TokenizedText(
+                SPACER.sub(' ', self.comment_stripped_text()))
+        return self._tokenized
+
     def comments(self):
         return self.node.findall('.//cm')
 
@@ -85,16 +128,19 @@ class QuotationText(object):
         Return a version of the plain text with any square-bracketed
         comments removed.
         """
-        serialized = etree.tounicode(self.node)
-        if '<cm' in serialized:
-            stripped = COMMENT_STRIPPER.edit(serialized)
-            try:
-                new_node = etree.XML(stripped)
-            except etree.XMLSyntaxError:
+        if self._stripped_text is None:
+            serialized = etree.tounicode(self.node)
+            if '<cm' in serialized:
+                stripped = COMMENT_STRIPPER.edit(serialized)
+                try:
+                    new_node = etree.XML(stripped)
+                except etree.XMLSyntaxError:
+                    new_node = self.node
+            else:
                 new_node = self.node
-        else:
-            new_node = self.node
-        return etree.tounicode(new_node, method='text') or ''
+            self._stripped_text = (etree.tounicode(new_node, method='text')
+                                   or '')
+        return self._stripped_text
 
     def keyword_index(self, lemma=None):
         """
@@ -142,7 +188,7 @@ class QuotationText(object):
             else:
                 distance = 10
 
-            if re.search(r'^([a-zA-Z]+|[a-zA-Z]+-[a-zA-Z]+)$', token):
+            if COLLOCATE_PATTERN.search(token):
                 token = token.lower()
                 if self.year < 1800:
                     token = MODERNIZER.edit(token)
@@ -174,8 +220,9 @@ class QuotationText(object):
         _binomials = []
         genus_terms = []
         for text in italic_text:
-            if BINOMIAL_PATTERN.search(text):
-                word1, word2 = text.split()
+            match = BINOMIAL_PATTERN.search(text)
+            if match:
+                word1, word2 = match.groups()
                 if re.search(r'^[A-Z]\.$', word1):
                     # Attempt expansion
                     initial = word1[0]
@@ -217,8 +264,8 @@ def keyword_index_position(tokens, keyword, lemma):
             continue
         keyword_stem = _normalize(target)
         for ngram_length in (1, 2, 3):
-            for i in range(len(tokens()) - ngram_length + 1):
-                ngram = ''.join(tokens()[i:i + ngram_length])
+            for i in range(len(tokens) - ngram_length + 1):
+                ngram = ''.join(tokens[i:i + ngram_length])
                 if _normalize(ngram) == keyword_stem:
                     return (i, i + ngram_length - 1,)
     return None
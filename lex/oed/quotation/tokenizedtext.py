@@ -0,0 +1,200 @@
+"""
+TokenizedText -- whitespace-tokenized version of a quotation text
+Spans -- sequence of (text, flat) tokens or ngrams from a TokenizedText
+
+@author: James McCracken
+"""
+
+import re
+from array import array
+from bisect import bisect_right
+
+import stringtools
+
+TAG_PATTERN = re.compile(r'<[^<>]+>')
+NON_SPACE = re.compile(r'\S+')
+
+
+class TokenizedText(object):
+
+    """
+    Whitespace-tokenized version of a text, used for finding and
+    tagging keywords.
+
+    Tokens and ngrams are stored as arrays of (start, end) offsets into
+    the text (with whitespace normalized to single spaces, so that an
+    ngram is just a slice of the text), rather than as copied
+    substrings. Each set of tokens or ngrams is computed the first time
+    it's requested, and then cached, so that different consumers can
+    share the same tokenization.
+
+    >>> tokenized = TokenizedText('The Jabberwock, with eyes of flame')
+    >>> tokens = tokenized.tokens(strip=',:;().!?')
+    >>> ngrams = tokenized.ngrams((2, 3), strip=',:;().!?')
+    >>> for ngram, ngram_flat in ngrams:
+            ...
+
+    If markup is True, the text is assumed to include (simplified,
+    space-free) XML tags, which are ignored when computing flat forms.
+    """
+
+    def __init__(self, text, markup=False):
+        self.source = text
+        self.markup = markup
+        self.starts = array('l')
+        self.ends = array('l')
+        # Start of each token in the source text (before whitespace
+        #  was normalized)
+        self.source_starts = array('l')
+        tokens = []
+        position = 0
+        for match in NON_SPACE.finditer(text):
+            token = match.group()
+            tokens.append(token)
+            self.source_starts.append(match.start())
+            self.starts.append(position)
+            position += len(token)
+            self.ends.append(position)
+            position += 1
+        self.text = ' '.join(tokens)
+        self._spans = {}
+
+    def __len__(self):
+        return len(self.starts)
+
+    def tokens(self, strip=None, possessive=False, exclude=None):
+        """
+        Return a Spans sequence of the tokens in the text.
+
+        Keyword arguments:
+        -- strip: characters to be stripped from each end of each token;
+        -- possessive: if True, any final "'s" is removed (after
+           stripping);
+        -- exclude: tokens containing any of these characters are
+           dropped.
+        """
+        return self.ngrams((1,), strip=strip, possessive=possessive,
+                           exclude=exclude)
+
+    def ngrams(self, lengths, strip=None, possessive=False, exclude=None):
+        """
+        Return a Spans sequence of the ngrams in the text, for each
+        of the lengths given (in the order given).
+
+        Keyword arguments as for tokens(). Note that (as with slicing a
+        list of tokens) windows running off the end of the text are
+        truncated, so an ngram list may include shorter ngrams from
+        the end of the text.
+        """
+        key = (tuple(lengths), strip, possessive,
+               frozenset(exclude) if exclude else None)
+        try:
+            return self._spans[key]
+        except KeyError:
+            pass
+
+        text = self.text
+        num_tokens = len(self.starts)
+        starts = array('l')
+        ends = array('l')
+        for length in key[0]:
+            for i in range(num_tokens):
+                start = self.starts[i]
+                if length == 1:
+                    end = self.ends[i]
+                else:
+                    end = self.ends[min(i + length, num_tokens) - 1]
+                if strip:
+                    while start < end and text[start] in strip:
+                        start += 1
+                    while end > start and text[end - 1] in strip:
+                        end -= 1
+                if possessive and text.endswith("'s", start, end):
+                    end -= 2
+                if exclude and any([c in exclude
+                                    for c in text[start:end]]):
+                    continue
+                starts.append(start)
+                ends.append(end)
+        self._spans[key] = Spans(self, starts, ends)
+        return self._spans[key]
+
+    def source_offset(self, position):
+        """
+        Convert an offset into the (whitespace-normalized) text into
+        the corresponding offset into the source text.
+        """
+        i = bisect_right(self.starts, position) - 1
+        if i < 0:
+            return position
+        return self.source_starts[i] + position - self.starts[i]
+
+    def flat_forms(self, starts, ends):
+        """
+        Return the flat (lexical-sort) forms of the spans given.
+        """
+        text = self.text
+        if self.markup:
+            strings = [TAG_PATTERN.sub('', text[start:end])
+                       for start, end in zip(starts, ends)]
+        else:
+            strings = [text[start:end] for start, end in zip(starts, ends)]
+        return stringtools.lexical_sort_many(strings)
+
+
+class Spans(object):
+
+    """
+    Sequence of tokens or ngrams from a TokenizedText.
+
+    Each item is a 2-ple consisting of the token/ngram (a slice of the
+    text) and its flat (lexical-sort) form. Flat forms are computed
+    for the whole sequence the first time any is needed.
+    """
+
+    __slots__ = ['tokenized', 'starts', 'ends', '_flat']
+
+    def __init__(self, tokenized, starts, ends):
+        self.tokenized = tokenized
+        self.starts = starts
+        self.ends = ends
+        self._flat = None
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        text = self.tokenized.text
+        return zip([text[start:end] for start, end
+                    in zip(self.starts, self.ends)], self.flat)
+
+    def __getitem__(self, index):
+        text = self.tokenized.text
+        if isinstance(index, slice):
+            return [(text[start:end], flat) for start, end, flat in
+                    zip(self.starts[index], self.ends[index],
+                        self.flat[index])]
+        return (text[self.starts[index]:self.ends[index]],
+                self.flat[index])
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    @property
+    def flat(self):
+        if self._flat is None:
+            self._flat = self.tokenized.flat_forms(self.starts, self.ends)
+        return self._flat
+
+    def offsets(self):
+        """
+        Return a list of (start, end) offsets into the text.
+        """
+        return list(zip(self.starts, self.ends))
+
+    def source_span(self, index):
+        """
+        Return the (start, end) offsets of an item in the source text.
+        """
+        return (self.tokenized.source_offset(self.starts[index]),
+                self.tokenized.source_offset(self.ends[index]))
@@ -52,6 +52,7 @@ class S1block(_SenseContainer):
                               for n in self.node.findall('./s2')]
             for block in self._s2blocks:
                 block.is_revised = self.is_revised
+                block.set_skeleton_owner(self)
 
             # If the entry is obsolete, then all blocks must be obsolete
             if self.is_marked_obsolete():
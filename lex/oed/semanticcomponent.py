@@ -172,9 +172,16 @@ class SemanticComponent(OedComponent):
         try:
             return self._quotation_paragraphs
         except AttributeError:
+            # Use the entry's skeleton, if available (see
+            #  lex.oed.entryskeleton)
+            skeleton = self.skeleton()
+            nodes = None
+            if skeleton is not None:
+                nodes = skeleton.qp_nodes(self.node)
+            if nodes is None:
+                nodes = self.node.findall('.//qp')
             self._quotation_paragraphs = [QuotationParagraph(node)
-                                          for node in
-                                          self.node.findall('.//qp')]
+                                          for node in nodes]
             return self._quotation_paragraphs
 
     def quotations(self, **kwargs):
@@ -518,13 +525,8 @@ class SemanticComponent(OedComponent):
 
             quote_paras = []
             for sense in senses:
-                for qpara in sense.quotation_paragraphs():
-                    date_list = [q.year for q in qpara.quotations()
-                                 if q.year and q.year > 0 and
-                                 not q.is_bracketed()]
-                    date_list.sort()
-                    if date_list:
-                        quote_paras.append(date_list)
+                quote_paras.extend([date_list for date_list in
+                                    _sense_year_lists(sense) if date_list])
 
             years = []
             for date_list in quote_paras:
@@ -695,3 +697,24 @@ class SemanticComponent(OedComponent):
                 except IndexError:
                     pass
             return self._parent_def
+
+
+def _sense_year_lists(sense):
+    """
+    Return a list of sorted year-lists, one for each quotation paragraph
+    in the sense, taken from the entry's skeleton where possible.
+    """
+    skeleton = sense.skeleton()
+    if skeleton is not None and not sense.has_shared_quotations():
+        year_lists = skeleton.year_lists(sense.node)
+        if year_lists is not None:
+            return year_lists
+
+    year_lists = []
+    for qpara in sense.quotation_paragraphs():
+        date_list = [q.year for q in qpara.quotations()
+                     if q.year and q.year > 0 and
+                     not q.is_bracketed()]
+        date_list.sort()
+        year_lists.append(date_list)
+    return year_lists
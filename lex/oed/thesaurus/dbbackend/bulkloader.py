@@ -0,0 +1,143 @@
+"""
+BulkLoader -- bulk-insert rows into the HTOED database tables
+
+@author: James McCracken
+"""
+
+import io
+import csv
+import time
+from collections import OrderedDict
+
+from sqlalchemy.schema import CreateTable
+
+# Number of rows sent to the database in each COPY or executemany
+BATCH_SIZE = 10000
+# Marker used for NULL values in COPY streams
+NULL = '\\N'
+
+
+class BulkLoader(object):
+
+    """
+    Bulk-insert rows into database tables.
+
+    For PostgreSQL, rows are written as tab-separated CSV to an
+    in-memory stream, which is loaded with COPY; for other databases
+    (e.g. SQLite), rows are inserted with executemany. Either way, rows
+    are sent in batches of BATCH_SIZE, so the rows can be supplied by
+    a generator.
+
+    Tables are created without their indexes, which are only built
+    once the table has been loaded.
+
+    >>> loader = BulkLoader(engine=DB_ENGINE, verbosity='low')
+    >>> loader.load(ThesClass.__table__, rows)
+    >>> loader.report()
+
+    The time taken to load each table (including the time taken to
+    generate the rows) and to build its indexes is recorded; see
+    timings and report().
+    """
+
+    def __init__(self, **kwargs):
+        self.engine = kwargs.get('engine')
+        self.verbosity = kwargs.get('verbosity', None)
+        self.timings = OrderedDict()
+
+    def create(self, table):
+        """
+        Drop and re-create a table, without its indexes.
+        """
+        table.drop(self.engine, checkfirst=True)
+        with self.engine.begin() as connection:
+            connection.execute(CreateTable(table))
+
+    def load(self, table, rows, exclude=None):
+        """
+        Create a table (see create()), insert rows into it, and then
+        build its indexes.
+
+        Arguments:
+         -- table: a sqlalchemy Table (e.g. ThesClass.__table__);
+         -- rows: iterable of dicts mapping column names to values.
+
+        Keyword arguments:
+         -- exclude: columns to be left to the database (e.g. an
+              autoincrementing 'id' column).
+        """
+        exclude = set(exclude or [])
+        columns = [c.name for c in table.columns if c.name not in exclude]
+
+        self.create(table)
+        start_time = time.time()
+        count = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= BATCH_SIZE:
+                self._insert(table, columns, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            self._insert(table, columns, batch)
+            count += len(batch)
+        load_time = time.time() - start_time
+
+        start_time = time.time()
+        for index in table.indexes:
+            index.create(self.engine)
+        index_time = time.time() - start_time
+
+        self.timings[table.name] = {'rows': count,
+                                    'load': load_time,
+                                    'indexes': index_time}
+        if self.verbosity is not None:
+            self._report_table(table.name)
+
+    def _insert(self, table, columns, rows):
+        if self.engine.dialect.name == 'postgresql':
+            self._copy(table, columns, rows)
+        else:
+            with self.engine.begin() as connection:
+                connection.execute(table.insert(),
+                                   [{column: row.get(column) for column
+                                     in columns} for row in rows])
+
+    def _copy(self, table, columns, rows):
+        stream = io.StringIO()
+        writer = csv.writer(stream, delimiter='\t', lineterminator='\n')
+        for row in rows:
+            writer.writerow([_serialize(row.get(column))
+                             for column in columns])
+        stream.seek(0)
+
+        sql = ("COPY %s (%s) FROM STDIN WITH (FORMAT csv, DELIMITER E'\\t', "
+               "NULL '%s')" % (table.name, ', '.join(columns), NULL))
+        connection = self.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.copy_expert(sql, stream)
+            connection.commit()
+        finally:
+            connection.close()
+
+    def report(self):
+        """
+        Print the rows loaded and time taken for each table.
+        """
+        for table_name in self.timings:
+            self._report_table(table_name)
+
+    def _report_table(self, table_name):
+        timing = self.timings[table_name]
+        print('%s: %d rows loaded in %.1fs (%.0f/sec); indexes built in '
+              '%.1fs' % (table_name, timing['rows'], timing['load'],
+                         timing['rows'] / (timing['load'] or 1),
+                         timing['indexes']))
+
+
+def _serialize(value):
+    if value is None:
+        return NULL
+    return value
@@ -0,0 +1,143 @@
+"""
+ClassCache -- shared LRU cache of thesaurus classes (ThesClass objects),
+keyed by class ID
+
+@author: James McCracken
+"""
+
+import os
+import json
+
+import sqlalchemy.orm.exc
+
+from lrucache import LRUCache
+from lex.oed.thesaurus.dbbackend import thesaurusdbconfig
+from lex.oed.thesaurus.dbbackend.models import ThesClass
+
+SESSION = thesaurusdbconfig.SESSION
+# Maximum number of IDs in the IN clause of a warm-up query
+BATCH_SIZE = 1000
+_MISSING = object()
+
+
+class ClassCache(object):
+
+    """
+    Least-recently-used cache of thesaurus classes, shared by
+    queryengine.get_thesclass(), equivalentclass.equivalent_class(),
+    and SubjectMapper.
+
+    >>> cache = ClassCache(max_size=10000)
+    >>> thesclass = cache.get(12345)
+
+    Class IDs not found in the database are cached as None.
+
+    Keyword arguments:
+     -- max_size: maximum number of classes cached (None for no limit);
+     -- preload: if True, every class in the taxonomy is loaded (with
+            no limit; the whole taxonomy fits comfortably in memory);
+     -- snapshot: file listing class IDs to be loaded (see
+            save_snapshot()).
+    Preloading/warm-up happens the first time the cache is used.
+    """
+
+    def __init__(self, max_size=None, preload=False, snapshot=None):
+        self.cache = LRUCache(max_size=max_size)
+        self.pending_preload = preload
+        self.pending_snapshot = snapshot
+
+    def __len__(self):
+        return len(self.cache)
+
+    def __contains__(self, class_id):
+        return class_id in self.cache
+
+    def get(self, class_id):
+        """
+        Return the ThesClass with the given ID (or None if there's no
+        such class).
+        """
+        if self.pending_preload or self.pending_snapshot:
+            self._initialize()
+        try:
+            class_id = int(class_id)
+        except (ValueError, TypeError):
+            return None
+        thesclass = self.cache.get(class_id, _MISSING)
+        if thesclass is _MISSING:
+            try:
+                thesclass = SESSION.query(ThesClass).filter_by(
+                    id=class_id).one()
+            except sqlalchemy.orm.exc.NoResultFound:
+                thesclass = None
+            self.cache.put(class_id, thesclass)
+        return thesclass
+
+    def _initialize(self):
+        preload, self.pending_preload = self.pending_preload, False
+        snapshot, self.pending_snapshot = self.pending_snapshot, None
+        if preload:
+            self.preload()
+        elif snapshot and os.path.exists(snapshot):
+            self.warm(snapshot)
+
+    def put(self, thesclass):
+        self.cache.put(thesclass.id, thesclass)
+
+    def resize(self, max_size=None):
+        self.cache.resize(max_size=max_size)
+
+    def clear(self):
+        self.cache.clear()
+
+    def preload(self):
+        """
+        Load every class in the taxonomy into the cache (removing the
+        size limit).
+        """
+        self.cache.resize(max_size=None)
+        for thesclass in SESSION.query(ThesClass):
+            self.put(thesclass)
+
+    def warm(self, filename):
+        """
+        Load the classes listed in a snapshot file (see save_snapshot()),
+        in batched queries.
+        """
+        with open(filename) as filehandle:
+            class_ids = json.load(filehandle)
+        if self.cache.max_size is not None:
+            # The most recently used classes are at the end of the list
+            class_ids = class_ids[-self.cache.max_size:]
+        loaded = {}
+        for i in range(0, len(class_ids), BATCH_SIZE):
+            batch = class_ids[i:i + BATCH_SIZE]
+            for thesclass in SESSION.query(ThesClass).filter(
+                    ThesClass.id.in_(batch)):
+                loaded[thesclass.id] = thesclass
+        # Add in the order of the snapshot, to restore the LRU order
+        for class_id in class_ids:
+            if class_id in loaded:
+                self.put(loaded[class_id])
+
+    def save_snapshot(self, filename):
+        """
+        Save the IDs of the cached classes to a snapshot file (least
+        recently used first).
+        """
+        with open(filename, 'w') as filehandle:
+            json.dump(self.cache.keys(), filehandle)
+
+    def stats(self):
+        """
+        Return a dict of hits, misses, evictions, and current size
+        (see LRUCache.stats()).
+        """
+        stats = self.cache.stats()
+        del stats['bytes']
+        return stats
+
+
+CLASS_CACHE = ClassCache(max_size=thesaurusdbconfig.CLASS_CACHE_SIZE,
+                         preload=thesaurusdbconfig.CLASS_CACHE_PRELOAD,
+                         snapshot=thesaurusdbconfig.CLASS_CACHE_SNAPSHOT)
@@ -6,12 +6,9 @@ equivalent_class()
 @author: James McCracken
 """
 
-from sqlalchemy.orm.exc import NoResultFound
-
 from lex.oed.thesaurus.dbbackend import thesaurusdbconfig
-from lex.oed.thesaurus.dbbackend.models import ThesClass
+from lex.oed.thesaurus.dbbackend.classcache import CLASS_CACHE
 
-SESSION = thesaurusdbconfig.SESSION
 WORDCLASS_TRANSLATIONS = thesaurusdbconfig.WORDCLASS_TRANSLATIONS
 
 
@@ -24,9 +21,8 @@ def equivalent_class(thesclass, target_wordclass):
         return None
 
     if isinstance(thesclass, int):
-        try:
-            thesclass = SESSION.query(ThesClass).filter_by(id=thesclass).one()
-        except NoResultFound:
+        thesclass = CLASS_CACHE.get(thesclass)
+        if thesclass is None:
             return None
 
     # Find the class immediately above the wordclass parent...
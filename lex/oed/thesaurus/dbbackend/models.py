@@ -23,6 +23,13 @@ Base = declarative_base()
 WORDCLASS_TRANSLATIONS = thesaurusdbconfig.WORDCLASS_TRANSLATIONS
 
 
+def _taxonomy_index():
+    # Imported here to avoid a circular import (queryengine imports
+    #  this module)
+    from lex.oed.thesaurus.dbbackend import queryengine
+    return queryengine.taxonomy_index()
+
+
 class ThesClass(Base):
     __tablename__ = 'class'
 
@@ -128,6 +135,17 @@ class ThesClass(Base):
         try:
             return self._ancestors
         except AttributeError:
+            index = _taxonomy_index()
+            if self.id in index:
+                # Fetch all the ancestors in a single query, rather than
+                #  walking up the tree one parent at a time
+                ancestor_ids = index.ancestor_ids(self.id)
+                classes = {c.id: c for c in thesaurusdbconfig.SESSION.query(
+                    ThesClass).filter(ThesClass.id.in_(ancestor_ids[1:]))}
+                classes[self.id] = self
+                self._ancestors = [classes[class_id] for class_id
+                                   in ancestor_ids if class_id in classes]
+                return self._ancestors
             self._ancestors = [self, ]
             if self.parent is not None:
                 parent = self.parent
@@ -175,6 +193,9 @@ class ThesClass(Base):
         if isinstance(class_id, ThesClass):
             class_id = class_id.id
         class_id = int(class_id)
+        index = _taxonomy_index()
+        if self.id in index and class_id in index:
+            return index.is_descendant(self.id, class_id)
         if class_id in [a.id for a in self.ancestors()]:
             return True
         else:
@@ -194,6 +215,13 @@ class ThesClass(Base):
             return False
 
     def common_ancestor(self, other):
+        index = _taxonomy_index()
+        if self.id in index and other.id in index:
+            ancestor_id = index.lowest_common_ancestor(self.id, other.id)
+            for ancestor in self.ancestors():
+                if ancestor.id == ancestor_id:
+                    return ancestor
+            return None
         other_ids = set([a.id for a in other.ancestors()])
         for ancestor in self.ancestors():
             if ancestor.id in other_ids:
@@ -204,6 +232,14 @@ class ThesClass(Base):
         """
         Recursively list all descendant classes
         """
+        index = _taxonomy_index()
+        if self.id in index:
+            descendant_ids = index.descendant_ids(self.id)
+            classes = {c.id: c for c in thesaurusdbconfig.SESSION.query(
+                ThesClass).filter(ThesClass.id.in_(descendant_ids))}
+            return [classes[class_id] for class_id in descendant_ids
+                    if class_id in classes]
+
         def recurse(node, stack):
             stack.append(node)
             for child in node.children:
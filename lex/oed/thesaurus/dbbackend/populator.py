@@ -13,8 +13,10 @@ add_links()
 import string
 import os
 import csv
+from functools import partial
 
 from lex.oed.thesaurus.dbbackend import thesaurusdbconfig
+from lex.oed.thesaurus.dbbackend.bulkloader import BulkLoader
 from lex.oed.thesaurus.contentiterator import ContentIterator
 from lex.oed.thesaurus.taxonomymanager import TaxonomyManager
 from lex.oed.thesaurus.dbbackend.models import (ThesClass,
@@ -27,12 +29,10 @@ DB_SESSION = thesaurusdbconfig.SESSION
 WORDCLASS_MAP = thesaurusdbconfig.WORDCLASS_TRANSLATIONS
 
 
-def store_taxonomy(tax_dir):
+def store_taxonomy(tax_dir, verbosity='low'):
     ThesInstance.__table__.drop(DB_ENGINE, checkfirst=True)
     SuperordinateBranch.__table__.drop(DB_ENGINE, checkfirst=True)
     Superordinate.__table__.drop(DB_ENGINE, checkfirst=True)
-    ThesClass.__table__.drop(DB_ENGINE, checkfirst=True)
-    ThesClass.__table__.create(DB_ENGINE, checkfirst=True)
 
     tree_manager = TaxonomyManager(dir=tax_dir, lazy=True, verbosity=None)
 
@@ -44,23 +44,24 @@ def store_taxonomy(tax_dir):
         print('Thesaurus data has no size attributes; exiting.')
         exit()
 
-    for level in range(1, 20):
-        classes = [c for c in tree_manager.classes if c.level() == level]
-        print(level, len(classes))
-        buffer_size = 0
-        for thesaurus_class in classes:
-            DB_SESSION.add(ThesClass(thesaurus_class))
-            buffer_size += 1
-            if buffer_size > 100:
-                DB_SESSION.commit()
-                buffer_size = 0
-        DB_SESSION.commit()
+    # Sorted by level, so that each class is stored after its parent
+    classes = sorted(tree_manager.classes, key=lambda c: c.level())
+    loader = BulkLoader(engine=DB_ENGINE, verbosity=verbosity)
+    loader.load(ThesClass.__table__,
+                (_row(ThesClass(thesaurus_class))
+                 for thesaurus_class in classes))
+    return loader.timings
 
 
-def store_content(content_dir):
-    ThesInstance.__table__.drop(DB_ENGINE, checkfirst=True)
-    ThesInstance.__table__.create(DB_ENGINE, checkfirst=True)
+def store_content(content_dir, processes=None, verbosity='low'):
+    """
+    Store a thesaurus instance for each sense in the OED (one per
+    thesaurus class the sense is linked to).
 
+    Entries are processed in parallel by a pool of worker processes
+    (see EntryIterator.parallel_map()), and the resulting rows are
+    bulk-loaded (see BulkLoader).
+    """
     # Store the lemmas for each thesaurus instance (using
     #  refentry+refid+classid as the identifier)
     lemmas = {}  # = _cache_thesaurus_lemmas(content_dir)
@@ -68,33 +69,15 @@ def store_content(content_dir):
     from lex.entryiterator import EntryIterator
     iterator = EntryIterator(dictType='oed',
                              fixLigatures=True,
-                             verbosity='low')
-    buffer_size = 0
-    for entry in iterator.iterate():
-        entry.check_revised_status()
-        for block in entry.s1blocks():
-            block.share_quotations()
-            entry_size = block.weighted_size()
-            senses = [s for s in block.senses() if not s.is_xref_sense()]
-            senses.sort(key=_sortable_date)
-            for i, s in enumerate(senses):
-                records = _prepare_records(s, entry.id, entry.node_id(),
-                                           lemmas, i + 1, entry_size,)
-                for r in records:
-                    DB_SESSION.add(r)
-                    buffer_size += 1
-        for s in [s for s in entry.senses() if not s.is_in_sensesect()
-                  and not s.is_xref_sense()]:
-            records = _prepare_records(s, entry.id, entry.node_id(),
-                                       lemmas, 5, 1.0,)
-            for r in records:
-                DB_SESSION.add(r)
-                buffer_size += 1
+                             verbosity=verbosity)
+    function = partial(_prepare_entry_rows, lemmas=lemmas)
+    rows = (row for entry_rows in iterator.parallel_map(function,
+                                                        processes=processes)
+            for row in entry_rows)
 
-        if buffer_size > 1000:
-            DB_SESSION.commit()
-            buffer_size = 0
-    DB_SESSION.commit()
+    loader = BulkLoader(engine=DB_ENGINE, verbosity=verbosity)
+    loader.load(ThesInstance.__table__, rows, exclude=('id',))
+    return loader.timings
 
 
 def store_superordinates(superordinates_dir):
@@ -174,6 +157,48 @@ def _cache_thesaurus_lemmas(content_dir):
     return lemmas
 
 
+def _prepare_entry_rows(entry, lemmas=None):
+    """
+    Return a list of instance rows (dicts) for each sense in the entry.
+
+    (Run in a worker process by EntryIterator.parallel_map().)
+    """
+    if lemmas is None:
+        lemmas = {}
+    rows = []
+    entry.check_revised_status()
+    for block in entry.s1blocks():
+        block.share_quotations()
+        entry_size = block.weighted_size()
+        senses = [s for s in block.senses() if not s.is_xref_sense()]
+        senses.sort(key=_sortable_date)
+        for i, s in enumerate(senses):
+            rows.extend(_prepare_rows(s, entry.id, entry.node_id(),
+                                      lemmas, i + 1, entry_size,))
+    for s in [s for s in entry.senses() if not s.is_in_sensesect()
+              and not s.is_xref_sense()]:
+        rows.extend(_prepare_rows(s, entry.id, entry.node_id(),
+                                  lemmas, 5, 1.0,))
+    return rows
+
+
+def _prepare_rows(sense, entry_id, entry_lexid, lemmas, count, entry_size):
+    """
+    Like _prepare_records(), but returns the records as rows (dicts
+    of column values), ready for bulk-loading.
+    """
+    return [_row(record) for record in _prepare_records(
+        sense, entry_id, entry_lexid, lemmas, count, entry_size)]
+
+
+def _row(record):
+    """
+    Return a dict of the column values of a (transient) model instance.
+    """
+    return {column.name: getattr(record, column.name)
+            for column in record.__table__.columns}
+
+
 def _prepare_records(sense, entry_id, entry_lexid, lemmas, count, entry_size):
     sense_size = sense.weighted_size(revised=sense.is_revised)
 
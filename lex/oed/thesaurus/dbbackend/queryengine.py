@@ -5,22 +5,25 @@ queryengine
 """
 
 import re
-import itertools
-from collections import OrderedDict
 
-from sqlalchemy import or_
+from sqlalchemy.orm import joinedload
 import sqlalchemy.orm.exc
 
 from lex.oed.thesaurus.dbbackend import thesaurusdbconfig
+from lex.oed.thesaurus.dbbackend import classcache
 from lex.oed.thesaurus.dbbackend.models import (ThesClass,
                                                 ThesInstance,
                                                 Superordinate)
 from lex.oed.thesaurus.dbbackend.subjectmapper import SubjectMapper
+from lex.oed.thesaurus.dbbackend.taxonomyindex import TaxonomyIndex
 
 SESSION = thesaurusdbconfig.SESSION
 WORDCLASS_TRANSLATIONS = thesaurusdbconfig.WORDCLASS_TRANSLATIONS
 SUBJECT_MAPPER = SubjectMapper()
-CLASS_CACHE = OrderedDict()
+CLASS_CACHE = classcache.CLASS_CACHE
+TAXONOMY_INDEX = None
+# Maximum number of values in the IN clause of a batch query
+BATCH_SIZE = 1000
 
 
 def taxonomy(**kwargs):
@@ -34,22 +37,56 @@ def taxonomy(**kwargs):
         return SESSION.query(ThesClass).filter(ThesClass.level <= level)
 
 
-def get_thesclass(class_id):
+def taxonomy_index():
+    """
+    Return the in-memory TaxonomyIndex of the thesaurus class hierarchy
+    (loaded from the database the first time it's needed).
+    """
+    global TAXONOMY_INDEX
+    if TAXONOMY_INDEX is None:
+        TAXONOMY_INDEX = TaxonomyIndex(SESSION.query(ThesClass.id,
+                                                     ThesClass.parent_id,
+                                                     ThesClass.branch_size))
+    return TAXONOMY_INDEX
+
+
+def reset_taxonomy_index():
+    """
+    Discard the taxonomy index (e.g. after the taxonomy has been
+    reloaded), so that it gets rebuilt the next time it's needed.
+    """
+    global TAXONOMY_INDEX
+    TAXONOMY_INDEX = None
+
+
+def is_descendant(class_id, ancestor_id):
+    """
+    Return True if the first class is the same as, or a descendant of,
+    the second. Arguments can be ThesClass objects or class IDs.
+    """
+    if not class_id or not ancestor_id:
+        return False
+    return taxonomy_index().is_descendant(class_id, ancestor_id)
+
+
+def lowest_common_ancestor(classes):
+    """
+    Return the lowest ThesClass which is the same as, or an ancestor
+    of, every class in the list (ThesClass objects or class IDs);
+    or None if there is no common ancestor.
+    """
+    index = taxonomy_index()
     try:
-        class_id = int(class_id)
-    except (ValueError, TypeError):
+        ancestor_id = index.lowest_common_ancestor(*classes)
+    except (KeyError, TypeError, ValueError):
         return None
-    try:
-        return CLASS_CACHE[class_id]
-    except KeyError:
-        try:
-            thesclass = SESSION.query(ThesClass).filter_by(id=class_id).one()
-        except sqlalchemy.orm.exc.NoResultFound:
-            thesclass = None
-        CLASS_CACHE[class_id] = thesclass
-        if len(CLASS_CACHE) > 100:
-            CLASS_CACHE.popitem(last=False)
-        return thesclass
+    if ancestor_id is None:
+        return None
+    return get_thesclass(ancestor_id)
+
+
+def get_thesclass(class_id):
+    return CLASS_CACHE.get(class_id)
 
 
 def get_superordinate_record(superordinate):
@@ -64,6 +101,99 @@ def get_superordinate_record(superordinate):
 
 def search(**kwargs):
     lemma = kwargs.get('lemma')
+    refentry = kwargs.get('refentry')
+
+    if lemma is not None:
+        lemma = _normalize_lemma(lemma)
+        candidates = _base_query().filter_by(lemma=lemma)
+    elif refentry is not None:
+        candidates = _base_query().filter_by(refentry=int(refentry))
+    else:
+        return []
+    return _filter_candidates(list(candidates), **kwargs)
+
+
+def search_many(lemmas, **kwargs):
+    """
+    Batch version of ranked_search(), for a list of lemmas.
+
+    Fetches the instances for every lemma with a single query per
+    BATCH_SIZE lemmas (with thesaurus classes and their ancestors
+    loaded up front), rather than several queries per lemma; then
+    filters and ranks each lemma's instances in memory.
+
+    Keyword arguments are as for ranked_search(), and apply to every
+    lemma ('lemma' itself is ignored).
+
+    Returns a dict mapping each lemma to its list of ranked results.
+    """
+    kwargs.pop('lemma', None)
+    normalized = {lemma: _normalize_lemma(lemma) for lemma in lemmas}
+    distinct = sorted(set(normalized.values()))
+
+    instances = {lemma: [] for lemma in distinct}
+    for i in range(0, len(distinct), BATCH_SIZE):
+        batch = distinct[i:i + BATCH_SIZE]
+        for instance in _base_query().filter(ThesInstance.lemma.in_(batch)):
+            instances[instance.lemma].append(instance)
+    _prefetch_ancestors([instance.thesclass
+                         for candidates in instances.values()
+                         for instance in candidates
+                         if instance.thesclass is not None])
+
+    ranked = {}
+    for lemma in distinct:
+        candidates = _filter_candidates(instances[lemma], **kwargs)
+        if kwargs.get('current_only', False) or kwargs.get('currentOnly',
+                                                           False):
+            candidates = [c for c in candidates if c.size > 0]
+        ranked[lemma] = _rank(candidates, **kwargs)
+    return {lemma: list(ranked[normalized[lemma]]) for lemma in lemmas}
+
+
+def _normalize_lemma(lemma):
+    return re.sub(r'(.)[ -](.)', r'\1\2', lemma)
+
+
+def _base_query():
+    # Ordered by ID, so that instances which tie in _rank() come out in
+    #  the same order whether fetched by search() or search_many()
+    return SESSION.query(ThesInstance).options(
+        joinedload(ThesInstance.thesclass)).order_by(ThesInstance.id)
+
+
+def _prefetch_ancestors(thesclasses):
+    """
+    Load the ancestors of each class in a list (in one query per
+    BATCH_SIZE classes), rather than letting ThesClass.ancestors() fetch
+    them class by class.
+    """
+    index = taxonomy_index()
+    pending = {}
+    for thesclass in thesclasses:
+        if not hasattr(thesclass, '_ancestors') and thesclass.id in index:
+            pending[thesclass.id] = thesclass
+    ancestor_ids = {class_id: index.ancestor_ids(class_id)
+                    for class_id in pending}
+    required = sorted(set([class_id for id_list in ancestor_ids.values()
+                           for class_id in id_list]))
+    classes = {}
+    for i in range(0, len(required), BATCH_SIZE):
+        batch = required[i:i + BATCH_SIZE]
+        for thesclass in SESSION.query(ThesClass).filter(
+                ThesClass.id.in_(batch)):
+            classes[thesclass.id] = thesclass
+    for class_id, thesclass in pending.items():
+        classes.setdefault(class_id, thesclass)
+        thesclass._ancestors = [classes[a] for a in ancestor_ids[class_id]
+                                if a in classes]
+
+
+def _filter_candidates(candidates, **kwargs):
+    """
+    Apply the filters used by search() to a list of instances
+    (in memory).
+    """
     wordclass = kwargs.get('wordclass')
     refentry = kwargs.get('refentry')
     entrynode = kwargs.get('entrynode')
@@ -75,9 +205,6 @@ def search(**kwargs):
     #  or a list of thesaurus class IDs
     branches = kwargs.get('branches', [])
 
-    if lemma is not None:
-        lemma = re.sub(r'(.)[ -](.)', r'\1\2', lemma)
-
     if refentry is not None:
         refentry = int(refentry)
     if refid is not None:
@@ -87,37 +214,30 @@ def search(**kwargs):
     if wordclass is not None and wordclass in WORDCLASS_TRANSLATIONS:
         wordclass = WORDCLASS_TRANSLATIONS[wordclass]
 
-    if lemma is not None:
-        candidates = SESSION.query(ThesInstance).filter_by(lemma=lemma)
-    elif refentry is not None:
-        candidates = SESSION.query(ThesInstance).filter_by(refentry=refentry)
-
     if wordclass is not None:
-        candidates2 = candidates.filter_by(wordclass=wordclass)
-        if candidates2.count() == 0:
-            candidates2 = candidates.filter_by(wordclass='PHR')
-        candidates = candidates2
+        candidates = ([c for c in candidates if c.wordclass == wordclass] or
+                      [c for c in candidates if c.wordclass == 'PHR'])
 
     if refentry is not None:
-        candidates = candidates.filter_by(refentry=refentry)
+        candidates = [c for c in candidates if c.refentry == refentry]
 
     if refid is not None:
         if kwargs.get('exact_sense') or kwargs.get('exactSense'):
-            candidates = candidates.filter_by(refid=refid)
+            candidates = [c for c in candidates if c.refid == refid]
         else:
             # When filtering by refid, allow for the fact that the refid might
             #  point to the *lemma* node, or to a parent sense node, rather
             #  than to sense node itself; hence we also need to check the
             #  refid_alt string
-            refid_string = '%,' + str(refid) + ',%'
-            candidates = candidates.filter(or_(ThesInstance.refid == refid,
-                ThesInstance.refid_alt.like(refid_string)))
+            refid_string = ',' + str(refid) + ','
+            candidates = [c for c in candidates if c.refid == refid or
+                          refid_string in (c.refid_alt or '')]
 
     if entrynode is not None:
-        candidates = candidates.filter_by(entry_node=entrynode)
+        candidates = [c for c in candidates if c.entry_node == entrynode]
 
     if thes_linked or subjects or branches:
-        candidates = candidates.filter(ThesInstance.class_id != None)
+        candidates = [c for c in candidates if c.class_id is not None]
     if subjects:
         candidates = [c for c in candidates if SUBJECT_MAPPER.matches(
             c.thesclass, subjects)]
@@ -125,15 +245,12 @@ def search(**kwargs):
         candidates = [c for c in candidates if
             any([c.thesclass.is_descendant_of(b) for b in branches])]
 
-    # Return query set as list
     if wordclass is not None:
         # Drop instances where the thesaurus class is in the wrong
         #  wordclass
         candidates = [c for c in candidates if c.thesclass is None or
             c.thesclass.wordclass is None or
             c.thesclass.penn_wordclass() == wordclass]
-    else:
-        candidates = [c for c in candidates]
 
     return candidates
 
@@ -163,13 +280,20 @@ def ranked_search(**kwargs):
             ID will be promoted to the top of the list. (Generally only
             used if the main sense is known in advance.)
     """
-    include_homographs = kwargs.get('include_homographs', False)
-    promoted_refid = kwargs.get('promote', None)
-
     if kwargs.get('current_only', False) or kwargs.get('currentOnly', False):
         candidates = search_current(**kwargs)
     else:
         candidates = search(**kwargs)
+    return _rank(candidates, **kwargs)
+
+
+def _rank(candidates, **kwargs):
+    """
+    Order a list of instances by rating (see ranked_search()).
+    """
+    include_homographs = kwargs.get('include_homographs', False)
+    promoted_refid = kwargs.get('promote', None)
+
     if not candidates:
         return []
     else:
@@ -230,25 +354,26 @@ def common_ancestor(lemmas, **kwargs):
 
 
 def best_fit(candidates_set):
-    possibles = []
-    for perm in itertools.product(*candidates_set):
-        ancestor_sets = [p.thesclass.ancestors() for p in perm]
-        shared_ancestor = None
-        for ancestor in ancestor_sets[0]:
-            shared_ancestor = True
-            for ancestor_set in ancestor_sets[1:]:
-                if not ancestor in ancestor_set:
-                    shared_ancestor = False
-            if shared_ancestor:
-                shared_ancestor = ancestor
-                break
-        if shared_ancestor:
-            possibles.append((shared_ancestor, perm))
-    possibles.sort(key=lambda ancestor: ancestor[0].branch_size)
-    try:
-        return possibles[0]
-    except IndexError:
+    """
+    Given a list of candidate lists (lists of ThesInstance objects),
+    find the combination of candidates, one from each list, whose
+    common ancestor class is smallest (by branch size).
+
+    Returns a 2-ple consisting of the common ancestor (ThesClass) and
+    the combination (tuple of ThesInstance objects); or (None, None).
+
+    See TaxonomyIndex.best_fit() for the search itself.
+    """
+    candidates_set = [[c for c in candidates if c.thesclass is not None]
+                      for candidates in candidates_set]
+    ancestor_id, combination = taxonomy_index().best_fit(
+        [[c.thesclass.id for c in candidates]
+         for candidates in candidates_set])
+    if ancestor_id is None:
         return (None, None)
+    return (get_thesclass(ancestor_id),
+            tuple([candidates[i] for candidates, i
+                   in zip(candidates_set, combination)]))
 
 
 def cross_reference_target(**kwargs):
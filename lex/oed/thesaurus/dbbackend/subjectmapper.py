@@ -6,14 +6,11 @@ SubjectMapper
 
 import os
 from collections import defaultdict
-import sqlalchemy.orm.exc
 
 from lxml import etree  # @UnresolvedImport
 
-from lex.oed.thesaurus.dbbackend import thesaurusdbconfig
-from lex.oed.thesaurus.dbbackend.models import ThesClass
+from lex.oed.thesaurus.dbbackend.classcache import CLASS_CACHE
 
-SESSION = thesaurusdbconfig.SESSION
 PARSER = etree.XMLParser(remove_blank_text=True)
 FILEPATH = os.path.join(os.path.dirname(__file__),
                         'subject_to_thesaurus_mapping.xml')
@@ -23,7 +20,6 @@ class SubjectMapper(object):
 
     subjectmap = defaultdict(set)
     subjectneg = defaultdict(set)
-    class_cache = {}
 
     def __init__(self):
         if not SubjectMapper.subjectmap:
@@ -86,16 +82,7 @@ class SubjectMapper(object):
 
 
     def _retrieve_class(self, id):
-        id = int(id)
-        try:
-            return SubjectMapper.class_cache[id]
-        except KeyError:
-            try:
-                thesclass = SESSION.query(ThesClass).filter_by(id=id).one()
-            except sqlalchemy.orm.exc.NoResultFound:
-                thesclass = None
-            SubjectMapper.class_cache[id] = thesclass
-            return thesclass
+        return CLASS_CACHE.get(id)
 
     def topics_to_nodes(self, topics):
         """
@@ -0,0 +1,281 @@
+"""
+TaxonomyIndex -- in-memory index of the thesaurus taxonomy, for
+ancestor/descendant queries without touching the database
+
+@author: James McCracken
+"""
+
+from array import array
+
+
+class TaxonomyIndex(object):
+
+    """
+    In-memory index of the thesaurus class hierarchy.
+
+    Built once from (class ID, parent ID) pairs (optionally with the
+    branch size of each class as a third value), e.g.:
+    >>> index = TaxonomyIndex(SESSION.query(ThesClass.id,
+                                            ThesClass.parent_id,
+                                            ThesClass.branch_size))
+
+    Each class is numbered in depth-first (pre-order) sequence, so that
+    the descendants of a class form a contiguous interval of numbers;
+    so testing whether one class is a descendant of another is O(1).
+    Lowest common ancestors are found by binary lifting (O(log n)).
+
+    Classes are identified by their IDs throughout; a class whose
+    parent is missing from the index is treated as a root.
+    """
+
+    def __init__(self, rows):
+        parent_ids = {}
+        self.branch_sizes = {}
+        for row in rows:
+            parent_ids[row[0]] = row[1]
+            if len(row) > 2:
+                self.branch_sizes[row[0]] = row[2]
+
+        # Number the classes, and link each one to its parent
+        self.ids = sorted(parent_ids.keys())
+        self.position = {class_id: i for i, class_id in enumerate(self.ids)}
+        size = len(self.ids)
+        self.parent = array('l', [self.position.get(parent_ids[class_id], -1)
+                                  for class_id in self.ids])
+        children = [[] for _ in range(size)]
+        for i in range(size):
+            if self.parent[i] != -1:
+                children[self.parent[i]].append(i)
+
+        # Depth-first traversal from each root (iterative, since the
+        #  taxonomy is too deep for recursion): self.start[i] is the
+        #  pre-order number of class i, and self.end[i] is one more than
+        #  the pre-order number of its last descendant.
+        self.depth = array('l', [0]) * size
+        self.start = array('l', [0]) * size
+        self.end = array('l', [0]) * size
+        self.preorder = array('l', [0]) * size
+        counter = 0
+        for root in range(size):
+            if self.parent[root] != -1:
+                continue
+            stack = [(root, False)]
+            while stack:
+                node, finished = stack.pop()
+                if finished:
+                    self.end[node] = counter
+                    continue
+                self.start[node] = counter
+                self.preorder[counter] = node
+                counter += 1
+                stack.append((node, True))
+                for child in reversed(children[node]):
+                    self.depth[child] = self.depth[node] + 1
+                    stack.append((child, False))
+        if counter < size:
+            raise ValueError('Thesaurus taxonomy contains a cycle')
+
+        # Binary lifting table: self.jumps[k][i] is the 2**k-th ancestor
+        #  of class i (or -1 if there is none)
+        self.jumps = [self.parent]
+        max_depth = max(self.depth) if size else 0
+        while (1 << len(self.jumps)) <= max_depth:
+            previous = self.jumps[-1]
+            self.jumps.append(array('l', [previous[p] if p != -1 else -1
+                                          for p in previous]))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, class_id):
+        return class_id in self.position
+
+    def _position(self, class_id):
+        if hasattr(class_id, 'id'):
+            class_id = class_id.id
+        return self.position[int(class_id)]
+
+    def parent_id(self, class_id):
+        parent = self.parent[self._position(class_id)]
+        if parent == -1:
+            return None
+        return self.ids[parent]
+
+    def level(self, class_id):
+        """
+        Return the depth of the class (1 for a root class, to match
+        ThesClass.level).
+        """
+        return self.depth[self._position(class_id)] + 1
+
+    def ancestor_ids(self, class_id):
+        """
+        Return a list of ancestor class IDs in ascending order,
+        beginning with the class itself (cf. ThesClass.ancestors()).
+        """
+        i = self._position(class_id)
+        ancestors = []
+        while i != -1:
+            ancestors.append(self.ids[i])
+            i = self.parent[i]
+        return ancestors
+
+    def descendant_ids(self, class_id):
+        """
+        Return a list of descendant class IDs (not including the class
+        itself), in depth-first order.
+        """
+        i = self._position(class_id)
+        return [self.ids[node] for node in
+                self.preorder[self.start[i] + 1:self.end[i]]]
+
+    def is_descendant(self, class_id, ancestor_id):
+        """
+        Return True if the first class is the same as, or a descendant
+        of, the second (cf. ThesClass.is_descendant_of()).
+        """
+        try:
+            i = self._position(class_id)
+            j = self._position(ancestor_id)
+        except (KeyError, TypeError, ValueError):
+            return False
+        return self.start[j] <= self.start[i] < self.end[j]
+
+    def lowest_common_ancestor(self, *class_ids):
+        """
+        Return the ID of the lowest class which is the same as, or an
+        ancestor of, every class given; or None if the classes don't
+        share a root.
+        """
+        positions = [self._position(class_id) for class_id in class_ids]
+        if not positions:
+            return None
+        common = positions[0]
+        for other in positions[1:]:
+            common = self._lca(common, other)
+            if common == -1:
+                return None
+        return self.ids[common]
+
+    def _lca(self, i, j):
+        if self.start[i] <= self.start[j] < self.end[i]:
+            return i
+        if self.start[j] <= self.start[i] < self.end[j]:
+            return j
+        # Climb from i to the highest ancestor which is *not* an ancestor
+        #  of j; its parent is the common ancestor.
+        for jumps in reversed(self.jumps):
+            ancestor = jumps[i]
+            if ancestor != -1 and not (self.start[ancestor] <=
+                                       self.start[j] < self.end[ancestor]):
+                i = ancestor
+        return self.parent[i]
+
+    def branch_size(self, class_id):
+        return self.branch_sizes.get(self.ids[self._position(class_id)], 0)
+
+    def covering_ancestor(self, class_id, class_id_sets):
+        """
+        Return the ID of the lowest class which is the same as, or an
+        ancestor of, the class given, and whose branch also includes at
+        least one class from each of the sets given; or None if there
+        is no such class.
+        """
+        covering = self._position(class_id)
+        for class_ids in class_id_sets:
+            lowest = -1
+            for other in class_ids:
+                common = self._lca(covering, self._position(other))
+                if common != -1 and (lowest == -1 or
+                                     self.depth[common] > self.depth[lowest]):
+                    lowest = common
+            if lowest == -1:
+                return None
+            # Both are ancestors of the class given, so the higher one
+            #  is an ancestor of the other
+            covering = lowest
+        return self.ids[covering]
+
+    def best_fit(self, class_id_sets):
+        """
+        Given a list of sets (lists) of class IDs, find the combination
+        of classes, one from each set, whose lowest common ancestor has
+        the smallest branch size.
+
+        Returns a 2-ple consisting of the ID of the common ancestor and
+        the combination (as a tuple of indexes into each set); or
+        (None, None) if no combination has a common ancestor.
+
+        The result is the same as checking every combination in turn
+        (cf. itertools.product()) and keeping the first best one; but a
+        partial combination is abandoned as soon as it can't beat the
+        best found so far. Since the branch size of a class is never
+        less than that of any of its descendants, the branch size of the
+        lowest class that could be the common ancestor of any completion
+        of a partial combination (see covering_ancestor()) is a lower
+        bound on what that combination can achieve.
+        """
+        # Classes not in the index are skipped (but indexes still refer
+        #  to the original sets)
+        indexed = [[(i, class_id) for i, class_id in enumerate(class_ids)
+                    if class_id in self] for class_ids in class_id_sets]
+        class_id_sets = [[class_id for i, class_id in pairs]
+                         for pairs in indexed]
+        if not class_id_sets or not all(class_id_sets):
+            return (None, None)
+
+        best = {'size': None, 'ancestor': None, 'combination': None}
+
+        def search(depth, ancestor_id, combination):
+            if depth == len(class_id_sets):
+                size = self.branch_size(ancestor_id)
+                if best['size'] is None or size < best['size']:
+                    best.update(size=size, ancestor=ancestor_id,
+                                combination=combination)
+                return
+            for i, class_id in indexed[depth]:
+                if depth == 0:
+                    common = class_id
+                else:
+                    common = self.lowest_common_ancestor(ancestor_id,
+                                                         class_id)
+                    if common is None:
+                        continue
+                bound = self.covering_ancestor(common,
+                                               class_id_sets[depth + 1:])
+                if bound is None:
+                    continue
+                if (best['size'] is not None and
+                        self.branch_size(bound) >= best['size']):
+                    continue
+                search(depth + 1, common, combination + (i,))
+
+        search(0, None, ())
+        return (best['ancestor'], best['combination'])
+
+    def remove_redundant(self, class_ids):
+        """
+        Filter a list of class IDs so as to remove duplicates and any
+        class which is a descendant of another class in the list
+        (preserving order). IDs not in the index are kept.
+        """
+        seen = set()
+        interim = []
+        for class_id in class_ids:
+            if not class_id in seen:
+                interim.append(class_id)
+                seen.add(class_id)
+        known = [class_id for class_id in interim if class_id in self]
+        # Sort by interval, so that each class need only be checked
+        #  against the nearest preceding class that wasn't dropped
+        known.sort(key=lambda class_id: (self.start[self.position[class_id]],
+                                         -self.end[self.position[class_id]]))
+        dropped = set()
+        current = None
+        for class_id in known:
+            i = self.position[class_id]
+            if current is not None and self.start[i] < self.end[current]:
+                dropped.add(class_id)
+            else:
+                current = i
+        return [class_id for class_id in interim if not class_id in dropped]
@@ -14,11 +14,14 @@ CONTENT_DIR = lexconfig.HTOED_CONTENT_DIR
 
 
 def store_taxonomy():
-    populator.store_taxonomy(TAXONOMY_DIR)
+    timings = populator.store_taxonomy(TAXONOMY_DIR)
+    queryengine.reset_taxonomy_index()
+    queryengine.CLASS_CACHE.clear()
+    return timings
 
 
-def store_content():
-    populator.store_content(CONTENT_DIR)
+def store_content(processes=None):
+    return populator.store_content(CONTENT_DIR, processes=processes)
 
 
 def reset():
@@ -52,6 +55,14 @@ def ranked_search(**kwargs):
     return queryengine.ranked_search(**kwargs)
 
 
+def search_many(lemmas, **kwargs):
+    """
+    Like ranked_search(), but for a list of lemmas; returns a dict
+    mapping each lemma to its ranked results.
+    """
+    return queryengine.search_many(lemmas, **kwargs)
+
+
 def distinct_senses(instances):
     """
     Return the number of distinct senses represented by a set of
@@ -80,10 +91,31 @@ def child_wordclass_branch(class_id, wordclass):
     return equivalentclass.child_wordclass_branch(class_id, wordclass)
 
 
+def taxonomy_index():
+    return queryengine.taxonomy_index()
+
+
+def is_descendant(class_id, ancestor_id):
+    return queryengine.is_descendant(class_id, ancestor_id)
+
+
+def lowest_common_ancestor(classes):
+    return queryengine.lowest_common_ancestor(classes)
+
+
 def get_thesclass(class_id):
     return queryengine.get_thesclass(class_id)
 
 
+def class_cache():
+    """
+    Return the shared cache of thesaurus classes (see
+    dbbackend/classcache.py), e.g. for stats(), preload(), or
+    save_snapshot().
+    """
+    return queryengine.CLASS_CACHE
+
+
 def get_superordinate_record(superordinate):
     return queryengine.get_superordinate_record(superordinate)
 
@@ -99,21 +131,14 @@ def remove_redundant_classes(classes):
 
     Returns a list (preserving the order of the original iterable).
     """
-    # Remove duplicates
-    seen = set()
-    interim = []
-    for thesaurus_class in classes:
-        if thesaurus_class.id not in seen:
-            interim.append(thesaurus_class)
-            seen.add(thesaurus_class.id)
-    # Remove descendants
+    classes = list(classes)
+    retained = set(queryengine.taxonomy_index().remove_redundant(
+        [thesaurus_class.id for thesaurus_class in classes]))
     output = []
-    for thesaurus_class in interim:
-        if any([thesaurus_class != c and
-                thesaurus_class.is_descendant_of(c) for c in interim]):
-            pass
-        else:
+    for thesaurus_class in classes:
+        if thesaurus_class.id in retained:
             output.append(thesaurus_class)
+            retained.discard(thesaurus_class.id)
     return output
 
 
@@ -1,5 +1,7 @@
 """
 VariantsCache - system for retrieving cached XML variant-form lists
+VariantsCacheCompiler - compile cached XML variant-form lists into
+    an indexed database
 to_xml()
 from_xml()
 
@@ -7,6 +9,9 @@ from_xml()
 """
 
 import os
+import json
+import hashlib
+import sqlite3
 from collections import namedtuple, defaultdict
 
 from lxml import etree  # @UnresolvedImport
@@ -14,12 +19,30 @@ from lxml import etree  # @UnresolvedImport
 from lex.oed.variants.variantform import VariantForm
 from lex.oed.daterange import DateRange
 from lex import lexconfig
+from lrucache import LRUCache
 
 DEFAULT_DIR = lexconfig.OED_VARIANTS_DIR
 MINIMUM_DATE = 1200
 VariantSet = namedtuple('VariantSet', ['entry_id', 'lexid', 'lemma',
                         'wordclass', 'num_quotations', 'date',
                         'revised_status', 'variants'])
+# Compiled database (see VariantsCacheCompiler), kept in the same
+#  directory as the XML files
+DB_FILENAME = 'variants.sqlite'
+# Manifest written by VariantsLister (see VariantsCacheCompiler.is_stale())
+MANIFEST_FILENAME = 'manifest.json'
+# Maximum number of lookups held in memory when reading from the
+#  compiled database
+LOOKUP_CACHE_SIZE = 50000
+# Columns of the compiled database (one row per variant set)
+COLUMN_TYPES = (('entry_id', 'TEXT'), ('lexid', 'TEXT'), ('lemma', 'TEXT'),
+                ('wordclass', 'TEXT'), ('num_quotations', 'INTEGER'),
+                ('date_start', 'INTEGER'), ('date_end', 'INTEGER'),
+                ('obsolete', 'INTEGER'), ('revised_status', 'TEXT'),
+                ('variants', 'TEXT'))
+COLUMNS = [column for column, _ in COLUMN_TYPES]
+# Bit flags for VariantForm attributes, in the compiled database
+REGIONAL, IRREGULAR, EN_ENDING, UNDATED = 1, 2, 4, 8
 
 
 class VariantsCache(object):
@@ -70,13 +93,73 @@ class VariantsCache(object):
         </variants>
       </s1>
     </e>
+
+    If the XML documents have been compiled into a database (using
+    VariantsCacheCompiler), variant sets are looked up in the database
+    one key (entry ID or headword) at a time, with the most recent
+    lookups held in an LRU cache; so nothing needs to be loaded up front.
+    Otherwise (or if the database is older than the XML documents), all
+    the XML documents are parsed into memory on first use.
     """
 
     cache = None
+    lookups = LRUCache(max_size=LOOKUP_CACHE_SIZE)
+    connections = {}
+    # Databases found to be missing or stale, mapped to the mtimes of
+    #  the database and the manifest at the time (see self.connection())
+    unusable = {}
 
     def __init__(self, **kwargs):
         self.directory = kwargs.get('dir') or DEFAULT_DIR
         self.wordclasses = kwargs.get('wordclasses')
+        self.db_file = (kwargs.get('db_file') or
+                        os.path.join(self.directory, DB_FILENAME))
+
+    def connection(self):
+        """
+        Return a connection to the compiled database, or None if there
+        is no compiled database (or it's out of date).
+
+        Connections are kept at class level, one per process. If there's
+        no usable database, this is noted along with the mtimes of the
+        database and the manifest; the database is only checked again
+        once one of these has changed (e.g. once it's been compiled
+        since).
+        """
+        key = (self.db_file, os.getpid())
+        try:
+            return VariantsCache.connections[key]
+        except KeyError:
+            mtime = (_mtime(self.db_file),
+                     _mtime(os.path.join(self.directory, MANIFEST_FILENAME)))
+            if VariantsCache.unusable.get(self.db_file, -1) == mtime:
+                return None
+            if VariantsCacheCompiler(dir=self.directory,
+                                     db_file=self.db_file).is_stale():
+                VariantsCache.unusable[self.db_file] = mtime
+                return None
+            VariantsCache.unusable.pop(self.db_file, None)
+            connection = sqlite3.connect(self.db_file)
+            VariantsCache.connections[key] = connection
+            return connection
+
+    def _lookup(self, column, value):
+        """
+        Return the list of variant sets in the compiled database with
+        the given entry ID or headword (via the LRU cache).
+        """
+        key = (self.db_file, column, value)
+        varsets = VariantsCache.lookups.get(key)
+        if varsets is None:
+            rows = self.connection().execute(
+                'SELECT %s FROM varsets WHERE %s = ? '
+                'ORDER BY file, position' % (', '.join(COLUMNS), column),
+                (value,))
+            varsets = [_decode_varset(row) for row in rows]
+            VariantsCache.lookups.put(key, varsets)
+        if self.wordclasses is not None:
+            varsets = [vs for vs in varsets if self.contains_wordclasses(vs)]
+        return varsets
 
     def load_cache(self, **kwargs):
         files = sorted([f for f in os.listdir(self.directory)
@@ -113,6 +196,8 @@ class VariantsCache(object):
             return False
 
     def id_exists(self, entry_id):
+        if self.connection() is not None:
+            return bool(self._lookup('entry_id', entry_id))
         if not VariantsCache.cache:
             self.load_cache()
         if entry_id in VariantsCache.cache:
@@ -125,6 +210,18 @@ class VariantsCache(object):
         entry_id = kwargs.get('id')
         wordclass = kwargs.get('wordclass')
 
+        if self.connection() is not None:
+            variant_sections = []
+            if lemma is not None:
+                variant_sections = self._lookup('lemma', lemma)
+            if not variant_sections and entry_id is not None:
+                variant_sections = self._lookup('entry_id', entry_id)
+            if wordclass is not None:
+                return [vs for vs in variant_sections
+                        if vs.wordclass == wordclass]
+            else:
+                return variant_sections[:]
+
         if not VariantsCache.cache:
             self.load_cache()
 
@@ -151,6 +248,231 @@ class VariantsCache(object):
         except IndexError:
             return None
 
+
+class VariantsCacheCompiler(object):
+
+    """
+    Compile the XML documents used by VariantsCache into a single
+    SQLite database, indexed by entry ID, headword, and wordclass.
+
+    >>> VariantsCacheCompiler(dir=variants_dir).compile()
+
+    Each variant set is one row; the variant forms themselves are
+    stored as a JSON-encoded column, and only decoded when the
+    variant set is retrieved.
+    """
+
+    # Checksums read from each manifest, along with the manifest's
+    #  mtime (see self.manifest_checksums())
+    checksums = {}
+
+    def __init__(self, **kwargs):
+        self.directory = kwargs.get('dir') or DEFAULT_DIR
+        self.db_file = (kwargs.get('db_file') or
+                        os.path.join(self.directory, DB_FILENAME))
+
+    def files(self):
+        return [os.path.join(self.directory, f) for f in
+                sorted(os.listdir(self.directory)) if f.endswith('.xml')]
+
+    def manifest_checksums(self):
+        """
+        Return a dict of the checksum of each XML document, as listed
+        in the manifest written by VariantsLister; or None if there
+        is no manifest.
+
+        The manifest also holds each entry's fingerprint, so is slow
+        to read; the checksums are kept until its mtime changes.
+        """
+        manifest_file = os.path.join(self.directory, MANIFEST_FILENAME)
+        mtime = _mtime(manifest_file)
+        if mtime is None:
+            return None
+        try:
+            cached_mtime, checksums = self.checksums[manifest_file]
+        except KeyError:
+            cached_mtime = None
+        if cached_mtime != mtime:
+            with open(manifest_file) as filehandle:
+                manifest = json.load(filehandle)
+            checksums = {shard['file']: shard['sha1']
+                         for shard in manifest['shards']}
+            self.checksums[manifest_file] = (mtime, checksums)
+        return dict(checksums)
+
+    def compiled_checksums(self):
+        """
+        Return a dict of the checksum of each XML document, as recorded
+        when the database was compiled; or None if the database does not
+        exist (or predates checksums).
+        """
+        if not os.path.exists(self.db_file):
+            return None
+        connection = sqlite3.connect(self.db_file)
+        try:
+            return dict(connection.execute('SELECT file, sha1 FROM files'))
+        except sqlite3.OperationalError:
+            return None
+        finally:
+            connection.close()
+
+    def is_stale(self):
+        """
+        Return True if the database does not exist, or is out of date
+        with the XML documents.
+
+        If VariantsLister has written a manifest, the checksums in the
+        manifest are compared against those recorded in the database;
+        otherwise, the database is stale if it's older than any of the
+        XML documents.
+        """
+        if not os.path.exists(self.db_file):
+            return True
+        manifest = self.manifest_checksums()
+        if manifest is not None:
+            return manifest != self.compiled_checksums()
+        db_time = os.path.getmtime(self.db_file)
+        return any([os.path.getmtime(f) > db_time for f in self.files()])
+
+    def compile(self, **kwargs):
+        """
+        Bring the database up to date with the XML documents.
+
+        If the database already exists and VariantsLister has written a
+        manifest, only the XML documents whose checksums have changed
+        are reloaded (unless the 'rebuild' keyword argument is True).
+        Otherwise the database is rebuilt from scratch.
+
+        Returns the number of XML documents loaded.
+        """
+        manifest = self.manifest_checksums()
+        compiled = self.compiled_checksums()
+        if manifest is None or compiled is None or kwargs.get('rebuild'):
+            count = self._rebuild(manifest)
+        else:
+            count = self._update(manifest, compiled)
+
+        # Drop anything cached from a previous version of the database
+        for key in [k for k in VariantsCache.connections
+                    if k[0] == self.db_file]:
+            VariantsCache.connections.pop(key).close()
+        VariantsCache.unusable.pop(self.db_file, None)
+        VariantsCache.lookups.clear()
+        return count
+
+    def _rebuild(self, manifest):
+        temp_file = self.db_file + '.tmp'
+        if os.path.exists(temp_file):
+            os.unlink(temp_file)
+        connection = sqlite3.connect(temp_file)
+        connection.execute('CREATE TABLE varsets (%s, file TEXT, '
+                           'position INTEGER)' % ', '.join(
+            ['%s %s' % column_type for column_type in COLUMN_TYPES]))
+        connection.execute('CREATE TABLE files (file TEXT PRIMARY KEY, '
+                           'sha1 TEXT)')
+        for filepath in self.files():
+            self._load_file(connection, filepath, manifest)
+        for column in ('entry_id', 'lemma', 'wordclass', 'file'):
+            connection.execute('CREATE INDEX %s_index ON varsets (%s)' %
+                               (column, column))
+        connection.commit()
+        connection.close()
+        os.replace(temp_file, self.db_file)
+        return len(self.files())
+
+    def _update(self, manifest, compiled):
+        changed = [filename for filename in sorted(manifest)
+                   if compiled.get(filename) != manifest[filename]]
+        removed = [filename for filename in compiled
+                   if not filename in manifest]
+        connection = sqlite3.connect(self.db_file)
+        for filename in changed + removed:
+            connection.execute('DELETE FROM varsets WHERE file = ?',
+                               (filename,))
+            connection.execute('DELETE FROM files WHERE file = ?',
+                               (filename,))
+        for filename in changed:
+            self._load_file(connection, os.path.join(self.directory,
+                                                     filename), manifest)
+        connection.commit()
+        connection.close()
+        return len(changed)
+
+    def _load_file(self, connection, filepath, manifest):
+        """
+        Load the variant sets from a single XML document into the
+        database.
+        """
+        filename = os.path.basename(filepath)
+        with open(filepath, 'rb') as filehandle:
+            content = filehandle.read()
+        if manifest is not None and filename in manifest:
+            sha1 = manifest[filename]
+        else:
+            sha1 = hashlib.sha1(content).hexdigest()
+
+        rows = []
+        for entry in etree.fromstring(content).findall('./e'):
+            entry_id = entry.get('id')
+            revised_status = entry.get('vfsect', 'omitted')
+            headword = entry.findtext('./hw')
+            for block in entry.findall('./s1'):
+                varset = _varset_factory(headword, entry_id,
+                                         block, revised_status)
+                rows.append(_encode_varset(varset) +
+                            (filename, len(rows)))
+        connection.executemany('INSERT INTO varsets VALUES (%s)' %
+                               ', '.join(['?' for c in COLUMNS] + ['?', '?']),
+                               rows)
+        connection.execute('INSERT INTO files VALUES (?, ?)',
+                           (filename, sha1))
+
+
+def _mtime(filepath):
+    """
+    Return the mtime of the file, or None if it doesn't exist.
+    """
+    try:
+        return os.path.getmtime(filepath)
+    except OSError:
+        return None
+
+
+def _encode_varset(varset):
+    variants = [[wordclass, [[vf.original_form, vf.date.start, vf.date.end,
+                              _encode_flags(vf)] for vf in vf_list]]
+                for wordclass, vf_list in varset.variants.items()]
+    return (varset.entry_id, varset.lexid, varset.lemma, varset.wordclass,
+            varset.num_quotations, varset.date.start, varset.date.end,
+            int(varset.date.explicit_obs), varset.revised_status,
+            json.dumps(variants, ensure_ascii=False))
+
+
+def _decode_varset(row):
+    (entry_id, lexid, lemma, wordclass, num_quotations, date_start,
+     date_end, obsolete, revised_status, variants_json) = row
+    date = DateRange(start=date_start, end=date_end, obs=bool(obsolete))
+    variants = {}
+    for var_wordclass, vf_list in json.loads(variants_json):
+        variants[var_wordclass] = []
+        for form, start, end, flags in vf_list:
+            variant_form = VariantForm(form, start, end)
+            variant_form.regional = bool(flags & REGIONAL)
+            variant_form.irregular = bool(flags & IRREGULAR)
+            variant_form.has_en_ending = bool(flags & EN_ENDING)
+            variant_form.undated = bool(flags & UNDATED)
+            variants[var_wordclass].append(variant_form)
+    return VariantSet(entry_id, lexid, lemma, wordclass, num_quotations,
+                      date, revised_status, variants)
+
+
+def _encode_flags(variant_form):
+    return ((REGIONAL if variant_form.regional else 0) |
+            (IRREGULAR if variant_form.irregular else 0) |
+            (EN_ENDING if variant_form.has_en_ending else 0) |
+            (UNDATED if variant_form.undated else 0))
+
+
 def _varset_factory(lemma, entry_id, node, revised_status):
     num_quotations = int(node.get('size', 0))
     lexid = node.get('lexid')
@@ -5,6 +5,9 @@ VariantsLister - System for caching variant-forms lists as XML.
 """
 
 import os
+import json
+import hashlib
+from functools import partial
 
 from lxml import etree  # @UnresolvedImport
 
@@ -21,6 +24,9 @@ DEFAULT_OUTPUT = lexconfig.OED_VARIANTS_DIR
 
 BASECLASSES = variantsconfig.BASECLASSES
 FILE_SIZE = variantsconfig.CACHE_FILE_SIZE
+# Manifest listing the entries in each output document, and the
+#  fingerprint of each entry (see VariantsLister.update_variants())
+MANIFEST_FILENAME = variantscache.MANIFEST_FILENAME
 
 # Since prefix/suffix entries have arbitrary quotation evidence (if any),
 #  we use this to supply a usable date range
@@ -40,6 +46,16 @@ class VariantsLister(object):
 
     >>> lister = VariantsLister(in_dir, out_dir)
     >>> lister.list_variants()
+
+    Once the output documents have been built, they can be brought
+    up to date with a later version of the OED using update_variants(),
+    which only recomputes entries that have changed (and only rewrites
+    the documents containing them):
+    >>> lister.update_variants(processes=8)
+
+    Both methods write a manifest (manifest.json in the output
+    directory) recording the entries in each output document, a
+    checksum for each document, and a fingerprint for each entry.
     """
 
     def __init__(self, **kwargs):
@@ -49,6 +65,8 @@ class VariantsLister(object):
         self.entry = None
         self.root = None
         self.buffersize = 0
+        self.shards = []
+        self.fingerprints = {}
 
     def list_variants(self):
         """
@@ -59,6 +77,8 @@ class VariantsLister(object):
         """
         self._clear_outdir()
         self._initialize_root()
+        self.shards = []
+        self.fingerprints = {}
         iterator = EntryIterator(path=self.in_dir,
                                  dictType='oed',
                                  verbosity='low',
@@ -66,6 +86,7 @@ class VariantsLister(object):
                                  fixLigatures=True)
         for entry in iterator.iterate():
             self.entry = entry
+            self.fingerprints[entry.id] = fingerprint(entry)
             self._process_entry()
             if self.buffersize >= FILE_SIZE:
                 self._writebuffer()
@@ -73,6 +94,149 @@ class VariantsLister(object):
         # Write a file for anything still left in the buffer after the
         #  entry iterator has completed
         self._writebuffer()
+        self._write_manifest()
+
+    def update_variants(self, **kwargs):
+        """
+        Bring the output XML documents up to date with the OED,
+        recomputing only those entries whose fingerprint has changed
+        since the last run (or which are new).
+
+        Entries are fingerprinted and (if necessary) recomputed in
+        a pool of worker processes (see EntryIterator.parallel_map()).
+        Output documents containing changed, new, or deleted entries
+        are rewritten; other documents are left untouched. New
+        entries go into the same document as the entry preceding them;
+        if that document grows to more than twice FILE_SIZE, it's split
+        into documents of FILE_SIZE (as in list_variants()), named so
+        as to sort between it and the next document.
+
+        If there is no manifest from a previous run, all the output
+        documents are built from scratch.
+
+        Keyword arguments:
+         -- processes, shard_size: passed to EntryIterator.parallel_map().
+
+        Returns the number of entries recomputed.
+        """
+        manifest = self._read_manifest()
+        if manifest is None:
+            self._clear_outdir()
+            manifest_file = None
+            old_shards = []
+        else:
+            manifest_file = os.path.join(self.out_dir, MANIFEST_FILENAME)
+            old_shards = manifest['shards']
+
+        iterator = EntryIterator(path=self.in_dir,
+                                 dictType='oed',
+                                 verbosity='low',
+                                 fixLigatures=True)
+        function = partial(_list_entry, manifest_file=manifest_file)
+        results = iterator.parallel_map(function,
+                                        processes=kwargs.get('processes'),
+                                        shard_size=kwargs.get('shard_size'))
+
+        shard_of = {}
+        for shard in old_shards:
+            for entry_id in shard['entries']:
+                shard_of[entry_id] = shard['file']
+        layout = {shard['file']: [] for shard in old_shards}
+        # Sizes of new documents (only started if there's no existing
+        #  document to add to, i.e. when building from scratch)
+        sizes = {}
+        dirty = set()
+        new_nodes = {}
+        self.fingerprints = {}
+        self.filecount = max([int(_split_filename(shard['file'])[0])
+                              for shard in old_shards] or [0])
+        current = old_shards[0]['file'] if old_shards else None
+        recomputed = 0
+        for entry_id, entry_fingerprint, serialized, size in results:
+            self.fingerprints[entry_id] = entry_fingerprint
+            if entry_id in shard_of:
+                current = shard_of[entry_id]
+            elif current is None or sizes.get(current, 0) >= FILE_SIZE:
+                # Start a new output document
+                current = os.path.basename(self._next_filename())
+                layout[current] = []
+                sizes[current] = 0
+            if current in sizes:
+                sizes[current] += size
+            layout[current].append(entry_id)
+            if serialized is not None:
+                new_nodes[entry_id] = serialized
+                dirty.add(current)
+                recomputed += 1
+
+        # Documents from which entries have been deleted
+        for shard in old_shards:
+            if len(layout[shard['file']]) != len(shard['entries']):
+                dirty.add(shard['file'])
+
+        old_files = {shard['file']: shard for shard in old_shards}
+        filenames = sorted(layout)
+        self.shards = []
+        for i, filename in enumerate(filenames):
+            if not layout[filename]:
+                os.unlink(os.path.join(self.out_dir, filename))
+            elif filename in dirty:
+                following = (filenames[i + 1] if i + 1 < len(filenames)
+                             else None)
+                self.shards.extend(self._rewrite_shard(
+                    filename, layout[filename], new_nodes, following))
+            else:
+                self.shards.append(old_files[filename])
+        self._write_manifest()
+        return recomputed
+
+    def _rewrite_shard(self, filename, entry_ids, new_nodes, following):
+        """
+        Rewrite an output document with the entries listed, taking
+        each entry either from new_nodes (if it's been recomputed) or
+        from the existing version of the document.
+
+        If the document has grown to more than twice FILE_SIZE, it's
+        split up, with the new documents named so as to sort between
+        this one and the following one. Returns the manifest record
+        for each document written.
+        """
+        filepath = os.path.join(self.out_dir, filename)
+        old_nodes = {}
+        if os.path.exists(filepath):
+            parser = etree.XMLParser(remove_blank_text=True)
+            for node in etree.parse(filepath, parser).findall('./e'):
+                old_nodes[node.get('id')] = node
+        nodes = []
+        for entry_id in entry_ids:
+            if entry_id in new_nodes:
+                nodes.append(etree.fromstring(new_nodes[entry_id]))
+            else:
+                nodes.append(old_nodes[entry_id])
+
+        sizes = [len(node.findall('.//vf')) for node in nodes]
+        chunks = [[]]
+        if sum(sizes) > FILE_SIZE * 2:
+            # Break wherever list_variants() would have done
+            buffersize = 0
+            for node, size in zip(nodes, sizes):
+                if buffersize >= FILE_SIZE:
+                    chunks.append([])
+                    buffersize = 0
+                chunks[-1].append(node)
+                buffersize += size
+        else:
+            chunks[0] = nodes
+
+        records = []
+        filenames = [filename] + _filenames_between(filename, following,
+                                                    len(chunks) - 1)
+        for chunk_filename, chunk in zip(filenames, chunks):
+            self.root = etree.Element('entries')
+            for node in chunk:
+                self.root.append(node)
+            records.append(self._writebuffer(filename=chunk_filename))
+        return records
 
     def _clear_outdir(self):
         """
@@ -96,6 +260,16 @@ class VariantsLister(object):
          -- turn this into a XML node;
          -- append this XML node to the current XML root.
         """
+        entry_tree, size = self._entry_node()
+        self.root.append(entry_tree)
+        self.buffersize += size
+
+    def _entry_node(self):
+        """
+        Return the XML node for the current entry, along with the
+        total number of variant forms listed in it.
+        """
+        size = 0
         entry_tree = etree.Element('e',
                                    id=self.entry.id,
                                    vfsect=self.entry.variants().revised_status(),
@@ -160,11 +334,9 @@ class VariantsLister(object):
                         variants_node = variantscache.to_xml(inflection,
                                                              vf_list)
                         s1_node.append(variants_node)
-                        self.buffersize += len(vf_list)
+                        size += len(vf_list)
                 entry_tree.append(s1_node)
-
-        # Append the xml for this entry to the main root node
-        self.root.append(entry_tree)
+        return entry_tree, size
 
     def _filter_by_inflection(self, inflection, block_date):
         if inflection in BASECLASSES or inflection == 'affix':
@@ -228,16 +400,49 @@ class VariantsLister(object):
                 variant_form.irregular = False
                 variant_form.date.reset('end', self.entry.date().projected_end())
 
-    def _writebuffer(self):
+    def _writebuffer(self, filename=None):
         """
-        Write the current root to file
+        Write the current root to file (either a new file, or replacing
+        an existing file), and return its manifest record.
         """
-        fname = self._next_filename()
-        with open(fname, 'w') as filehandle:
-            filehandle.write(etree.tostring(self.root,
-                                            # xml_declaration=True,
-                                            pretty_print=True,
-                                            encoding='unicode'))
+        if filename is None:
+            fname = self._next_filename()
+        else:
+            fname = os.path.join(self.out_dir, filename)
+        content = etree.tostring(self.root,
+                                 # xml_declaration=True,
+                                 pretty_print=True,
+                                 encoding='unicode')
+        content = content.encode('utf-8')
+        with open(fname + '.tmp', 'wb') as filehandle:
+            filehandle.write(content)
+        os.replace(fname + '.tmp', fname)
+
+        record = {'file': os.path.basename(fname),
+                  'entries': [node.get('id') for node in self.root],
+                  'size': len(self.root.findall('.//vf')),
+                  'sha1': hashlib.sha1(content).hexdigest()}
+        if filename is None:
+            self.shards.append(record)
+        return record
+
+    def _read_manifest(self):
+        """
+        Return the manifest from the previous run, or None if there
+        isn't one.
+        """
+        manifest_file = os.path.join(self.out_dir, MANIFEST_FILENAME)
+        if not os.path.exists(manifest_file):
+            return None
+        with open(manifest_file) as filehandle:
+            return json.load(filehandle)
+
+    def _write_manifest(self):
+        manifest_file = os.path.join(self.out_dir, MANIFEST_FILENAME)
+        with open(manifest_file + '.tmp', 'w') as filehandle:
+            json.dump({'shards': self.shards,
+                       'fingerprints': self.fingerprints}, filehandle)
+        os.replace(manifest_file + '.tmp', manifest_file)
 
     def _next_filename(self):
         """
@@ -248,6 +453,111 @@ class VariantsLister(object):
         return os.path.join(self.out_dir, filename)
 
 
+def fingerprint(entry):
+    """
+    Return a fingerprint (SHA-1 hex digest) of everything in the entry
+    that VariantsLister uses: the forms list, headwords, and the dates,
+    quotation counts, wordclass, and definition of each s1 block.
+
+    This is much cheaper than computing the variant-forms list itself,
+    so it's used to decide whether an entry needs to be recomputed.
+    """
+    parts = [entry.id, entry.headword,
+             [headword.lemma for headword in entry.headwords()],
+             etree.tounicode(entry.date().xml()),
+             entry.num_quotations_main(), entry.num_quotations()]
+    for tag in ('vfSectLoose', 'vfSect'):
+        node = entry.node.find('./' + tag)
+        if node is not None:
+            parts.append(etree.tounicode(node, with_tail=False))
+    for block in entry.s1blocks():
+        wordclass = block.primary_wordclass()
+        parts.append([block.node_id(), etree.tounicode(block.date().xml()),
+                      block.num_quotations(), wordclass.penn,
+                      wordclass.source, block.definition(length=50)])
+    return hashlib.sha1(json.dumps(parts).encode('utf-8')).hexdigest()
+
+
+def _split_filename(filename):
+    """
+    Split an output document's filename into its number and (for
+    documents split off from another, see _filenames_between())
+    its suffix: '0012.xml' -> ('0012', ''); '0012_5.xml' -> ('0012', '5').
+    """
+    stem = filename.split('.')[0]
+    number, _, suffix = stem.partition('_')
+    return number, suffix
+
+
+def _filenames_between(filename, following, count):
+    """
+    Return a list of new filenames which sort (in order) between
+    filename and following (the next output document, or None):
+    e.g. '0012.xml', '0013.xml', 2 -> ['0012_5.xml', '0012_7.xml'].
+    """
+    number, suffix = _split_filename(filename)
+    upper = None
+    if following is not None:
+        following_number, following_suffix = _split_filename(following)
+        if following_number == number:
+            upper = following_suffix
+    filenames = []
+    for _ in range(count):
+        suffix = _suffix_between(suffix, upper)
+        filenames.append('%s_%s.xml' % (number, suffix))
+    return filenames
+
+
+def _suffix_between(lower, upper):
+    """
+    Return a string of digits which sorts after lower and before upper
+    (or None). Suffixes are compared like the digits of a decimal
+    fraction, so that filenames sort in the same order: '5' comes
+    before '55', which comes before '6'. The last digit is never 0.
+    """
+    suffix = ''
+    position = 0
+    while True:
+        low = int(lower[position]) if position < len(lower) else 0
+        if upper is not None and position < len(upper):
+            high = int(upper[position])
+        else:
+            high = 10
+        if high - low > 1:
+            return suffix + str((low + high) // 2)
+        suffix += str(low)
+        if high - low == 1:
+            # Anything following this digit is below upper
+            upper = None
+        position += 1
+
+
+_FINGERPRINTS = {}
+
+
+def _list_entry(entry, manifest_file=None):
+    """
+    Return a 4-ple consisting of the entry ID, its fingerprint, its
+    serialized XML node (or None, if the fingerprint is unchanged
+    from the manifest), and the number of variant forms listed.
+
+    (Run in a worker process by EntryIterator.parallel_map(); each
+    process loads the fingerprints from the manifest once.)
+    """
+    entry_fingerprint = fingerprint(entry)
+    if manifest_file is not None:
+        if not manifest_file in _FINGERPRINTS:
+            with open(manifest_file) as filehandle:
+                _FINGERPRINTS[manifest_file] = json.load(
+                    filehandle)['fingerprints']
+        if _FINGERPRINTS[manifest_file].get(entry.id) == entry_fingerprint:
+            return entry.id, entry_fingerprint, None, 0
+    lister = VariantsLister()
+    lister.entry = entry
+    node, size = lister._entry_node()
+    return entry.id, entry_fingerprint, etree.tounicode(node), size
+
+
 if __name__ == '__main__':
     VariantsLister().list_variants()
 
@@ -0,0 +1,128 @@
+"""
+lrucache - least-recently-used cache with a size or memory budget
+
+Author: James McCracken
+"""
+
+from collections import OrderedDict
+
+
+class LRUCache(object):
+
+    """
+    Least-recently-used cache, bounded by number of items (max_size)
+    and/or by an estimate of the memory used (max_bytes).
+
+    The memory used by each value is estimated by the function passed
+    as sizeof (defaults to 1 per value), or can be passed explicitly
+    to put().
+
+    >>> cache = LRUCache(max_bytes=50000000, sizeof=len)
+    >>> cache.put('abc', block)
+    >>> block = cache.get('abc')
+
+    Hits, misses, and evictions are counted, for monitoring; see
+    stats().
+    """
+
+    def __init__(self, max_size=None, max_bytes=None, sizeof=None):
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._data = OrderedDict()
+        self._sizes = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        """
+        Return the value for a key (marking it as most recently used),
+        or the default if the key is not in the cache.
+        """
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value, size=None):
+        """
+        Add a value to the cache (replacing any existing value for the
+        key), evicting least-recently-used values as necessary.
+
+        A value which on its own exceeds max_bytes is not cached.
+        """
+        if size is None:
+            size = self.sizeof(value) if self.sizeof else 1
+        self.discard(key)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        self._data[key] = value
+        self._sizes[key] = size
+        self.bytes += size
+        self._evict()
+
+    def keys(self):
+        """
+        Return a list of the keys in the cache, least recently used
+        first (does not count as use).
+        """
+        return list(self._data.keys())
+
+    def discard(self, key):
+        """
+        Remove a key from the cache (if present).
+        """
+        if key in self._data:
+            del self._data[key]
+            self.bytes -= self._sizes.pop(key)
+
+    def clear(self):
+        """
+        Empty the cache (counters are not reset).
+        """
+        self._data.clear()
+        self._sizes.clear()
+        self.bytes = 0
+
+    def resize(self, max_size=None, max_bytes=None):
+        """
+        Change the budget of the cache, evicting values if necessary.
+        """
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self._evict()
+
+    def _evict(self):
+        while self._data and (
+                (self.max_size is not None and
+                 len(self._data) > self.max_size) or
+                (self.max_bytes is not None and
+                 self.bytes > self.max_bytes)):
+            key, _ = self._data.popitem(last=False)
+            self.bytes -= self._sizes.pop(key)
+            self.evictions += 1
+
+    def stats(self):
+        """
+        Return a dict of hits, misses, evictions, current size (number
+        of items), and current bytes (estimated).
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._data),
+            'bytes': self.bytes,
+        }
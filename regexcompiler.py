@@ -5,6 +5,14 @@ Author: James McCracken
 """
 
 import re
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+# Constructs that stop a pattern from being merged into a fused
+#  pattern (since group numbers and inline flags would be disturbed)
+UNFUSABLE = re.compile(r'\\[1-9]|\(\?P=|\(\?\(|\(\?[aiLmsux]+\)')
 
 
 class ReplacementListCompiler(object):
@@ -15,12 +23,28 @@ class ReplacementListCompiler(object):
     Arguments:
     1. A list of uncompiled regexes, where each element is a tuple in
     the form (pattern, replacement), e.g. (r"abc", r"xyz").
+
+    Keyword arguments:
+    - caseInsensitive: compile the regexes with re.I
+    - fused: precompute a literal prefilter for each regex (so that
+    regexes which cannot match are skipped without a scan), and merge
+    the regexes into a single pattern, so that edit_once() can find the
+    first regex that matches in a single pass. Output is identical to
+    the unfused version.
     """
 
-    def __init__(self, uncompiled, caseInsensitive=False):
+    def __init__(self, uncompiled, caseInsensitive=False, fused=False):
         self.uncompiled = uncompiled
         self.case_insensitive = caseInsensitive
+        self.fused = fused
         self.compiled = self._compile_list()
+        if fused:
+            self.literals = [_required_literal(pattern) for pattern, _
+                             in self.compiled]
+            self.fused_pattern = self._compile_fused()
+        else:
+            self.literals = [None for _ in self.compiled]
+            self.fused_pattern = None
 
     def _compile_list(self):
         """
@@ -36,6 +60,27 @@ class ReplacementListCompiler(object):
             return [(re.compile(pattern), replacement) for
                     pattern, replacement in self.uncompiled]
 
+    def _compile_fused(self):
+        """
+        Merge the regexes into a single pattern, in which each regex is
+        wrapped in a lookahead (tried in order at the start of the
+        string), so that the name of the group that matches identifies
+        the first regex that would match anywhere in the string.
+
+        Returns None if any of the regexes can't be merged.
+        """
+        if not self.compiled:
+            return None
+        if any([UNFUSABLE.search(pattern.pattern) or pattern.groupindex
+                for pattern, _ in self.compiled]):
+            return None
+        fused = '|'.join([r'(?=[\s\S]*?(?P<_r%d>%s))' % (i, pattern.pattern)
+                          for i, (pattern, _) in enumerate(self.compiled)])
+        try:
+            return re.compile(fused, self.compiled[0][0].flags)
+        except re.error:
+            return None
+
     def edit(self, text):
         """
         Edit a string, list, or tuple by running the compiled regexes.
@@ -80,23 +125,86 @@ class ReplacementListCompiler(object):
         """
         Main substitution engine.
         """
-        output = text
+        if self.fused:
+            edit_string = self._edit_fused
+        else:
+            edit_string = self._edit_string
         if isinstance(text, (list, tuple)):
-            output = []
-            for string in text:
-                for pattern, replacement in self.compiled:
-                    string, matches = pattern.subn(replacement, string)
-                    if matches and break_on_success:
-                        break
-                output.append(string)
+            output = [edit_string(string, break_on_success)
+                      for string in text]
             if isinstance(text, tuple):
                 output = tuple(output)  # convert back to a tuple
+            return output
         else:
-            for pattern, replacement in self.compiled:
-                output, matches = pattern.subn(replacement, output)
-                if matches and break_on_success:
-                    break
-        return output
+            return edit_string(text, break_on_success)
+
+    def _edit_string(self, string, break_on_success):
+        for pattern, replacement in self.compiled:
+            string, matches = pattern.subn(replacement, string)
+            if matches and break_on_success:
+                break
+        return string
+
+    def _edit_fused(self, string, break_on_success):
+        if break_on_success and self.fused_pattern is not None:
+            match = self.fused_pattern.match(string)
+            if match is None:
+                return string
+            pattern, replacement = self.compiled[int(match.lastgroup[2:])]
+            return pattern.sub(replacement, string)
+        for (pattern, replacement), literal in zip(self.compiled,
+                                                   self.literals):
+            if literal is not None and literal not in string:
+                continue
+            string, matches = pattern.subn(replacement, string)
+            if matches and break_on_success:
+                break
+        return string
+
+
+def _required_literal(pattern):
+    """
+    Return the longest run of literal characters which must appear in
+    any string matched by a compiled regex (or None if no such literal
+    can be found, or the regex is case-insensitive).
+    """
+    if pattern.flags & re.I:
+        return None
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except (re.error, TypeError):
+        return None
+    runs = _literal_runs(parsed)
+    if not runs:
+        return None
+    return max(runs, key=len)
+
+
+def _literal_runs(sequence):
+    """
+    Return a list of the runs of literal characters in a parsed
+    regex sequence, including those in groups and in repeats which
+    must occur at least once.
+    """
+    runs = []
+    current = []
+    for op, av in sequence:
+        if op is sre_parse.LITERAL:
+            current.append(chr(av))
+            continue
+        if current:
+            runs.append(''.join(current))
+            current = []
+        if op is sre_parse.SUBPATTERN:
+            add_flags = av[1]
+            if not add_flags & re.I:
+                runs.extend(_literal_runs(av[3]))
+        elif (op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and
+                av[0] >= 1):
+            runs.extend(_literal_runs(av[2]))
+    if current:
+        runs.append(''.join(current))
+    return runs
 
 
 class ReMatcher(object):
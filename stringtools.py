@@ -19,6 +19,9 @@ from regexcompiler import ReplacementListCompiler
 
 
 AZ_STRING = re.compile(r'^[a-z]+$')
+ASCII_DIGIT = re.compile(r'[0-9]')
+LEXICAL_SORT_CACHE_SIZE = 65536
+METAPHONE_CACHE_SIZE = 65536
 
 PUNCTUATION_STRIPPER = ReplacementListCompiler((
     (r'&(amp|lt|gt);', ''),
@@ -40,7 +43,7 @@ DIGIT_TRANSLATOR = ReplacementListCompiler((
     (r'7', r'seven'),
     (r'8', r'eight'),
     (r'9', r'nine'),
-))
+), fused=True)
 
 # Run this *before* DIGIT_TRANSLATOR in order to turn
 # all numbers into strings
@@ -76,13 +79,24 @@ NUMBER_TRANSLATOR = ReplacementListCompiler((
     (r'([^0-9])8(\d)([^0-9])', r'\1eighty-\2\3'),
     (r'([^0-9])9(\d)([^0-9])', r'\1ninety-\2\3'),
     (r'^ | $', ''),  # Remove the temporary l- and r-padding
-))
+), fused=True)
 
 MEDIAL_HYPHEN_STRIPPER = ReplacementListCompiler((
     (r'(.)-(.)', r'\1\2'),
 ))
 VOWELS = {'a', 'e', 'i', 'o', 'u'}
 
+# Translation table for lexical_sort(), mapping each character in the
+#  common Latin ranges (Basic Latin to Latin Extended-B, and General
+#  Punctuation) to its downcased asciified form (cf. asciify()).
+#  Other characters are passed on to unidecode.
+LEXICAL_SORT_TABLE = {
+    codepoint: unidecode(YOGH_HANDLER.edit(chr(codepoint))).lower()
+    for codepoint in list(range(0x250)) + list(range(0x2000, 0x2070))
+}
+NON_ALPHA_DELETER = {codepoint: None for codepoint in range(128)
+                     if not 'a' <= chr(codepoint) <= 'z'}
+
 PORTER_STEM = PorterStemmer()
 
 METAPHONE_TRANS = {
@@ -101,6 +115,45 @@ METAPHONE_TRANS = {
     'x': 'ks',
     'y': 'y',
     'z': 's', }
+# Context-dependent rules for metaphone(): for each letter, the
+#  default code and a list of (context, values, code) rules, where the
+#  first rule whose context is one of the values wins. Contexts:
+#   n2, n3, n4: the next 2, 3, or 4 letters (starting with this one);
+#   c2, c3: the 2 or 3 letters starting with the previous one (not
+#     available for the first or last letter);
+#   end: the rest of the string; pend: the previous letter plus the
+#     rest of the string.
+#  Letters not listed here are coded as themselves.
+_NOT_VOWEL_Y = [x for x in string.ascii_lowercase if x not in 'aeiouy']
+METAPHONE_RULES = {
+    'b': ('b', [('pend', {'mb'}, '')]),
+    'c': ('k', [('c3', {'sci', 'sce', 'scy'}, ''),
+                ('n3', {'cia'}, 'x'),
+                ('n2', {'ch'}, 'x'),
+                ('n2', {'ci', 'ce', 'cy'}, 's')]),
+    'd': ('t', [('n3', {'dge', 'dgy', 'dgi'}, 'j')]),
+    'g': ('k', [('end', {'gh'}, ''),
+                ('n2', {'gh'}, 'k'),
+                ('n3', {'gh' + x for x in 'aeiouy'}, ''),
+                ('n2', {'gn'}, ''),
+                ('n4', {'gned'}, ''),
+                ('c3', {'dge', 'dgy', 'dgi'}, ''),
+                ('c3', {'ggi', 'gge', 'ggy'}, 'k'),
+                ('n2', {'gi', 'ge', 'gy'}, 'j'),
+                ('n2', {'gg'}, '')]),
+    'h': ('h', [('c3', {v + 'h' + x for v in 'aeiouy' for x in _NOT_VOWEL_Y},
+                 ''),
+                ('c2', {'ch', 'sh', 'ph', 'th', 'gh'}, '')]),
+    'k': ('k', [('c2', {'ck'}, '')]),
+    'p': ('p', [('n2', {'ph'}, 'f')]),
+    's': ('s', [('n2', {'sh'}, 'x'),
+                ('n3', {'sia', 'sio'}, 'x')]),
+    't': ('t', [('n3', {'tia', 'tio'}, 'x'),
+                ('n2', {'th'}, '0')]),
+    'w': ('w', [('n2', {'w' + x for x in _NOT_VOWEL_Y}, '')]),
+}
+for _letter in 'qvxyz':
+    METAPHONE_RULES[_letter] = (METAPHONE_TRANS[_letter], [])
 METAPHONE_FIRSTCHARS = {
     'ae': 'e',
     'gn': 'n',
@@ -135,23 +188,83 @@ def asciify(text):
         return strip_diacritics(YOGH_HANDLER.edit(text))
 
 
-@lru_cache(maxsize=256)
+def _lexical_sort(text):
+    if AZ_STRING.search(text):
+        return text
+    lex_sorted = text.translate(LEXICAL_SORT_TABLE)
+    if not lex_sorted.isascii():
+        # Characters outside the table's range
+        lex_sorted = strip_diacritics(lex_sorted).lower()
+    if '&' in lex_sorted or ASCII_DIGIT.search(lex_sorted):
+        lex_sorted = convert_numbers_to_strings(lex_sorted)
+        lex_sorted = strip_spaces(lex_sorted)
+        lex_sorted = strip_all_hyphens(lex_sorted)
+        return strip_punctuation(lex_sorted)
+    else:
+        # Without digits or entities, the remaining steps just
+        #  amount to removing everything except a-z
+        return lex_sorted.translate(NON_ALPHA_DELETER)
+
+
+_lexical_sort_cached = lru_cache(maxsize=LEXICAL_SORT_CACHE_SIZE)(_lexical_sort)
+
+
 def lexical_sort(text):
     """
     Returns the lexical-sort version of the input string.
 
     I.e. downcased, accent-stripped, hyphen- and punctuation-stripped,
     digits converted to strings.
+
+    Results are cached; see set_lexical_sort_cache_size() and
+    lexical_sort_cache_info().
     """
-    if AZ_STRING.search(text):
-        return text
-    else:
-        lex_sorted = asciify(text).lower()
-        lex_sorted = convert_numbers_to_strings(lex_sorted)
-        lex_sorted = strip_spaces(lex_sorted)
-        lex_sorted = strip_all_hyphens(lex_sorted)
-        lex_sorted = strip_punctuation(lex_sorted)
-        return lex_sorted
+    return _lexical_sort_cached(text)
+
+
+def lexical_sort_many(texts):
+    """
+    Returns a list of the lexical-sort versions of a sequence of
+    strings.
+
+    Repeated strings are only computed once, but the shared cache
+    used by lexical_sort() is bypassed, so that a large batch does
+    not flush it.
+    """
+    seen = {}
+    lex_sorted = []
+    for text in texts:
+        try:
+            lex_sorted.append(seen[text])
+        except KeyError:
+            seen[text] = _lexical_sort(text)
+            lex_sorted.append(seen[text])
+    return lex_sorted
+
+
+def set_lexical_sort_cache_size(maxsize):
+    """
+    Set the maximum number of results cached by lexical_sort()
+    (None for unbounded). The existing cache is discarded.
+    """
+    global _lexical_sort_cached
+    _lexical_sort_cached = lru_cache(maxsize=maxsize)(_lexical_sort)
+
+
+def lexical_sort_cache_info():
+    """
+    Returns a dict of hits, misses, maxsize, currsize, and hit_rate
+    for the lexical_sort() cache.
+    """
+    info = _lexical_sort_cached.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        'hits': info.hits,
+        'misses': info.misses,
+        'maxsize': info.maxsize,
+        'currsize': info.currsize,
+        'hit_rate': info.hits / lookups if lookups else 0,
+    }
 
 
 dictionary_sort = lexical_sort
@@ -377,6 +490,7 @@ def word_tokens(text):
     return [t for t in tokens(text) if not t in string.punctuation]
 
 
+@lru_cache(maxsize=METAPHONE_CACHE_SIZE)
 def metaphone(text):
     """
     Return the metaphone code for a given string
@@ -384,158 +498,82 @@ def metaphone(text):
     # implementation of the original algorithm from Lawrence Philips
     # extended/rewritten by M. Kuhn
     # improvements with thanks to John Machin <sjmachin@lexicon.net>
+    return _metaphone_code(lexical_sort(text))
 
-    # define return value
-    text = lexical_sort(text)
-    code = ''
-
-    # Bail if it's an empty string
-    if not text:
-        return code
 
-    # conflate repeated letters
-    deduped = text[0]
-    for x in text:
-        if x != deduped[-1]:
-            deduped += x
+def metaphone_many(texts):
+    """
+    Return a list of the metaphone codes for a sequence of strings.
+    """
+    seen = {}
+    codes = []
+    for lex_sorted in lexical_sort_many(texts):
+        try:
+            codes.append(seen[lex_sorted])
+        except KeyError:
+            seen[lex_sorted] = _metaphone_code(lex_sorted)
+            codes.append(seen[lex_sorted])
+    return codes
 
-    # remove any vowels unless a vowel is the first letter
-    vowelless = deduped[0]
-    for x in deduped[1:]:
-        if re.search(r'[^aeiou]', x):
-            vowelless += x
 
-    text = vowelless
+def _metaphone_code(text):
+    """
+    Return the metaphone code for a string which has already been
+    lexical-sorted (see METAPHONE_RULES).
+    """
     # Bail if it's an empty string
     if not text:
-        return code
+        return ''
+
+    # conflate repeated letters, and remove any vowels unless a vowel
+    #  is the first letter (in that order, so a repeat that only
+    #  arises once vowels are removed is not conflated)
+    chars = [text[0]]
+    previous = text[0]
+    for x in text[1:]:
+        if x != previous:
+            previous = x
+            if x not in VOWELS:
+                chars.append(x)
+    text = ''.join(chars)
 
     # check for exceptions
+    code = []
     text_length = len(text)
     if text_length > 1:
-        # get first two characters
-        first_chars = text[0:2]
-        if first_chars in METAPHONE_FIRSTCHARS:
+        if text[0:2] in METAPHONE_FIRSTCHARS:
+            code.append(METAPHONE_FIRSTCHARS[text[0:2]])
             text = text[2:]
-            code = METAPHONE_FIRSTCHARS[first_chars]
             text_length = len(text)
-        
-    elif text[0] == 'x':
-        text = ''
-        code = 's'
-        text_length = 0
-
-    i = 0
-    while i < text_length:
-        # initialize character to add, initialize basic patterns
-        add_char = ''
-        part_n_2 = ''
-        part_n_3 = ''
-        part_n_4 = ''
-        part_c_2 = ''
-        part_c_3 = ''
-
-        # extract a number of patterns, if possible
-        if i < (text_length - 1):
-            part_n_2 = text[i:i+2]
-
-            if i > 0:
-                part_c_2 = text[i-1:i+1]
-                part_c_3 = text[i-1:i+2]
-
-        if i < (text_length - 2):
-            part_n_3 = text[i:i+3]
-
-        if i < (text_length - 3):
-            part_n_4 = text[i:i+4]
-
-        # use table with conditions for translations
-        if text[i] == 'b':
-            add_char = METAPHONE_TRANS['b']
-            if i > 0 and i == (text_length - 1) and text[i-1] == 'm':
-                add_char = ''
-
-        elif text[i] == 'c':
-            add_char = METAPHONE_TRANS['c']
-            if part_n_2 == 'ch':
-                add_char = 'x'
-            elif re.search(r'c[iey]', part_n_2):
-                add_char = 's'
-
-            if part_n_3 == 'cia':
-                add_char = 'x'
-
-            if re.search(r'sc[iey]', part_c_3):
-                add_char = ''
-
-        elif text[i] == 'd':
-            add_char = METAPHONE_TRANS['d']
-            if re.search(r'dg[eyi]', part_n_3):
-                add_char = 'j'
-
-        elif text[i] == 'g':
-            add_char = METAPHONE_TRANS['g']
-            if part_n_2 == 'gh':
-                if i == (text_length - 2):
-                    add_char = ''
-            elif re.search(r'gh[aeiouy]', part_n_3):
-                add_char = ''
-            elif part_n_2 == 'gn':
-                add_char = ''
-            elif part_n_4 == 'gned':
-                add_char = ''
-            elif re.search(r'dg[eyi]',part_c_3):
-                add_char = ''
-            elif part_n_2 == 'gi':
-                if part_c_3 != 'ggi':
-                    add_char = 'j'
-            elif part_n_2 == 'ge':
-                if part_c_3 != 'gge':
-                    add_char = 'j'
-            elif part_n_2 == 'gy':
-                if part_c_3 != 'ggy':
-                    add_char = 'j'
-            elif part_n_2 == 'gg':
-                add_char = ''
-        elif text[i] == 'h':
-            add_char = METAPHONE_TRANS['h']
-            if re.search(r'[aeiouy]h[^aeiouy]', part_c_3):
-                add_char = ''
-            elif re.search(r'[csptg]h', part_c_2):
-                add_char = ''
-        elif text[i] == 'k':
-            add_char = METAPHONE_TRANS['k']
-            if part_c_2 == 'ck':
-                add_char = ''
-        elif text[i] == 'p':
-            add_char = METAPHONE_TRANS['p']
-            if part_n_2 == 'ph':
-                add_char = 'f'
-        elif text[i] == 's':
-            add_char = METAPHONE_TRANS['s']
-            if part_n_2 == 'sh':
-                add_char = 'x'
-            if re.search(r'si[ao]', part_n_3):
-                add_char = 'x'
-        elif text[i] == 't':
-            add_char = METAPHONE_TRANS['t']
-            if part_n_2 == 'th':
-                add_char = '0'
-            if re.search(r'ti[ao]', part_n_3):
-                add_char = 'x'
-        elif text[i] == 'w':
-            add_char = METAPHONE_TRANS['w']
-            if re.search(r'w[^aeiouy]', part_n_2):
-                add_char = ''
-        elif text[i] in ('q', 'v', 'x', 'y', 'z'):
-            add_char = METAPHONE_TRANS[text[i]]
-
-        else:
-            # alternative
-            add_char = text[i]
-
-        code += add_char
-        i += 1
-
-    return code
-
+    elif text == 'x':
+        return 's'
+
+    for i, letter in enumerate(text):
+        try:
+            default, rules = METAPHONE_RULES[letter]
+        except KeyError:
+            code.append(letter)
+            continue
+        add_char = default
+        for part, values, result in rules:
+            if part == 'n2':
+                context = text[i:i+2] if i < text_length - 1 else ''
+            elif part == 'n3':
+                context = text[i:i+3] if i < text_length - 2 else ''
+            elif part == 'n4':
+                context = text[i:i+4] if i < text_length - 3 else ''
+            elif part == 'c2':
+                context = (text[i-1:i+1] if 0 < i < text_length - 1
+                           else '')
+            elif part == 'c3':
+                context = (text[i-1:i+2] if 0 < i < text_length - 1
+                           else '')
+            elif part == 'end':
+                context = text[i:]
+            else:  # 'pend'
+                context = text[i-1:] if i > 0 else ''
+            if context in values:
+                add_char = result
+                break
+        code.append(add_char)
+    return ''.join(code)
@@ -0,0 +1,65 @@
+"""
+Benchmark of ReplacementListCompiler: the fused engine against the
+sequential engine, on the lexical_sort and Inflection workloads.
+
+Run from the package root:
+    python -m test.benchmark_regexcompiler
+"""
+
+import random
+import timeit
+
+import stringtools
+from regexcompiler import ReplacementListCompiler
+from lex.inflections.inflection import INFLECTION_PATTERNS
+
+WORDS = ('apple', 'church', 'analysis', 'knife', 'mouse', 'carry', 'stop',
+         'refer', 'wolf', 'leaf', 'sheep', 'box', 'quiz', 'play', 'fancy',
+         'blue', 'bigot', 'star', 'woman', 'bureau')
+NUMBERED = ('1st', '2000 years', 'the 360 degree', '12-bore', '1890s',
+            'catch 22', '4x4', '10 Downing St.', '3000', '99 luftballons')
+REPEAT = 20
+
+
+def _unfused(compiler):
+    return ReplacementListCompiler(compiler.uncompiled,
+                                   caseInsensitive=compiler.case_insensitive)
+
+
+def _time(function, texts):
+    return min(timeit.repeat(lambda: [function(text) for text in texts],
+                             number=REPEAT, repeat=3))
+
+
+def benchmark():
+    random.seed(0)
+    results = []
+
+    # lexical_sort workload: the rule lists used for strings with digits,
+    #  each timed on its input from lexical_sort() (i.e. the output of
+    #  the previous rule list)
+    texts = [random.choice(NUMBERED) for _ in range(2000)]
+    for name in ('NUMBER_TRANSLATOR', 'DIGIT_TRANSLATOR'):
+        fused = getattr(stringtools, name)
+        unfused = _unfused(fused)
+        results.append((name + '.edit()',
+                        _time(unfused.edit, texts), _time(fused.edit, texts)))
+        texts = [unfused.edit(text) for text in texts]
+
+    # Inflection workload
+    words = [random.choice(WORDS) for _ in range(2000)]
+    for wordclass in ('NNS', 'VBD', 'VBG', 'VBZ', 'JJR'):
+        fused = INFLECTION_PATTERNS[wordclass]
+        unfused = _unfused(fused)
+        results.append(('%s.edit_once()' % wordclass,
+                        _time(unfused.edit_once, words),
+                        _time(fused.edit_once, words)))
+
+    print('%-32s %10s %10s %8s' % ('', 'sequential', 'fused', 'speedup'))
+    for name, before, after in results:
+        print('%-32s %9.3fs %9.3fs %7.1fx' % (name, before, after,
+                                             before / after))
+
+
+if __name__ == '__main__':
+    benchmark()
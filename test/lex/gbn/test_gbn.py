@@ -0,0 +1,386 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from lex.gbn.ngram import Ngram
+
+RANGES = ('1970-2007', '1800-1899', '1750-', '-1600', '1850', '1990-99',
+          '2000-2000', 'nonsense')
+TABLE_LINES = [
+    'aardvark\taardvark\tNOUN\t1800:3\t1850:7\t1970:120\t2000:88',
+    'aardvark\taardvark\tVERB\t1990:2',
+    'aaron\tAaron\tNOUN\t1550:1\t1600:4\t1700:9\t1800:16\t1900:25\t2000:36',
+    'aaronic\tAaronic\tADJ\t1640:5\t1650:1',
+    'ab\tab\tALL\t1500:1\t1510:2\t2090:3',
+]
+# Table files for NgramFinder (prefix 'aar'), keyed by gram count
+FINDER_TABLES = {
+    1: ['aardvark\taardvark\tNOUN\t1970:120',
+        'aardvark\taardvark\tVERB\t1990:2',
+        'aardvarks\taardvarks\tNOUN\t1980:40',
+        'aaron\tAaron\tNOUN\t1900:25',
+        'aaron\taaron\tALL\t1900:3'],
+    2: ['aardvarkant\taardvark ant\tALL\t1990:6',
+        "aaronsrod\tAaron's rod\tALL\t1900:4"],
+}
+
+
+class TestFrequency(unittest.TestCase):
+
+    """
+    Unit tests for lex.gbn.frequency
+    """
+
+    ranges = ['1970-2007', '1800-', '-1600', '1850', '1990-99', '2000-2000',
+              '1400-1450', '2015-2030', '1750-1700', 'nonsense', None]
+
+    @staticmethod
+    def _summed(year_counts, start, end):
+        # Per-year summation, as in the original Frequency.range_count()
+        if (start and not end) or (start and start == end):
+            return year_counts.get(start, 0)
+        elif start and end and end > start:
+            return sum([year_counts.get(year, 0)
+                        for year in range(start, end + 1)])
+        return 0
+
+    def test_cumulative_counts(self):
+        """
+        Test CumulativeCounts sums against per-year summation on a
+        small table
+        """
+        from lex.gbn.frequency import CumulativeCounts
+        year_counts = {1800: 5, 1801: 7, 1805: 11, 1810: 13, 1899: 17}
+        cumulative = CumulativeCounts(year_counts)
+        pairs = [(1800, 1800), (1800, 1805), (1790, 1802), (1806, 1809),
+                 (1805, 1950), (1700, 1790), (1900, 2000), (1801, 1800)]
+        for start, end in pairs:
+            self.assertEqual(cumulative.sum(start, end),
+                             self._summed(year_counts, start, end)
+                             if end >= start else 0)
+        self.assertEqual(list(cumulative.sums([p[0] for p in pairs],
+                                              [p[1] for p in pairs])),
+                         [cumulative.sum(start, end) for start, end in pairs])
+        self.assertEqual(CumulativeCounts({}).sum(1800, 1900), 0)
+
+    def test_range_count(self):
+        """
+        Test Frequency.range_count() and frequencies_per_million()
+        against per-year summation, including open-ended and decade
+        ranges
+        """
+        from lex.gbn.frequency import (Frequency, range_bounds,
+                                       range_parser, _argparser)
+        frequency = Frequency()
+        for gram in (1, 2):
+            id, type = _argparser(gram=gram)
+            year_counts = Frequency.counts[id][type]
+            for range_string in self.ranges:
+                start, end = range_parser(range_string)
+                expected = self._summed(year_counts, start, end)
+                self.assertEqual(frequency.range_count(range=range_string,
+                                                       gram=gram), expected)
+            for decade in (1850, 1855, 2000, 1400):
+                expected = self._summed(year_counts, (decade // 10) * 10,
+                                        (decade // 10) * 10 + 9)
+                self.assertEqual(frequency.range_count(decade=decade,
+                                                       gram=gram), expected)
+                self.assertEqual(range_bounds(decade=decade),
+                                 ((decade // 10) * 10,
+                                  (decade // 10) * 10 + 9))
+            self.assertEqual(frequency.total(gram=gram),
+                             sum(year_counts.values()))
+
+            counts = [1000, 250, 0, 7, 99, 3, 5, 8, 1, 2, 4]
+            ranges = self.ranges
+            expected = [frequency.frequency_per_million(
+                count=count, range=range_string, gram=gram)
+                for count, range_string in zip(counts, ranges)]
+            for value, target in zip(frequency.frequencies_per_million(
+                    counts, ranges, gram=gram), expected):
+                self.assertAlmostEqual(value, target)
+            for value, count in zip(frequency.frequencies_per_million(
+                    counts, '1800-', gram=gram), counts):
+                self.assertAlmostEqual(value, frequency.frequency_per_million(
+                    count=count, range='1800-', gram=gram))
+
+
+class TestColumnar(unittest.TestCase):
+
+    """
+    Unit tests for lex.gbn.columnar
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.tmp_dir, 'aa.txt')
+        with open(self.filepath, 'w') as filehandle:
+            filehandle.write('\n'.join(TABLE_LINES) + '\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_round_trip(self):
+        """
+        Test that a converted table gives the same values as Ngram
+        objects for the same rows
+        """
+        from lex.gbn.columnar import ColumnarConverter, ColumnarTable
+        converter = ColumnarConverter(out_dir=self.tmp_dir, gramCount=1)
+        table = ColumnarTable(converter.convert_file(self.filepath))
+        ngrams = [Ngram(line, gramCount=1) for line in TABLE_LINES]
+        self.assertEqual(len(table), len(ngrams))
+
+        for view, ngram in zip(table, ngrams):
+            self.assertEqual((view.lemma, view.sortcode, view.wordclass),
+                             (ngram.lemma, ngram.sortcode, ngram.wordclass))
+            self.assertEqual(view.decades, ngram.decades)
+            self.assertEqual(view.total_count(), ngram.total_count())
+            for range_string in RANGES:
+                self.assertEqual(view.range_count(range_string),
+                                 ngram.range_count(range_string))
+                self.assertAlmostEqual(view.frequency(range_string),
+                                       ngram.frequency(range_string))
+            self.assertEqual(view.to_ngram().line, ngram.line)
+
+        for range_string in RANGES:
+            self.assertEqual(list(table.range_counts(range_string)),
+                             [n.range_count(range_string) for n in ngrams])
+            for value, ngram in zip(table.frequencies(range_string), ngrams):
+                self.assertAlmostEqual(value, ngram.frequency(range_string))
+        self.assertEqual(list(table.mask_wordclass('NOUN')),
+                         [n.wordclass == 'NOUN' for n in ngrams])
+
+
+class TestNgramFinder(unittest.TestCase):
+
+    """
+    Unit tests for lex.gbn.ngramfinder
+    """
+
+    def setUp(self):
+        from lex.gbn.ngramfinder import NgramFinder
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filepaths = {}
+        for gram_num, lines in FINDER_TABLES.items():
+            os.makedirs(os.path.join(self.tmp_dir, str(gram_num), 'a'))
+            filepath = os.path.join(self.tmp_dir, str(gram_num), 'a',
+                                    'aar-%dgram.txt' % gram_num)
+            with open(filepath, 'w') as filehandle:
+                filehandle.write('\n'.join(lines) + '\n')
+            self.filepaths[gram_num] = filepath
+        self.finder = NgramFinder(dir=self.tmp_dir)
+
+    def tearDown(self):
+        from lex.gbn.ngramfinder import NgramFinder, DEFAULT_CACHE_BYTES
+        NgramFinder.cache.clear()
+        NgramFinder.cache.resize(max_bytes=DEFAULT_CACHE_BYTES)
+        shutil.rmtree(self.tmp_dir)
+
+    def test_index_rebuild(self):
+        """
+        Test that the prefix index is rebuilt when the table file
+        changes
+        """
+        from lex.gbn.ngramfinder import NgramFinder, _load_index
+        filepath = self.filepaths[1]
+        index = self.finder.prefix_index(filepath)
+        self.assertEqual(sorted(index.keys()),
+                         ['aardvark', 'aardvarks', 'aaron'])
+        self.assertTrue(os.path.isfile(filepath.replace('.txt', '.idx')))
+        self.assertEqual(_load_index(filepath), index)
+        self.assertEqual([n.wordclass for n in
+                          self.finder.find_all('aardvark')],
+                         ['NOUN', 'VERB'])
+
+        with open(filepath, 'w') as filehandle:
+            filehandle.write('\n'.join(['aardvark\taardvark\tADJ\t2000:1'] +
+                                       FINDER_TABLES[1]) + '\n')
+        NgramFinder.cache.clear()
+        self.assertNotEqual(_load_index(filepath), index)
+        self.assertEqual([n.wordclass for n in
+                          self.finder.find_all('aardvark')],
+                         ['ADJ', 'NOUN', 'VERB'])
+        self.assertEqual(self.finder.find_exact('aaron').source_lemma,
+                         'aaron')
+
+    def test_find_many(self):
+        """
+        Test that find_many() gives the same results as find_all()
+        for each word
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from lex.gbn.ngramfinder import NgramFinder
+        words = ['aardvark', 'aaron', 'Aaron', 'aardvarks', 'aard',
+                 'aardvark ant', 'aardvark']
+        for wordclass in (None, 'NOUN'):
+            expected = {word: [n.line for n in
+                               self.finder.find_all(word, wordclass)]
+                        for word in words}
+            for executor in (None, ThreadPoolExecutor(max_workers=2)):
+                NgramFinder.cache.clear()
+                results = self.finder.find_many(words, wordclass=wordclass,
+                                                executor=executor)
+                self.assertEqual({word: [n.line for n in ngrams] for
+                                  word, ngrams in results.items()}, expected)
+                if executor is not None:
+                    executor.shutdown()
+        self.assertEqual(len(expected['aardvark']), 1)
+
+        # Lookups already cached count as hits, others as misses (one
+        #  lookup per word per table file, plus one per prefix index)
+        NgramFinder.cache.clear()
+        stats = NgramFinder.stats()
+        self.finder.find_many(['aardvark'])
+        self.finder.find_many(['aardvark', 'aaron'])
+        after = NgramFinder.stats()
+        self.assertEqual(after['hits'] - stats['hits'], 3 + 3)
+        self.assertEqual(after['misses'] - stats['misses'], 3 + 3 + 3)
+
+    def test_line_separators(self):
+        """
+        Test that table lines are only split on newlines, not on other
+        characters that str.splitlines() treats as line boundaries
+        """
+        from lex.gbn.ngramfinder import NgramFinder
+        line = 'aaronic\tAaronic\x0c\x1c\x85\u2028\tADJ\t1700:2'
+        with open(self.filepaths[1], 'w', encoding='utf-8') as filehandle:
+            filehandle.write('\n'.join(FINDER_TABLES[1] + [line]) + '\n')
+        NgramFinder.cache.clear()
+        for ngrams in (self.finder.find_all('aaronic'),
+                       self.finder.find_many(['aaronic'])['aaronic']):
+            self.assertEqual([n.line for n in ngrams], [line])
+
+    def test_cache_size(self):
+        """
+        Test that the old cache_size argument sets the memory budget
+        """
+        from lex.gbn.ngramfinder import NgramFinder, PREFIX_CACHE_BYTES
+        NgramFinder(dir=self.tmp_dir, cache_size=2)
+        self.assertEqual(NgramFinder.cache.max_bytes, 2 * PREFIX_CACHE_BYTES)
+        NgramFinder(dir=self.tmp_dir, cache_size=2, cache_bytes=1000)
+        self.assertEqual(NgramFinder.cache.max_bytes, 1000)
+
+
+class TestHighFrequency(unittest.TestCase):
+
+    """
+    Unit tests for lex.gbn.highfrequency
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write(self, filepath, lines):
+        filepath = os.path.join(self.tmp_dir, filepath)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with open(filepath, 'w') as filehandle:
+            filehandle.write('\n'.join(lines) + '\n')
+        return filepath
+
+    def test_high_frequency(self):
+        """
+        Test that HighFrequency lists the top ngrams in descending order
+        of frequency (ties in the order read)
+        """
+        from lex.gbn.highfrequency import HighFrequency
+        tables = {
+            '1/a/aa.txt': ['aa\taa\tALL\t1970:500000\t2000:500000',
+                           'aa\taa\tNOUN\t1970:9000000',
+                           'ab\tab\tALL\t1970:100000',
+                           'ac\tac\tALL\t1970:900000\t2000:100000'],
+            '1/b/ba.txt': ['ba\tba\tALL\t1970:1000000',
+                           'bb\tbb\tALL\t1970:10'],
+            '2/a/ab.txt': ['abc\tab c\tALL\t1970:100000',
+                           'abd\tab d\tALL\t1980:3000000'],
+        }
+        for filepath, lines in tables.items():
+            self._write(os.path.join('tables', filepath), lines)
+        out_file = os.path.join(self.tmp_dir, 'hilist.txt')
+
+        # Naive version: every ngram above the cutoff, sorted by
+        #  frequency (stable, so ties stay in the order read)
+        ngrams = []
+        for filepath in sorted(tables):
+            gram_num = int(filepath[0])
+            ngrams.extend([Ngram(line, gramCount=gram_num)
+                           for line in tables[filepath]])
+        expected = [(n.lemma, n.frequency('1970-2008')) for n in ngrams
+                    if n.wordclass == 'ALL' and n.frequency('1970-2008') > 1]
+        expected.sort(key=lambda n: n[1], reverse=True)
+        # (aa, ac and ba are tied)
+        self.assertEqual(len(set([f for _, f in expected[1:4]])), 1)
+
+        for processes in (1, 2):
+            for list_length in (3, 100):
+                HighFrequency(dir=os.path.join(self.tmp_dir, 'tables'),
+                              out_file=out_file, list_length=list_length,
+                              processes=processes, verbose=False).process()
+                with open(out_file) as filehandle:
+                    lines = [line for line in filehandle
+                             if not line.startswith('#')]
+                self.assertEqual(lines, ['%s\t%s\n' % (lemma, frequency)
+                                         for lemma, frequency
+                                         in expected[0:list_length]])
+
+    def test_delta(self):
+        """
+        Test Delta's increase and decrease lists against the original
+        dict-based comparison
+        """
+        from lex.gbn import highfrequency
+        from lex.gbn.highfrequency import Delta
+        f1 = self._write('f1.txt', ['# 1970-2008', 'zeta\t40.0',
+                                    'alpha\t20.0', 'beta\t10.0',
+                                    'alpha\t8.0', 'gamma\t5.0',
+                                    'delta\t2.0'])
+        f2 = self._write('f2.txt', ['# 1970-2008', 'omega\t40.0',
+                                    'gamma\t20.0', 'zeta\t20.0',
+                                    'beta\t20.0', 'eta\t4.0',
+                                    'delta\t4.0', 'alpha\t4.0',
+                                    'theta\t2.0', 'gamma\t10.0'])
+
+        # Original version: lists loaded into dicts
+        data = {}
+        for fname, filepath in (('f1', f1), ('f2', f2)):
+            data[fname] = {}
+            with open(filepath) as filehandle:
+                for line in filehandle:
+                    parts = line.split('\t')
+                    if len(parts) == 2:
+                        data[fname][parts[0]] = float(parts[1])
+                        data[fname + '_min'] = float(parts[1])
+        up, down = [], []
+        for lemma, new_freq in data['f2'].items():
+            old_freq = data['f1'].get(lemma, data['f1_min'])
+            if new_freq > old_freq:
+                up.append((lemma, old_freq, new_freq, new_freq/old_freq))
+            else:
+                down.append((lemma, old_freq, new_freq, old_freq/new_freq))
+        up.sort(key=lambda n: n[3], reverse=True)
+        down.sort(key=lambda n: n[3], reverse=True)
+
+        chunk_size = highfrequency.CHUNK_SIZE
+        try:
+            for size in (chunk_size, 2):
+                highfrequency.CHUNK_SIZE = size
+                Delta(f1, f2, self.tmp_dir).compare()
+                for filename, records in (('delta_increase.txt', up),
+                                          ('delta_decrease.txt', down)):
+                    with open(os.path.join(self.tmp_dir,
+                                           filename)) as filehandle:
+                        self.assertEqual(filehandle.read(), ''.join(
+                            ['%s\t%f\t%f\t%f\n' % n for n in records]))
+        finally:
+            highfrequency.CHUNK_SIZE = chunk_size
+        # Ties (ratio 2) are in the order of the second list
+        self.assertEqual([n[0] for n in up], ['omega', 'gamma', 'beta',
+                                              'eta', 'delta'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,6 @@
 import os
+import shutil
+import tempfile
 import unittest
 from lex.entryiterator import EntryIterator
 
@@ -132,6 +134,449 @@ class TestOed(unittest.TestCase):
                           len(entry.sensesect_senses()))
             self.assertEqual(len(entry.senses()), sum_senses, _msg(entry))
 
+    def test_skeleton(self):
+        """
+        Test that year lists, ancestors, quotations, and senses taken
+        from the entry skeleton match those computed directly from
+        the tree
+        """
+        from lex.oed.sense import Sense
+        for id, entry in self.entries.items():
+            for sense in entry.senses():
+                unindexed = Sense(sense.node, entry.lemma_manager(), entry.id)
+                self.assertIsNone(unindexed.skeleton())
+                self.assertEqual(sense.thinned_year_list(),
+                                 unindexed.thinned_year_list(), _msg(entry))
+                self.assertEqual(sense.ancestors(), unindexed.ancestors(),
+                                 _msg(entry))
+                self.assertEqual([q.node for q in sense.quotations()],
+                                 [q.node for q in unindexed.quotations()],
+                                 _msg(entry))
+            for component in [entry] + entry.s1blocks():
+                self.assertEqual([s.node for s in component.senses()],
+                                 component.node.xpath(
+                                     './/*[@senseUnit="true"]'),
+                                 _msg(entry))
+                self.assertEqual([q.node for q in
+                                  component.quotation_paragraphs()],
+                                 component.node.findall('.//qp'),
+                                 _msg(entry))
+
+
+class TestEntryIteratorParallel(unittest.TestCase):
+
+    """
+    Unit tests for EntryIterator.parallel_map()
+    """
+
+    def _iterator(self, **kwargs):
+        return EntryIterator(path=FIXTURE_DIR,
+                             dictType='oed',
+                             verbosity=None,
+                             fixLigatures=True,
+                             **kwargs)
+
+    def test_order(self):
+        """
+        Test that parallel_map() yields results in iterate() order,
+        even when files are split into several shards
+        """
+        serial = [_entry_label(e) for e in self._iterator().iterate()]
+        parallel = list(self._iterator().parallel_map(_entry_label,
+                                                      processes=2,
+                                                      shard_size=100000))
+        self.assertEqual(serial, parallel)
+
+    def test_sample(self):
+        """
+        Test that deterministic sampling picks the same entries
+        in parallel mode
+        """
+        serial = [_entry_label(e) for e in
+                  self._iterator(sample=7).iterate()]
+        parallel = list(self._iterator(sample=7).parallel_map(
+            _entry_label, processes=2, shard_size=100000))
+        self.assertEqual(serial, parallel)
+
+
+class TestLiteEntry(unittest.TestCase):
+
+    """
+    Unit tests for lex.oed.liteentry
+    """
+
+    def test_fields(self):
+        """
+        Test that lite entries give the same values as full entries
+        for the lite fields, without parsing the full entry
+        """
+        full = EntryIterator(path=FIXTURE_DIR).iterate()
+        lite = EntryIterator(path=FIXTURE_DIR, lite=True).iterate()
+        for entry, lite_entry in zip(full, lite):
+            self.assertEqual(_lite_fields(entry), _lite_fields(lite_entry))
+            self.assertFalse(lite_entry.is_materialized())
+
+    def test_fallback(self):
+        """
+        Test that anything else falls back to the full entry
+        """
+        full = list(EntryIterator(path=FIXTURE_DIR).iterate())
+        lite = list(EntryIterator(path=FIXTURE_DIR, lite=True).iterate())
+        self.assertEqual(len(full[3].senses()), len(lite[3].senses()))
+        self.assertEqual(full[3].serialized(), lite[3].serialized())
+        self.assertTrue(lite[3].is_materialized())
+
+        # Lite fields now reflect changes made to the full entry
+        lite[3].full_entry().is_revised = not full[3].is_revised
+        self.assertEqual(lite[3].is_revised, not full[3].is_revised)
+
+
+class TestEntryStore(unittest.TestCase):
+
+    """
+    Unit tests for lex.entrystore
+    """
+
+    def setUp(self):
+        from lex.entrystore import EntryStoreCompiler
+        self.out_dir = tempfile.mkdtemp()
+        EntryStoreCompiler(path=FIXTURE_DIR, out_dir=self.out_dir).compile()
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    def test_iterate(self):
+        """
+        Test that iterating over entry stores yields the same entries
+        as iterating over the original text files
+        """
+        original = [_entry_label(e) for e in
+                    EntryIterator(path=FIXTURE_DIR).iterate()]
+        stored = [_entry_label(e) for e in
+                  EntryIterator(path=self.out_dir,
+                                source_format='store').iterate()]
+        self.assertEqual(original, stored)
+
+    def test_invalid(self):
+        """
+        Test that opening an invalid or truncated store raises
+        ValueError, and closes the file
+        """
+        import builtins
+        from unittest import mock
+        from lex.entrystore import EntryStore
+        store_file = os.path.join(self.out_dir, os.listdir(self.out_dir)[0])
+        with open(store_file, 'rb') as filehandle:
+            data = filehandle.read()
+        bad_file = os.path.join(self.out_dir, 'bad.store')
+        handles = []
+
+        def _open(*args, **kwargs):
+            handles.append(builtins.open(*args, **kwargs))
+            return handles[-1]
+
+        for bad_data in (b'X' + data[1:], data[:-1]):
+            with open(bad_file, 'wb') as filehandle:
+                filehandle.write(bad_data)
+            with mock.patch('lex.entrystore.open', _open, create=True):
+                self.assertRaises(ValueError, EntryStore, bad_file)
+            self.assertTrue(handles[-1].closed)
+
+    def test_lookup(self):
+        """
+        Test EntryStore.get() and EntryStore.find()
+        """
+        from lex.entrystore import EntryStore
+        store = EntryStore(os.path.join(self.out_dir, 'oedtestdata.store'))
+        entry = store.get(100457)
+        self.assertEqual(entry.label(), 'jabber, v.')
+        self.assertIsNone(store.get(1))
+        self.assertEqual([e.label() for e in store.find('jabber')],
+                         ['jabber, n.', 'jabber, v.'])
+        store.close()
+
+
+class TestEntryIndex(unittest.TestCase):
+
+    """
+    Unit tests for lex.oed.entryindex
+    """
+
+    def setUp(self):
+        from lex.oed.entryindex import EntryIndexBuilder
+        self.out_dir = tempfile.mkdtemp()
+        self.index_file = os.path.join(self.out_dir, 'index.csv')
+        EntryIndexBuilder(path=FIXTURE_DIR, index_file=self.index_file).build()
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    def test_lookup(self):
+        """
+        Test that every entry can be retrieved by ID and by headword
+        """
+        from lex.oed.entryindex import EntryIndex
+        index = EntryIndex(self.index_file)
+        for entry in EntryIterator(path=FIXTURE_DIR).iterate():
+            self.assertEqual(index.get(entry.id).serialized(),
+                             entry.serialized())
+            self.assertIn(entry.id, [e.id for e in
+                                     index.find(entry.headword)])
+        self.assertEqual([e.label() for e in
+                          index.find('jabber', wordclass='VB')],
+                         ['jabber, v.'])
+        index.close()
+
+
+class TestKeywordFinder(unittest.TestCase):
+
+    """
+    Unit tests for lex.oed.quotation.keywordfinder
+    """
+
+    def test_find_keyword(self):
+        """
+        Test KeywordFinder.find_keyword() and the heuristic recorded
+        for each match
+        """
+        from lex.oed.quotation.keywordfinder import KeywordFinder, HEURISTICS
+        finder = KeywordFinder()
+        heuristics = set()
+        for entry in EntryIterator(path=FIXTURE_DIR).iterate():
+            if int(entry.id) != 100485:
+                continue
+            finder.ingest_entry(entry)
+            for sense in entry.senses():
+                finder.ingest_sense(sense)
+                for quotation in sense.quotations():
+                    keyword = finder.find_keyword(quotation)
+                    if keyword:
+                        self.assertIn(finder.last_heuristic, HEURISTICS)
+                        heuristics.add(finder.last_heuristic)
+                    else:
+                        self.assertIsNone(finder.last_heuristic)
+        self.assertTrue({'literal', 'fuzzy', 'variants', 'fallback'}
+                        <= heuristics)
+
+
+class TestTokenizedText(unittest.TestCase):
+
+    """
+    Unit tests for lex.oed.quotation.tokenizedtext
+    """
+
+    def test_ngrams(self):
+        """
+        Test that tokens and ngrams match those built by splitting
+        and joining the text
+        """
+        from lex.oed.quotation.tokenizedtext import TokenizedText
+        text = "He  jabbered (in the King's  hearing), and  went -- away."
+        tokenized = TokenizedText(text)
+        naive_tokens = text.split()
+        self.assertEqual([t for t, _ in tokenized.tokens(strip='(),.')],
+                         [t.strip('(),.') for t in naive_tokens])
+        ngrams = tokenized.ngrams((2, 3), strip='(),.- ', possessive=True,
+                                  exclude='()')
+        expected = []
+        for length in (2, 3):
+            for i in range(len(naive_tokens)):
+                ngram = ' '.join(naive_tokens[i:i + length])
+                ngram = ngram.strip('(),.- ')
+                if ngram.endswith("'s"):
+                    ngram = ngram[:-2]
+                if not '(' in ngram and not ')' in ngram:
+                    expected.append(ngram)
+        self.assertEqual([n for n, _ in ngrams], expected)
+        self.assertEqual(ngrams[0], ('He jabbered', 'hejabbered'))
+        self.assertIs(ngrams, tokenized.ngrams((2, 3), strip='(),.- ',
+                                               possessive=True,
+                                               exclude='()'))
+
+    def test_source_span(self):
+        """
+        Test that token and ngram offsets map back onto the source text
+        """
+        from lex.oed.quotation.tokenizedtext import TokenizedText
+        text = " A laughing\n jackass,  jack.  "
+        tokens = TokenizedText(text).tokens(strip=',.')
+        self.assertEqual([text[slice(*tokens.source_span(i))]
+                          for i in range(len(tokens))],
+                         ['A', 'laughing', 'jackass', 'jack'])
+        ngrams = TokenizedText(text).ngrams((2,), strip=',. ')
+        self.assertEqual(ngrams.source_span(1), (3, 20))
+
+
+def _has_punkt():
+    """
+    Return True if NLTK's Punkt sentence tokenizer data (needed by
+    stringtools.tokens()) is installed.
+    """
+    import nltk
+    try:
+        nltk.data.find('tokenizers/punkt_tab')
+    except LookupError:
+        return False
+    return True
+
+
+@unittest.skipUnless(_has_punkt(), "NLTK's punkt_tab data is not installed")
+class TestQuotationText(unittest.TestCase):
+
+    """
+    Unit tests for lex.oed.quotation.quotationtext
+    """
+
+    def test_tokens(self):
+        """
+        Test that tokens are split as by NLTK's word tokenizer, and
+        are recomputed when the node is replaced
+        """
+        from lxml import etree
+        from lex.oed.quotation.quotationtext import QuotationText
+        node = etree.fromstring('<qt>The <i>Pinus sylvestris</i>, or '
+                                'Scotch fir—a well-grown tree '
+                                '<cm>[sic]</cm>. It\'s ‘tall’. '
+                                'Mr. Smith can\'t see it.</qt>')
+        text = QuotationText(node, 1850)
+        self.assertEqual(text.tokens, ['The', 'Pinus', 'sylvestris', ',',
+                                       'or', 'Scotch', 'fir', '—', 'a',
+                                       'well-grown', 'tree', '.', 'It', "'s",
+                                       '‘', 'tall', '’', '.',
+                                       'Mr.', 'Smith', 'ca', "n't", 'see',
+                                       'it', '.'])
+        self.assertEqual(text.keyword_index(lemma='fir'), (6, 6))
+        self.assertEqual(text.binomials(), ['Pinus sylvestris'])
+
+        text.node = etree.fromstring('<qt>A tall <kw>fir</kw></qt>')
+        self.assertEqual(text.comment_stripped_text(), 'A tall fir')
+        self.assertEqual(text.tokens, ['A', 'tall', 'fir'])
+        self.assertEqual(text.keyword, 'fir')
+        self.assertEqual(text.keyword_index(), (2, 2))
+
+    def test_abbreviations(self):
+        """
+        Test that abbreviations are not split from their full stops
+        (as by nltk.sent_tokenize()), so keyword positions and
+        collocates are unaffected
+        """
+        from lxml import etree
+        from lex.oed.quotation.quotationtext import QuotationText
+        node = etree.fromstring('<qt>Prof. Huxley saw the fir. '
+                                'Gen. Gordon felled it.</qt>')
+        text = QuotationText(node, 1880)
+        self.assertEqual(text.tokens, ['Prof.', 'Huxley', 'saw', 'the',
+                                       'fir', '.', 'Gen.', 'Gordon',
+                                       'felled', 'it', '.'])
+        self.assertEqual(text.keyword_index(lemma='fir'), (4, 4))
+        collocates = [stem for stem, _ in text.ranked_collocates('fir')]
+        self.assertNotIn('prof', collocates)
+        self.assertNotIn('gen', collocates)
+
+    def test_fixture_quotations(self):
+        """
+        Test keyword positions and ranked collocates for fixture
+        quotations with possessives, contractions, and quotation marks
+        (as given by the original nltk.word_tokenize() version)
+        """
+        expected = {
+            '40537001': ('jabbers', None,
+                         [('can', 10), ('you', 10), ('hit', 10),
+                          ('that', 10), ('man', 10), ('the', 10),
+                          ('gunner', 10), ('repli', 10), ('be', 10),
+                          ('japer', 10), ('i', 10), ('ate', 10),
+                          ('what', 10), ('left', 10), ('of', 10),
+                          ('him', 10)]),
+            '40542168': ('jack-roller', (1, 2),
+                         [('asleep', 22), ('or', 21), ('drunk', 20),
+                          ('is', 19), ('he', 18), ('while', 17),
+                          ('him', 16), ('rob', 15), ('to', 14),
+                          ('crowd', 13), ('in', 11), ('jack', 10),
+                          ('roll', 10), ('pocket', 10), ('man', 8),
+                          ('a', 7), ('pick', 6), ('from', 5), ('anyth', 4),
+                          ('be', 3), ('may', 2)]),
+            '40543837': ("Jack's alive", (4, 6),
+                         [('jack', 10), ('aliv', 10), ('he', 4),
+                          ('field', 4), ('gave', 3), ('the', 3), ('her', 2),
+                          ('round', 2)]),
+        }
+        found = {}
+        for entry in EntryIterator(path=FIXTURE_DIR,
+                                   fixLigatures=True).iterate():
+            for sense in entry.senses():
+                for quotation in sense.quotations():
+                    if quotation.node.get('eid') in expected:
+                        text = quotation.text
+                        found[quotation.node.get('eid')] = (
+                            sense.lemma, text.keyword_index(lemma=sense.lemma),
+                            text.ranked_collocates(sense.lemma))
+        self.assertEqual(found, expected)
+
+
+class TestKeywordPipeline(unittest.TestCase):
+
+    """
+    Unit tests for lex.oed.quotation.keywordpipeline
+    """
+
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp()
+        self.out_file = os.path.join(self.out_dir, 'keywords.tsv')
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    def test_run(self):
+        """
+        Test that the pipeline writes a row for each keyword found,
+        and that resuming from the checkpoint discards partial output
+        """
+        from lex.oed.quotation.keywordpipeline import KeywordPipeline
+        pipeline = KeywordPipeline(path=FIXTURE_DIR, out_file=self.out_file,
+                                   processes=2, shard_size=500000)
+        pipeline.run()
+        stats = pipeline.stats()
+        with open(self.out_file) as filehandle:
+            output = filehandle.read()
+        self.assertEqual(len(output.splitlines()), stats['keywords'])
+        self.assertEqual(output.splitlines()[0].split('\t')[:3],
+                         ['100452', '40535499', '40535515'])
+
+        # The offsets of each keyword should locate it in the quotation
+        #  text (as whitespace-tokenized by KeywordFinder), and not
+        #  inside another word
+        texts = {}
+        for entry in EntryIterator(path=FIXTURE_DIR,
+                                   fix_ligatures=True).iterate():
+            for quotation in entry.quotations():
+                texts[quotation.node_id()] = \
+                    ' ' + quotation.text.tokenized.source + ' '
+        for line in output.splitlines():
+            _, _, quotation_id, keyword, start, end = line.split('\t')
+            text = texts[quotation_id]
+            start, end = int(start) + 1, int(end) + 1
+            self.assertEqual(' '.join(text[start:end].split()), keyword)
+            self.assertFalse(text[start - 1].isalnum())
+            self.assertFalse(text[end].isalnum())
+
+        with open(self.out_file, 'a') as filehandle:
+            filehandle.write('partial\n')
+        resumed = KeywordPipeline(path=FIXTURE_DIR, out_file=self.out_file)
+        resumed.run()
+        self.assertEqual(resumed.stats()['heuristics'], stats['heuristics'])
+        with open(self.out_file) as filehandle:
+            self.assertEqual(filehandle.read(), output)
+
+
+def _entry_label(entry):
+    return entry.id, entry.label()
+
+
+def _lite_fields(entry):
+    return (entry.id, entry.label(), entry.headword, entry.is_revised,
+            entry.date().start, entry.date().end, entry.is_marked_obsolete(),
+            [w.penn for w in entry.wordclasses()], entry.first_published())
+
 
 def _msg(entry):
     return '%s -- %s' % (entry.id, entry.label())
@@ -0,0 +1,293 @@
+import os
+import unittest
+
+# The thesaurus database is configured from the environment when
+#  thesaurusdbconfig is first imported (see setUpModule())
+DB_URL = 'sqlite://'
+_saved_db_url = None
+
+
+def setUpModule():
+    global _saved_db_url
+    _saved_db_url = os.environ.get('HTOED_DB_URL')
+    os.environ['HTOED_DB_URL'] = DB_URL
+
+
+def tearDownModule():
+    if _saved_db_url is None:
+        os.environ.pop('HTOED_DB_URL', None)
+    else:
+        os.environ['HTOED_DB_URL'] = _saved_db_url
+
+
+class TestTaxonomyIndex(unittest.TestCase):
+
+    """
+    Unit tests for lex.oed.thesaurus.dbbackend.taxonomyindex
+    """
+
+    def setUp(self):
+        import random
+        from lex.oed.thesaurus.dbbackend.taxonomyindex import TaxonomyIndex
+        # Random forest of two trees (roots 1 and 2); parent IDs are
+        #  always lower than child IDs
+        rng = random.Random(7)
+        self.parents = {1: None, 2: None}
+        for class_id in range(3, 400):
+            self.parents[class_id] = rng.randint(max(1, class_id - 20),
+                                                 class_id - 1)
+        self.index = TaxonomyIndex([(class_id, parent_id, class_id)
+                                    for class_id, parent_id
+                                    in self.parents.items()])
+
+    def _ancestors(self, class_id):
+        ancestors = []
+        while class_id is not None:
+            ancestors.append(class_id)
+            class_id = self.parents[class_id]
+        return ancestors
+
+    def test_index(self):
+        """
+        Test ancestors, descendants, levels, and lowest common ancestors
+        against those found by walking up the tree
+        """
+        for class_id in range(1, 400, 7):
+            ancestors = self._ancestors(class_id)
+            self.assertEqual(self.index.ancestor_ids(class_id), ancestors)
+            self.assertEqual(self.index.level(class_id), len(ancestors))
+            self.assertEqual(sorted(self.index.descendant_ids(class_id)),
+                             [c for c in self.parents if c != class_id and
+                              class_id in self._ancestors(c)])
+            for other in range(1, 400, 11):
+                self.assertEqual(self.index.is_descendant(class_id, other),
+                                 other in ancestors)
+                other_ancestors = set(self._ancestors(other))
+                expected = next((a for a in ancestors
+                                 if a in other_ancestors), None)
+                self.assertEqual(
+                    self.index.lowest_common_ancestor(class_id, other),
+                    expected)
+
+    def test_remove_redundant(self):
+        """
+        Test that duplicates and descendants of other classes in the
+        list are removed, preserving order
+        """
+        from lex.oed.thesaurus.dbbackend.taxonomyindex import TaxonomyIndex
+        #  1      8
+        #  +-2    +-9
+        #  | +-4
+        #  | | +-7
+        #  | +-5
+        #  +-3
+        #    +-6
+        index = TaxonomyIndex([(1, None), (2, 1), (3, 1), (4, 2), (5, 2),
+                               (6, 3), (7, 4), (8, None), (9, 8)])
+        # IDs not in the index (99) are kept
+        self.assertEqual(index.remove_redundant([7, 99, 5, 2, 6, 7, 8, 9,
+                                                 3, 4]),
+                         [99, 2, 8, 3])
+        self.assertEqual(index.remove_redundant([5, 4, 9, 6]), [5, 4, 9, 6])
+        self.assertEqual(index.remove_redundant([6, 3, 1, 9]), [1, 9])
+
+    def test_best_fit(self):
+        """
+        Test that best_fit() gives the same result as checking every
+        combination
+        """
+        import itertools
+        import random
+        from lex.oed.thesaurus.dbbackend.taxonomyindex import TaxonomyIndex
+        # Branch size = number of classes in the branch
+        index = TaxonomyIndex([(class_id, parent_id,
+                                len(self.index.descendant_ids(class_id)) + 1)
+                               for class_id, parent_id
+                               in self.parents.items()])
+        rng = random.Random(11)
+        for _ in range(40):
+            class_id_sets = [rng.sample(range(1, 400), rng.randint(1, 4))
+                             for _ in range(rng.randint(1, 5))]
+            # Exhaustive search, as in the original queryengine.best_fit()
+            possibles = []
+            for combination in itertools.product(
+                    *[range(len(s)) for s in class_id_sets]):
+                ancestor_id = index.lowest_common_ancestor(
+                    *[s[i] for s, i in zip(class_id_sets, combination)])
+                if ancestor_id is not None:
+                    possibles.append((ancestor_id, combination))
+            possibles.sort(key=lambda p: index.branch_size(p[0]))
+            expected = possibles[0] if possibles else (None, None)
+            self.assertEqual(index.best_fit(class_id_sets), expected)
+
+
+class TestThesaurusDB(unittest.TestCase):
+
+    """
+    Unit tests for lex.oed.thesaurus.dbbackend, run against an
+    in-memory SQLite database
+    """
+
+    # (ID, label, wordclass) for each class on the path from the root
+    classes = (
+        ((1, 'the world', None),),
+        ((1, 'the world', None), (2, 'animal', None)),
+        ((1, 'the world', None), (2, 'animal', None), (3, 'animal', 'noun')),
+        ((1, 'the world', None), (2, 'animal', None), (3, 'animal', 'noun'),
+         (4, 'dog', 'noun')),
+        ((1, 'the world', None), (2, 'animal', None),
+         (5, 'animal', 'adjective')),
+        ((1, 'the world', None), (6, 'action', None)),
+        ((1, 'the world', None), (6, 'action', None), (7, 'movement', 'verb')),
+        ((1, 'the world', None), (6, 'action', None), (7, 'movement', 'verb'),
+         (8, 'run', 'verb')),
+    )
+    # lemma, wordclass, refentry, refid, refid_alt, size, entry_size,
+    #  chronorder, class ID
+    instances = (
+        ('dog', 'NN', 100, 101, None, 10, 50, 1, 4),
+        ('dog', 'NN', 100, 102, ',101,', 0, 50, 2, 3),
+        ('dog', 'NN', 100, 103, None, 3, 50, 3, None),
+        ('dog', 'NN', 100, 105, None, 3, 50, 4, 7),
+        ('dog', 'JJ', 100, 104, None, 2, 50, 5, 5),
+        ('dog', 'VB', 110, 111, None, 4, 5, 1, 8),
+        ('run', 'VB', 200, 201, None, 20, 30, 1, 8),
+        ('run', 'NN', 200, 202, ',201,', 2, 30, 2, 4),
+        ('run about', 'NN', 210, 211, None, 1, 2, 1, 2),
+        ('kick', 'PHR', 300, 301, None, 1, 10, 1, 7),
+        ('kick', 'PHR', 300, 302, ',301,', 0, 10, 2, None),
+        ('kick', 'NN', 300, 303, None, 1, 10, 3, 4),
+    )
+
+    def setUp(self):
+        from lxml import etree
+        from lex.oed.thesaurus.thesaurusclass import ThesaurusClass
+        from lex.oed.thesaurus.dbbackend import thesaurusdbconfig
+        # Fails if thesaurusdbconfig was imported (and so configured
+        #  from the environment) before setUpModule() ran
+        self.assertEqual(thesaurusdbconfig.DB_URL, DB_URL,
+                         'thesaurusdbconfig was imported before '
+                         'HTOED_DB_URL was set')
+        from lex.oed.thesaurus.dbbackend import populator, queryengine
+        from lex.oed.thesaurus.dbbackend.bulkloader import BulkLoader
+        from lex.oed.thesaurus.dbbackend.models import ThesClass, ThesInstance
+
+        self.class_rows = []
+        for path in self.classes:
+            node = etree.Element('class', id=str(path[-1][0]),
+                                 sortCode=str(path[-1][0]),
+                                 numInstancesDirect='1',
+                                 numInstancesDescendant=str(10 - len(path)))
+            fullpath = etree.SubElement(node, 'fullpath')
+            for class_id, label, wordclass in path:
+                ancestor = etree.SubElement(fullpath, 'node',
+                                            idref=str(class_id))
+                ancestor.text = label
+                if wordclass is not None:
+                    ancestor.set('pos', wordclass)
+            self.class_rows.append(populator._row(
+                ThesClass(ThesaurusClass(node))))
+
+        columns = ('lemma', 'wordclass', 'refentry', 'refid', 'refid_alt',
+                   'size', 'entry_size', 'chronorder', 'class_id')
+        self.instance_rows = []
+        for values in self.instances:
+            data = dict(zip(columns, values))
+            data.update(entry_node=data['refentry'] * 10,
+                        is_deprecated=False, start_year=1500,
+                        end_year=None, subentry_type=None)
+            self.instance_rows.append(populator._row(ThesInstance(data)))
+
+        self.loader = BulkLoader(engine=thesaurusdbconfig.ENGINE)
+        self.loader.load(ThesClass.__table__, self.class_rows)
+        self.loader.load(ThesInstance.__table__, self.instance_rows,
+                         exclude=('id',))
+        thesaurusdbconfig.SESSION.expunge_all()
+        queryengine.reset_taxonomy_index()
+        queryengine.CLASS_CACHE.clear()
+
+    def test_bulk_load(self):
+        """
+        Test that rows loaded by BulkLoader (via executemany) read back
+        with the same column values, that excluded IDs are assigned by
+        the database, and that indexes are built after loading
+        """
+        import sqlalchemy
+        from lex.oed.thesaurus.dbbackend import thesaurusdbconfig
+        from lex.oed.thesaurus.dbbackend.models import ThesClass, ThesInstance
+        session = thesaurusdbconfig.SESSION
+
+        stored = [{column.name: getattr(record, column.name)
+                   for column in ThesClass.__table__.columns}
+                  for record in session.query(ThesClass).order_by(
+                      ThesClass.id)]
+        self.assertEqual(stored, self.class_rows)
+        self.assertEqual(stored[3]['label'], 'dog')
+        self.assertEqual(stored[3]['wordclass'], 'noun')
+        self.assertEqual(stored[3]['parent_id'], 3)
+        self.assertEqual(stored[3]['level'], 4)
+
+        stored = [{column.name: getattr(record, column.name)
+                   for column in ThesInstance.__table__.columns}
+                  for record in session.query(ThesInstance).order_by(
+                      ThesInstance.id)]
+        self.assertTrue(all([row['id'] is None
+                             for row in self.instance_rows]))
+        self.assertEqual([row['id'] for row in stored],
+                         list(range(1, len(self.instances) + 1)))
+        for row in stored:
+            del row['id']
+        for row in self.instance_rows:
+            del row['id']
+        self.assertEqual(stored, self.instance_rows)
+        self.assertEqual(stored[8]['lemma'], 'runabout')
+        self.assertEqual(stored[1]['refid_alt'], ',101,')
+
+        inspector = sqlalchemy.inspect(thesaurusdbconfig.ENGINE)
+        indexes = {index['name'] for index
+                   in inspector.get_indexes('instance')}
+        self.assertEqual(indexes, {index.name for index
+                                   in ThesInstance.__table__.indexes})
+        self.assertEqual(len(indexes), 2)
+        self.assertEqual(self.loader.timings['instance']['rows'],
+                         len(self.instances))
+
+    def test_search_many(self):
+        """
+        Test that search_many() gives the same results as
+        ranked_search() for each lemma
+        """
+        from lex.oed.thesaurus.dbbackend import queryengine
+        lemmas = ['dog', 'run', 'run-about', 'kick', 'cat', 'dog']
+        for kwargs in ({}, {'wordclass': 'VB'}, {'wordclass': 'noun'},
+                       {'refid': 101}, {'refid': 201, 'exact_sense': True},
+                       {'current_only': True}, {'include_homographs': True},
+                       {'include_homographs': True, 'current_only': True,
+                        'refid': 301},
+                       {'refentry': 100}, {'branches': [2]},
+                       {'thes_linked': True, 'wordclass': 'NN'}):
+            batch = queryengine.search_many(lemmas, **kwargs)
+            self.assertEqual(set(batch.keys()), set(lemmas))
+            for lemma in lemmas:
+                expected = queryengine.ranked_search(lemma=lemma, **kwargs)
+                self.assertEqual([i.id for i in batch[lemma]],
+                                 [i.id for i in expected],
+                                 '%s %r' % (lemma, kwargs))
+
+        # No verb senses of 'kick', so falls back to phrases
+        batch = queryengine.search_many(['kick'], wordclass='VB')
+        self.assertEqual([i.refid for i in batch['kick']], [301, 302])
+        # 'dog' in class 7 (verb) is dropped for wordclass='NN'
+        batch = queryengine.search_many(['dog'], wordclass='NN')
+        self.assertEqual([i.refid for i in batch['dog']], [101, 103, 102])
+        batch = queryengine.search_many(['dog', 'kick'], refid=101,
+                                        include_homographs=True)
+        self.assertEqual([i.refid for i in batch['dog']], [101, 102])
+        self.assertEqual(batch['kick'], [])
+        batch = queryengine.search_many(['dog'], refid=101,
+                                        current_only=True)
+        self.assertEqual([i.refid for i in batch['dog']], [101])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,216 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+FIXTURE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestVariantsCache(unittest.TestCase):
+
+    """
+    Unit tests for lex.oed.variants.variantscache
+    """
+
+    xml = """<entries>
+<e vfsect="unrevised" id="19532"><hw>bite</hw>
+<s1 wordclass="VB" size="199" lexid="19489644">
+  <dateRange start="1000" end="2006" projected="2050"/>
+  <variants wordclass="VB"><vf start="1150" end="2050">bite</vf>
+  <vf start="1150" end="1499" regional="true">bayte</vf>
+  <vf start="1150" end="1199">byt</vf></variants>
+  <variants wordclass="VBD"><vf start="1600" end="2050">bit</vf></variants>
+</s1>
+<s1 wordclass="NN" size="20" lexid="19489645">
+  <dateRange start="1300" end="1800" projected="1800"/>
+  <variants wordclass="NN"><vf start="1300" end="1800">bite</vf></variants>
+</s1></e>
+</entries>"""
+
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.out_dir, 'b.xml'), 'w') as filehandle:
+            filehandle.write(self.xml)
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    def test_compiled(self):
+        """
+        Test that lookups in the compiled database give the same
+        variant sets as the XML documents
+        """
+        from lex.oed.variants.variantscache import (VariantsCache,
+                                                    VariantsCacheCompiler)
+        queries = ({'lemma': 'bite'}, {'id': '19532', 'wordclass': 'NN'},
+                   {'id': '19533'})
+        cache = VariantsCache(dir=self.out_dir)
+        self.assertIsNone(cache.connection())
+        # The missing database isn't checked for again until it changes
+        with mock.patch.object(VariantsCacheCompiler, 'is_stale',
+                               side_effect=AssertionError) as is_stale:
+            self.assertIsNone(cache.connection())
+        self.assertEqual(is_stale.call_count, 0)
+        from_xml = [_varsets(cache.find_all(**q)) for q in queries]
+        VariantsCache.cache = None
+
+        # Compile the database as if in another process (i.e. without
+        #  clearing this process's connections), and check that it's
+        #  picked up by the existing cache
+        other_db = os.path.join(self.out_dir, 'other.sqlite')
+        VariantsCacheCompiler(dir=self.out_dir, db_file=other_db).compile()
+        shutil.copy(other_db, cache.db_file)
+        self.assertIsNotNone(cache.connection())
+        self.assertEqual([_varsets(cache.find_all(**q)) for q in queries],
+                         from_xml)
+        self.assertEqual(cache.find(lemma='bite').lexid, '19489644')
+        self.assertEqual(len(from_xml[0][0][-1]['VB']), 2)
+
+
+class TestVariantsLister(unittest.TestCase):
+
+    """
+    Unit tests for lex.oed.variants.variantslister
+    """
+
+    def setUp(self):
+        self.in_dir = tempfile.mkdtemp()
+        self.out_dirs = [tempfile.mkdtemp(), tempfile.mkdtemp()]
+        shutil.copy(os.path.join(FIXTURE_DIR, 'oedtestdata.xml'),
+                    self.in_dir)
+
+    def tearDown(self):
+        for directory in [self.in_dir] + self.out_dirs:
+            shutil.rmtree(directory)
+
+    def test_update(self):
+        """
+        Test that update_variants() only recomputes changed entries,
+        and gives the same output as a full rebuild
+        """
+        from lex.oed.variants.variantslister import VariantsLister
+        from lex.oed.variants.variantscache import VariantsCacheCompiler
+        lister = VariantsLister(in_dir=self.in_dir, out_dir=self.out_dirs[0])
+        compiler = VariantsCacheCompiler(dir=self.out_dirs[0])
+        self.assertEqual(lister.update_variants(processes=2), 76)
+        checksums = compiler.manifest_checksums()
+        self.assertEqual(lister.update_variants(processes=2), 0)
+        self.assertEqual(compiler.manifest_checksums(), checksums)
+
+        filepath = os.path.join(self.in_dir, 'oedtestdata.xml')
+        with open(filepath) as filehandle:
+            text = filehandle.read()
+        with open(filepath, 'w') as filehandle:
+            filehandle.write(text.replace('>iaber</vf>', '>iabber</vf>'))
+        self.assertEqual(lister.update_variants(processes=2), 1)
+        # Checksums are re-read once the manifest has been rewritten
+        self.assertEqual(compiler.manifest_checksums(),
+                         {shard['file']: shard['sha1']
+                          for shard in lister.shards})
+        self.assertNotEqual(compiler.manifest_checksums(), checksums)
+
+        VariantsLister(in_dir=self.in_dir,
+                       out_dir=self.out_dirs[1]).list_variants()
+        outputs = []
+        for directory in self.out_dirs:
+            with open(os.path.join(directory, '0001.xml')) as filehandle:
+                outputs.append(filehandle.read())
+        self.assertIn('iabber', outputs[0])
+        self.assertEqual(outputs[0], outputs[1])
+
+    def test_update_split(self):
+        """
+        Test that update_variants() adds new entries to the document
+        of the preceding entry, and splits it up (as list_variants()
+        would) once it's grown past twice FILE_SIZE
+        """
+        from lex.oed.variants import variantslister
+        filepath = os.path.join(self.in_dir, 'oedtestdata.xml')
+        with open(filepath) as filehandle:
+            text = filehandle.read()
+        # Start from a version of the input with only the first entry
+        header, first, rest = text.split('\n<Entry ', 2)
+        with open(filepath, 'w') as filehandle:
+            filehandle.write(header + '\n<Entry ' + first + '\n</Dictionary>')
+
+        file_size = variantslister.FILE_SIZE
+        variantslister.FILE_SIZE = 100
+        try:
+            updated = variantslister.VariantsLister(in_dir=self.in_dir,
+                                                    out_dir=self.out_dirs[0])
+            updated.update_variants(processes=2)
+            with open(filepath, 'w') as filehandle:
+                filehandle.write(text)
+            self.assertEqual(updated.update_variants(processes=2), 75)
+            rebuilt = variantslister.VariantsLister(in_dir=self.in_dir,
+                                                    out_dir=self.out_dirs[1])
+            rebuilt.list_variants()
+        finally:
+            variantslister.FILE_SIZE = file_size
+
+        self.assertGreater(len(rebuilt.shards), 2)
+        self.assertEqual([shard['entries'] for shard in updated.shards],
+                         [shard['entries'] for shard in rebuilt.shards])
+        filenames = [shard['file'] for shard in updated.shards]
+        self.assertEqual(filenames[:2], ['0001.xml', '0001_5.xml'])
+        self.assertEqual(sorted(os.listdir(self.out_dirs[0])),
+                         sorted(filenames + ['manifest.json']))
+
+    def test_update_insert(self):
+        """
+        Test that entries inserted in the middle of the sequence go
+        into the document of the preceding entry, keeping documents
+        in order, and that no other document is rewritten
+        """
+        from lex.oed.variants import variantslister
+        filepath = os.path.join(self.in_dir, 'oedtestdata.xml')
+        with open(filepath) as filehandle:
+            text = filehandle.read()
+        header, *entries = text.split('\n<Entry ')
+        with open(filepath, 'w') as filehandle:
+            filehandle.write('\n<Entry '.join([header] + entries[:30] +
+                                              entries[56:]))
+
+        file_size = variantslister.FILE_SIZE
+        variantslister.FILE_SIZE = 100
+        try:
+            lister = variantslister.VariantsLister(in_dir=self.in_dir,
+                                                   out_dir=self.out_dirs[0])
+            lister.update_variants(processes=2)
+            old_shards = lister.shards
+            with open(filepath, 'w') as filehandle:
+                filehandle.write(text)
+            self.assertEqual(lister.update_variants(processes=2), 26)
+            rebuilt = variantslister.VariantsLister(in_dir=self.in_dir,
+                                                    out_dir=self.out_dirs[1])
+            rebuilt.list_variants()
+        finally:
+            variantslister.FILE_SIZE = file_size
+
+        filenames = [shard['file'] for shard in lister.shards]
+        self.assertEqual(sorted(os.listdir(self.out_dirs[0])),
+                         sorted(filenames + ['manifest.json']))
+        self.assertEqual([e for shard in lister.shards
+                          for e in shard['entries']],
+                         [e for shard in rebuilt.shards
+                          for e in shard['entries']])
+        # The first document (holding the preceding entry) has been
+        #  split up; the documents following it are untouched
+        self.assertEqual(filenames[:4], ['0001.xml', '0001_5.xml',
+                                         '0001_7.xml', '0001_8.xml'])
+        self.assertEqual(lister.shards[4:], old_shards[1:])
+
+
+def _varsets(varsets):
+    return [(vs.entry_id, vs.lexid, vs.lemma, vs.wordclass,
+             vs.num_quotations, vs.date.start, vs.date.end,
+             vs.date.projected_end(), vs.revised_status,
+             {wordclass: [(vf.form, vf.date.start, vf.date.end, vf.regional)
+                          for vf in vf_list]
+              for wordclass, vf_list in vs.variants.items()})
+            for vs in varsets]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,168 @@
+import unittest
+
+import numpy
+
+from lex.frequencytable import (FrequencyTable, FrequencyMatrix,
+                                PeriodLayout, VALID_YEARS,
+                                MOVING_AVERAGE_WINDOWSIZE, log_bands,
+                                _log_band, _parse_label)
+
+DECADES = ['%d-%s' % (year, str(year + 9)[2:]) for year in VALID_YEARS]
+# Tables with different period layouts: decades, coarse periods (with
+#  a period missing), a table with only a 'modern' value, and a table
+#  with an unparseable label
+TABLE_VALUES = [
+    dict([(label, float(max(i - 4, 0) * 1.5)) for i, label in
+          enumerate(DECADES)] + [('modern', 30.0)]),
+    {'1750-1799': 0.0, '1800-1899': 0.4, '1950-': 12.0, 'modern': 9.0},
+    {'modern': 0.07},
+    {'1800-09': 0.0, '1850-59': 2.0, '1990-99': 900.0, 'undated': 5.0,
+     'modern': 1500.0},
+]
+
+
+def scalar_interpolation(table):
+    # As the original _calculate_interpolation()
+    xpoints = list()
+    ypoints = list()
+    for start, end in [_parse_label(label) for label in
+                       sorted(table.data.keys()) if label != 'modern']:
+        midpoint = int(numpy.mean((start, end,)))
+        xpoints.append(midpoint)
+        ypoints.append(table.frequency(year=midpoint))
+    first_nonzero_year = None
+    for year, frequency in zip(xpoints, ypoints):
+        if frequency > 0.0000001:
+            first_nonzero_year = year
+            break
+    if (first_nonzero_year is not None and
+            first_nonzero_year > xpoints[0]):
+        zeroes = [(y, 0) for y in
+                  range(xpoints[0], first_nonzero_year, 10)]
+        nonzeroes = [(y, f) for y, f in zip(xpoints, ypoints)
+                     if y >= first_nonzero_year]
+        xpoints = [d[0] for d in zeroes] + [d[0] for d in nonzeroes]
+        ypoints = [d[1] for d in zeroes] + [d[1] for d in nonzeroes]
+    return list(numpy.interp(VALID_YEARS, xpoints, ypoints))
+
+
+def scalar_moving_average(interpolated):
+    # As the original _calculate_moving_average()
+    averaged = []
+    for i, (year, frequency) in enumerate(interpolated):
+        for block_end, windowsize in MOVING_AVERAGE_WINDOWSIZE:
+            if year < block_end:
+                break
+        span = windowsize // 2
+        window = interpolated[max(i - span, 0):
+                              min(i + span + 1, len(interpolated))]
+        if frequency == 0:
+            averaged.append(0)
+        else:
+            averaged.append(numpy.mean([f for y, f in window]))
+    return averaged
+
+
+class TestFrequencyTable(unittest.TestCase):
+
+    """
+    Unit tests for lex.frequencytable
+    """
+
+    def setUp(self):
+        self.tables = [FrequencyTable(data=values)
+                       for values in TABLE_VALUES]
+
+    def test_period_layout(self):
+        """
+        Test PeriodLayout.for_labels() caching and period() lookups
+        """
+        layout = PeriodLayout.for_labels(['1800-1899', 'modern', '1950-'])
+        self.assertIs(layout, PeriodLayout.for_labels(
+            ('1950-', '1800-1899', 'modern')))
+        self.assertEqual(layout.labels, ['1800-1899', '1950-'])
+        expected = {1799: None, 1800: '1800-1899', 1855: '1800-1899',
+                    1899: '1800-1899', 1900: None, 1949: None,
+                    1950: '1950-', 2007: '1950-', 2008: None}
+        for year, period in expected.items():
+            self.assertEqual(layout.period(year), period)
+        # Overlapping periods: the earliest-sorting label wins
+        layout = PeriodLayout.for_labels(['1990-99', '1990-2007'])
+        self.assertEqual(layout.period(1995), '1990-2007')
+        self.assertEqual(layout.period(2005), '1990-2007')
+        # No dated periods at all
+        layout = PeriodLayout.for_labels(['modern', 'undated'])
+        self.assertIsNone(layout.period(1850))
+
+    def test_log_bands(self):
+        """
+        Test log_bands() against _log_band()
+        """
+        frequencies = [0, -1, 0.000001, 0.0001, 0.00099, 0.001, 0.05, 0.1,
+                       0.99, 1, 5, 10, 99.9, 100, 999, 1000, 50000]
+        self.assertEqual(list(log_bands(frequencies)),
+                         [_log_band(f) for f in frequencies])
+        self.assertEqual(log_bands([[0.5, 0], [20, 3000]]).tolist(),
+                         [[_log_band(0.5), 8], [_log_band(20), 1]])
+
+    def test_interpolation(self):
+        """
+        Test interpolated values and moving averages against the
+        original scalar implementation
+        """
+        for table in self.tables[:2]:
+            expected = scalar_interpolation(table)
+            numpy.testing.assert_allclose(
+                [f for y, f in table.interpolated()], expected)
+            self.assertEqual([y for y, f in table.interpolated()],
+                             list(VALID_YEARS))
+            numpy.testing.assert_allclose(
+                [f for y, f in table.moving_average()],
+                scalar_moving_average(list(zip(VALID_YEARS, expected))))
+
+    def test_modern_only(self):
+        """
+        Test interpolation of tables with no dated periods
+        """
+        table = self.tables[2]
+        self.assertEqual([f for y, f in table.interpolated()],
+                         [0.07] * len(VALID_YEARS))
+        self.assertEqual(table.frequency(year=1855, interpolated=True), 0.07)
+        self.assertEqual(FrequencyTable(data={}).max_frequency(), 0)
+        matrix = FrequencyMatrix(self.tables[2:3])
+        self.assertEqual(list(matrix.frequencies(year=1900,
+                                                 interpolated=True)), [0.07])
+        self.assertEqual(list(matrix.frequencies()), [0.07])
+
+    def test_matrix(self):
+        """
+        Test FrequencyMatrix against the equivalent FrequencyTable
+        methods, for tables with mixed period layouts
+        """
+        matrix = FrequencyMatrix(self.tables)
+        for year in range(1740, 2021, 5):
+            self.assertEqual(list(matrix.frequencies(year=year)),
+                             [t.frequency(year=year) for t in self.tables])
+            numpy.testing.assert_allclose(
+                matrix.frequencies(year=year, interpolated=True),
+                [t.frequency(year=year, interpolated=True)
+                 for t in self.tables])
+            self.assertEqual(list(matrix.bands(year=year)),
+                             [t.band(year=year) for t in self.tables])
+        for period in ('modern', '1850-59', '1800-1899', '1950-',
+                       '1900-1949'):
+            numpy.testing.assert_allclose(
+                matrix.frequencies(period=period),
+                [t.frequency(period=period) for t in self.tables])
+        numpy.testing.assert_allclose(
+            matrix.delta(1800, 2000),
+            [t.delta(1800, 2000) or numpy.nan for t in self.tables])
+        summed = matrix.sum()
+        self.assertEqual(summed.frequencies(), FrequencyTable(
+            data={label: sum([t.data[label].frequency for t in self.tables
+                              if label in t.data])
+                  for label in matrix.labels}).frequencies())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+from lrucache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+
+    """
+    Unit tests for lrucache
+    """
+
+    def test_eviction(self):
+        """
+        Test that least-recently-used values are evicted first
+        """
+        cache = LRUCache(max_size=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.keys(), ['a', 'c'])
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_bytes(self):
+        """
+        Test that the cache stays within its memory budget
+        """
+        cache = LRUCache(max_bytes=10, sizeof=len)
+        for key in ('abcd', 'efgh', 'ijkl'):
+            cache.put(key, key)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.bytes, 8)
+        cache.put('x', 'x' * 11)
+        self.assertNotIn('x', cache)
+        self.assertIsNone(cache.get('abcd'))
+        self.assertEqual(cache.get('ijkl'), 'ijkl')
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+import stringtools
+from regexcompiler import ReplacementListCompiler
+from lex.inflections.inflection import INFLECTION_PATTERNS
+
+
+class TestReplacementListCompiler(unittest.TestCase):
+
+    """
+    Unit tests for regexcompiler.ReplacementListCompiler
+    """
+
+    words = ('apple', 'church', 'analysis', 'knife', 'mouse', 'carry',
+             'stop', 'refer', 'wolf', 'leaf', 'sheep', 'box', 'quiz',
+             'play', 'blue', 'star', 'woman', 'bureau', 'chylde', '',
+             "o'clock", 'X-ray', 'abc-', 'café')
+    numbers = ('1st', ' 2000 years', 'the 360 degree', '12-bore', '1890s',
+               'catch 22', '4x4', '10 Downing St.', '3000', '',
+               'no numbers')
+
+    def test_literals(self):
+        """
+        Test the literal prefilter for each regex
+        """
+        compiler = ReplacementListCompiler((
+            (r'([^0-9])10([^0-9])', r'\1ten\2'),
+            (r'(l|w|kn)ife$', r'\1ives'),
+            (r'(?:abc)+d', ''),
+            (r'x?yz', ''),
+            (r'[aeiou]', '#'),), fused=True)
+        self.assertEqual(compiler.literals, ['10', 'ife', 'abc', 'yz', None])
+        compiler = ReplacementListCompiler(((r'abc', ''),),
+                                           caseInsensitive=True, fused=True)
+        self.assertEqual(compiler.literals, [None])
+
+    def test_fused(self):
+        """
+        Test that the fused engine gives the same output as the
+        sequential engine, for edit() and edit_once()
+        """
+        tests = [(INFLECTION_PATTERNS[wordclass], self.words) for wordclass
+                 in ('NNS', 'NNSarchaic', 'VBD', 'VBG', 'VBZ', 'JJR')]
+        tests.append((stringtools.NUMBER_TRANSLATOR, self.numbers))
+        tests.append((stringtools.DIGIT_TRANSLATOR, self.numbers))
+        for fused, texts in tests:
+            self.assertIsNotNone(fused.fused_pattern)
+            unfused = ReplacementListCompiler(fused.uncompiled)
+            for text in texts:
+                self.assertEqual(fused.edit(text), unfused.edit(text))
+                self.assertEqual(fused.edit_once(text),
+                                 unfused.edit_once(text))
+            self.assertEqual(fused.edit_once(texts), unfused.edit_once(texts))
+
+    def test_unfusable(self):
+        """
+        Test that regexes with backreferences are not merged
+        """
+        compiler = ReplacementListCompiler((
+            (r'([bdfg])\1', r'\1'),
+            (r'e$', ''),), fused=True)
+        self.assertIsNone(compiler.fused_pattern)
+        self.assertEqual(compiler.edit_once('bubble'), 'buble')
+        self.assertEqual(compiler.edit_once('rule'), 'rul')
+
+
+if __name__ == "__main__":
+    unittest.main()
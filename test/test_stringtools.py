@@ -1,6 +1,10 @@
+import os
 import unittest
 import stringtools
 
+METAPHONE_FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  'metaphone_fixtures.txt')
+
 
 class TestStringtools(unittest.TestCase):
 
@@ -41,6 +45,32 @@ class TestStringtools(unittest.TestCase):
         for source, _, result in self.test_texts:
             self.assertEqual(stringtools.lexical_sort(source), result)
 
+    def test_lexical_sort_many(self):
+        """
+        Test stringtools.lexical_sort_many()
+        """
+        sources = [source for source, _, _ in self.test_texts]
+        sources.extend(['R&amp;D', '2000 years', '½-inch', 'Ȝok', 'ἀγάπη',
+                        'apple'])
+        results = [result for _, _, result in self.test_texts]
+        results.extend(['rd', 'twothousandyears', 'onetwoinch', 'gok',
+                        'agape', 'apple'])
+        self.assertEqual(stringtools.lexical_sort_many(sources), results)
+        self.assertEqual([stringtools.lexical_sort(s) for s in sources],
+                         results)
+
+    def test_metaphone(self):
+        """
+        Test stringtools.metaphone() and stringtools.metaphone_many()
+        against the outputs of the original (regex-based) implementation
+        """
+        with open(METAPHONE_FIXTURES) as filehandle:
+            fixtures = [line.rstrip('\n').split('\t') for line in filehandle]
+        for source, result in fixtures:
+            self.assertEqual(stringtools.metaphone(source), result, source)
+        self.assertEqual(stringtools.metaphone_many([s for s, _ in fixtures]),
+                         [r for _, r in fixtures])
+
     def test_prefix(self):
         """
         Test stringtools.prefix()